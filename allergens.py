@@ -0,0 +1,129 @@
+import re
+from products import normalise_text
+
+# Allergen groups: words a user may write for the allergy, and ingredient
+# words that contain it
+ALLERGEN_GROUPS = {
+    "peanut": (
+        ("peanut", "groundnut", "nut"),
+        ("peanut", "groundnut", "arachis"),
+    ),
+    "tree nut": (
+        ("nut", "tree nut", "almond", "cashew", "hazelnut", "walnut", "pistachio", "pecan"),
+        ("almond", "cashew", "hazelnut", "walnut", "pistachio", "pecan", "macadamia", "brazil nut",
+         "praline", "marzipan", "nut"),
+    ),
+    "milk": (
+        ("milk", "dairy", "lactose", "casein", "whey"),
+        ("milk", "cream", "butter", "buttermilk", "cheese", "whey", "casein", "caseinate", "lactose", "yoghurt",
+         "yogurt", "ghee", "curd", "paneer", "khoa"),
+    ),
+    "egg": (
+        ("egg",),
+        ("egg", "albumin", "albumen", "ovalbumin", "lysozyme"),
+    ),
+    "gluten": (
+        ("gluten", "wheat", "celiac", "coeliac"),
+        ("wheat", "gluten", "barley", "rye", "oat", "spelt", "semolina", "maida", "atta", "malt"),
+    ),
+    "soy": (
+        ("soy", "soya", "soybean"),
+        ("soy", "soya", "soybean", "tofu", "edamame"),
+    ),
+    "fish": (
+        ("fish",),
+        ("fish", "anchovy", "tuna", "salmon", "cod", "sardine"),
+    ),
+    "shellfish": (
+        ("shellfish", "crustacean", "shrimp", "prawn", "crab", "lobster", "mollusc"),
+        ("shrimp", "prawn", "crab", "lobster", "crustacean", "mussel", "oyster", "squid", "clam"),
+    ),
+    "sesame": (
+        ("sesame", "til"),
+        ("sesame", "tahini", "til"),
+    ),
+    "mustard": (
+        ("mustard",),
+        ("mustard",),
+    ),
+    "sulphite": (
+        ("sulphite", "sulfite", "sulphur dioxide", "sulfur dioxide"),
+        ("sulphite", "sulfite", "sulphur dioxide", "sulfur dioxide", "metabisulphite", "e220", "e223", "e224"),
+    ),
+}
+
+# Plant-based ingredients named after a group's words, removed from the label
+# before that group is matched ("cocoa butter" is not milk). Other groups
+# still see them: peanut butter is a peanut.
+GROUP_EXCLUSIONS = {
+    "milk": re.compile(
+        r"(?<!\w)(?:(?:cocoa|cacao|shea|mango|kokum|illipe|peanut|nut|almond|cashew|hazelnut|pistachio|seed|"
+        r"sunflower|sesame|apple|soy|soya) butters?"
+        r"|(?:coconut|almond|soy|soya|oat|rice|cashew|hazelnut|hemp|pea|nut|plant) (?:milk|cream|drink)s?"
+        r"|cream of tartar)(?!\w)"
+    ),
+}
+
+# Heading of the ingredients list in a label's OCR text
+INGREDIENTS_HEADING = re.compile(r"(?<!\w)ingredients?(?!\w)", re.IGNORECASE)
+
+# Label phrases that only warn about possible traces
+TRACE_PATTERN = re.compile(r"may contain[^.]*|traces? of[^.]*|processed in a (?:facility|factory)[^.]*")
+
+
+def _contains(text, word):
+    # Whole words, allowing plurals ("peanuts", "eggs")
+    return re.search(rf"(?<!\w){re.escape(word)}(?:s|es)?(?!\w)", text) is not None
+
+
+# Function to map the allergies a user wrote down onto allergen groups.
+# An allergy that matches no group is kept as its own ingredient word.
+def allergy_groups(allergies):
+    if isinstance(allergies, str):
+        allergies = re.split(r"[,\n;]", allergies)
+    groups = {}
+    for allergy in allergies or []:
+        allergy = normalise_text(allergy)
+        if not allergy or allergy in ("none", "no", "nil", "na", "n/a", "not specified"):
+            continue
+        matched = [group for group, (names, _) in ALLERGEN_GROUPS.items()
+                   if any(_contains(allergy, name) for name in names)]
+        if not matched:
+            groups[allergy] = (allergy,)
+        for group in matched:
+            groups[group] = ALLERGEN_GROUPS[group][1]
+    return groups
+
+
+# Function to build the fields find_allergens reads from a label's raw OCR
+# text when no extracted product is at hand: the text from the ingredients
+# heading on, so the front of the pack ("milk chocolate flavour") is skipped
+def label_ingredients(ocr_text):
+    ocr_text = ocr_text or ""
+    match = INGREDIENTS_HEADING.search(ocr_text)
+    return {"Ingredients": ocr_text[match.start():] if match else ocr_text}
+
+
+# Function to find the user's allergens in a product's ingredients.
+# Returns a list of {"allergen", "ingredient", "trace"} matches; trace matches
+# come only from "may contain" style warnings.
+def find_allergens(allergies, product_info):
+    groups = allergy_groups(allergies)
+    if not groups:
+        return []
+    ingredients = normalise_text(" ".join(
+        str(product_info.get(field) or "") for field in ("Ingredients", "Allergen Information", "Allergens")
+    ))
+    traces = " ".join(TRACE_PATTERN.findall(ingredients))
+    contents = TRACE_PATTERN.sub(" ", ingredients)
+    matches = []
+    for group, words in groups.items():
+        exclusions = GROUP_EXCLUSIONS.get(group)
+        for text, trace in ((contents, False), (traces, True)):
+            if exclusions is not None:
+                text = exclusions.sub(" ", text)
+            word = next((word for word in words if _contains(text, word)), None)
+            if word:
+                matches.append({"allergen": group, "ingredient": word, "trace": trace})
+                break
+    return matches
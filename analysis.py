@@ -0,0 +1,167 @@
+import os
+import threading
+import time
+from basket import analyse_basket
+from database import get_database
+from dedupe import find_duplicate
+from history import record_analysis, find_previous_analysis, analysis_text
+from jobs import JobQueue, JobStore
+from labelhash import perceptual_hash, find_similar_label, remember_label, link_label
+from llm_usage import usage_scope
+from nutrition import normalise_nutrition
+from models import embed_text
+from pipeline import run_ocr, analyze_label_text, extract_product_info, ProductExtractionError
+from products import product_exists, product_key, find_product
+from profiling import profile_request
+from profiles import fetch_user_profile
+from recommend import recommend_alternatives
+from scoring import score_product, compare_with_llm
+
+# Labels analysed at once, and how many more may wait before new requests
+# are turned away
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "2"))
+ANALYSIS_QUEUE_DEPTH = int(os.getenv("ANALYSIS_QUEUE_DEPTH", "16"))
+STAGES = 4
+
+
+# Function to score the product's nutrients without the LLM, as a quick preview
+# and a sanity check on the LLM's rating, and to find healthier alternatives
+def score_preview(product_info, analysis_result, user):
+    nutrients = normalise_nutrition(product_info.get("Nutritional information"))
+    if not nutrients:
+        return None
+    preview = score_product(nutrients, user)
+    if preview is None:
+        return None
+    preview["check"] = compare_with_llm(analysis_result, nutrients, user)
+    preview["alternatives"] = recommend_alternatives({**product_info, "nutrients": nutrients}, user, k=5,
+                                                     embed=embed_text)
+    return preview
+
+
+# Function to run the whole label pipeline for one upload as a job: OCR (or a
+# re-photographed label's stored text), the personalised analysis, product
+# extraction and scoring. Returns what the page needs to show the outcome.
+# profile=True records a stack profile of this analysis under its trace ID.
+def analyse_label(job, email, image_path, product_name, profile=False):
+    with profile_request("analysis", force=profile), usage_scope(user=email, endpoint="analysis"):
+        return _analyse_label(job, email, image_path, product_name)
+
+
+def _analyse_label(job, email, image_path, product_name):
+    user = fetch_user_profile(email)
+    if user is None:
+        raise ValueError(f"No profile for {email}")
+    result = {"analysis_result": None, "previous_at": None, "product_info": None, "score_preview": None,
+              "product_status": None, "duplicate_name": None, "extraction_error": None, "label_phash": None}
+    timings = {}
+
+    job.progress(0, STAGES, "Reading the label...")
+    started = time.perf_counter()
+    # A label seen before (even re-photographed) reuses its OCR text
+    # and, once it has been added, its product record
+    label_hash = perceptual_hash(image_path)
+    seen_label = find_similar_label(label_hash, product_name=product_name)
+    known_product = None
+    previous = None
+    if seen_label:
+        ocr_text = seen_label["ocr_text"]
+        if seen_label.get("product_key"):
+            known_product = find_product(seen_label["product_key"])
+            previous = find_previous_analysis(email, seen_label["product_key"], user)
+    else:
+        ocr_text = run_ocr(image_path)
+    timings["ocr"] = time.perf_counter() - started
+
+    job.progress(1, message="Analyzing the label for your profile...")
+    if previous:
+        # Same product, same profile: show the stored result instead of asking the LLM again
+        analysis_result = analysis_text(previous)
+        result["previous_at"] = previous["created_at"]
+    else:
+        started = time.perf_counter()
+        analysis_result = analyze_label_text(ocr_text, user)
+        timings["analysis"] = time.perf_counter() - started
+    if not analysis_result:
+        return result
+    result["analysis_result"] = analysis_result
+
+    job.progress(2, message="Extracting product details...")
+    started = time.perf_counter()
+    product_info = known_product
+    if product_info is None:
+        try:
+            product_info = extract_product_info(ocr_text)
+        except ProductExtractionError as e:
+            result["extraction_error"] = str(e)
+    timings["extraction"] = time.perf_counter() - started
+
+    job.progress(3, message="Scoring nutrients...")
+    if not product_info:
+        record_analysis(email, analysis_result, user, product_name=product_name, timings=timings)
+        return result
+    if not known_product:
+        product_info["Product Name"] = product_name
+        product_info["product_key"] = product_key(product_name, product_info.get("Brand Name", "Not specified"))
+        # The product key is linked once the product is in the database
+        result["label_phash"] = remember_label(label_hash, ocr_text)
+    preview = score_preview(product_info, analysis_result, user)
+    if not previous:
+        record_analysis(email, analysis_result, user, product_info["product_key"],
+                        product_info.get("Product Name"), preview, timings)
+
+    if known_product:
+        result["product_status"] = "known"
+    elif product_exists(product_name, product_info.get("Brand Name", "Not specified")):
+        result["product_status"] = "exists"
+        link_label(result["label_phash"], product_info["product_key"])
+    else:
+        duplicate = find_duplicate(product_info, exclude_key=product_info["product_key"])
+        if duplicate:
+            result["product_status"] = "duplicate"
+            result["duplicate_name"] = duplicate["name"]
+        else:
+            result["product_status"] = "new"
+    result["product_info"] = product_info
+    result["score_preview"] = preview
+    job.progress(STAGES, message="Done")
+    return result
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+# Process-wide analysis queue. Job state is kept in the "job" collection so
+# the page can poll it across reruns.
+def get_analysis_queue():
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                store = JobStore(get_database().job)
+                # The local broker's queue died with any earlier process
+                store.fail_interrupted("analysis", "basket")
+                _queue = JobQueue(workers=ANALYSIS_WORKERS, name="analysis",
+                                  max_depth=ANALYSIS_QUEUE_DEPTH, store=store)
+    return _queue
+
+
+# Function to queue an upload for analysis. Raises QueueFullError when too
+# many labels are already waiting.
+def submit_analysis(email, image_path, product_name, profile=False):
+    return get_analysis_queue().submit("analysis", analyse_label, email, image_path, product_name, owner=email,
+                                       profile=profile)
+
+
+# Function to queue a basket of (image path, product name) pairs as one job
+def submit_basket(email, items, profile=False):
+    return get_analysis_queue().submit("basket", analyse_basket, email, items, owner=email, profile=profile)
+
+
+# Function to read a job's state for its owner, or None
+def analysis_status(job_id, email):
+    status = get_analysis_queue().status(job_id)
+    if status is None or status.get("owner") != email:
+        return None
+    return status
@@ -0,0 +1,383 @@
+import argparse
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+from analysis import get_analysis_queue, submit_analysis, submit_basket
+from basket import BASKET_MAX_ITEMS
+from jobs import QueueFullError
+from llm_usage import PromptBudgetError, usage_scope
+from metrics import PROMETHEUS_CONTENT_TYPE, configure_logging, export_prometheus, trace
+from models import start_warm_up
+from pipeline import run_ocr, extract_product_info, translate_chunks, ProductExtractionError
+from products import find_product, product_key
+from profiles import fetch_user_profile
+
+logger = logging.getLogger(__name__)
+
+# Comma-separated keys accepted in the X-API-Key header
+API_KEYS = {key.strip() for key in os.getenv("LABELWISE_API_KEYS", "").split(",") if key.strip()}
+API_MAX_UPLOAD_MB = float(os.getenv("API_MAX_UPLOAD_MB", "10"))
+MAX_UPLOAD_BYTES = int(API_MAX_UPLOAD_MB * 1024 * 1024)
+# Longest a non-streaming /v1/analyze request waits before answering 202
+API_ANALYZE_TIMEOUT = float(os.getenv("API_ANALYZE_TIMEOUT_SECONDS", "120"))
+API_POLL_SECONDS = 0.25
+# How often a finished job is checked for, to remove its uploads
+CLEANUP_POLL_SECONDS = 1.0
+UPLOAD_DIR = "temp"
+IMAGE_TYPES = {"image/jpeg": ".jpg", "image/png": ".png"}
+# Paths served without an API key
+OPEN_PATHS = ("/healthz", "/metrics")
+
+# OCR, extraction and translation block, so they run off the event loop
+executor = ThreadPoolExecutor(max_workers=int(os.getenv("API_WORKERS", "4")), thread_name_prefix="api")
+
+
+def _dumps(value):
+    return json.dumps(value, default=str)
+
+
+def json_response(data, status=200, headers=None):
+    return web.json_response(data, status=status, headers=headers, dumps=_dumps)
+
+
+def error(status, message, headers=None):
+    return json_response({"error": message}, status=status, headers=headers)
+
+
+# Function to run blocking work on the executor, keeping the request's
+# trace ID (run_in_executor doesn't carry context variables over)
+async def run_blocking(func, *args):
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(context.run, func, *args))
+
+
+# Every request gets a trace ID (the caller's X-Request-ID when it sends
+# one), which is on every log line written while serving it, on the jobs it
+# queues and in the X-Trace-ID response header
+@web.middleware
+async def trace_request(request, handler):
+    with trace(request.headers.get("X-Request-ID")) as trace_id:
+        request["trace_id"] = trace_id
+        return await handler(request)
+
+
+# Runs as each response, streamed ones included, starts being sent; a plain
+# response is sent after the middleware has returned, so read it off the request
+async def add_trace_header(request, response):
+    if "trace_id" in request:
+        response.headers["X-Trace-ID"] = request["trace_id"]
+
+
+@web.middleware
+async def require_api_key(request, handler):
+    if request.path not in OPEN_PATHS and request.headers.get("X-API-Key") not in API_KEYS:
+        return error(401, "Missing or invalid X-API-Key")
+    return await handler(request)
+
+
+def remove_uploads(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+# Function to remove a job's uploads once it has finished; the job may still
+# be running when the request has been answered (202, or a dropped stream)
+async def remove_when_finished(job, paths):
+    try:
+        while not job.finished:
+            await asyncio.sleep(CLEANUP_POLL_SECONDS)
+    finally:
+        remove_uploads(paths)
+
+
+_cleanups = set()
+
+
+def remove_after_job(job, paths):
+    task = asyncio.create_task(remove_when_finished(job, paths))
+    # The loop keeps only weak references to tasks
+    _cleanups.add(task)
+    task.add_done_callback(_cleanups.discard)
+
+
+# Function to copy one multipart part to write(), counting it against the
+# upload limit. Returns the bytes received so far in the request.
+async def _read_part(part, write, received):
+    while True:
+        chunk = await part.read_chunk()
+        if not chunk:
+            return received
+        received += len(chunk)
+        if received > MAX_UPLOAD_BYTES:
+            raise web.HTTPRequestEntityTooLarge(MAX_UPLOAD_BYTES, received)
+        write(chunk)
+
+
+# Function to read a multipart form: text fields plus up to max_files
+# uploaded images, which are written to disk. Returns (fields, [(image path,
+# file name)]); the caller removes the files. request.multipart() isn't
+# covered by client_max_size, so the body is counted here as it streams in.
+async def read_upload(request, max_files):
+    fields, images, received = {}, [], 0
+    reader = await request.multipart()
+    try:
+        while True:
+            part = await reader.next()
+            if part is None:
+                break
+            if not part.filename:
+                value = bytearray()
+                received = await _read_part(part, value.extend, received)
+                fields[part.name] = value.decode(part.get_charset("utf-8"), errors="replace")
+                continue
+            if len(images) >= max_files:
+                raise web.HTTPRequestEntityTooLarge(MAX_UPLOAD_BYTES, received,
+                                                    text=f"At most {max_files} image(s) per request")
+            suffix = IMAGE_TYPES.get(part.headers.get("Content-Type", "").split(";")[0])
+            if suffix is None:
+                raise web.HTTPUnsupportedMediaType(text="Upload a JPEG or PNG image")
+            os.makedirs(UPLOAD_DIR, exist_ok=True)
+            image_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}{suffix}")
+            images.append((image_path, part.filename))
+            with open(image_path, "wb") as f:
+                received = await _read_part(part, f.write, received)
+    except BaseException:
+        remove_uploads([path for path, _ in images])
+        raise
+    return fields, images
+
+
+# Function to read a JSON object body; None when it isn't one
+async def read_json(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        return None
+    return body if isinstance(body, dict) else None
+
+
+# Function to answer for a failed job: 413 for a prompt over the token budget
+def job_error(status):
+    if status.get("error_type") == "PromptBudgetError":
+        return error(413, status["error"])
+    return error(500, status["error"] or "Analysis failed")
+
+
+# Function to read a job this request submitted. The queue may have handed
+# it to the job store, which can lose it; the request still holds the job.
+def job_state(job):
+    return get_analysis_queue().status(job.id) or job.to_dict()
+
+
+async def healthz(request):
+    return json_response({"status": "ok", "queued": get_analysis_queue().depth()})
+
+
+# GET /metrics in the Prometheus text format
+async def metrics(request):
+    return web.Response(body=export_prometheus().encode(), headers={"Content-Type": PROMETHEUS_CONTENT_TYPE})
+
+
+def wants_profile(request):
+    return request.query.get("profile") in ("1", "true")
+
+
+# POST /v1/analyze (multipart: image, email, product_name)
+# Answers with the finished result, or streams progress as NDJSON when
+# called with ?stream=1. ?profile=1 records a profile under the trace ID.
+async def analyze(request):
+    fields, images = await read_upload(request, max_files=1)
+    uploads = [path for path, _ in images]
+    try:
+        email, product_name = fields.get("email"), (fields.get("product_name") or "").strip()
+        if len(images) != 1 or not email or not product_name:
+            return error(400, "one image, email and product_name are required")
+        image_path = images[0][0]
+        if await run_blocking(fetch_user_profile, email) is None:
+            return error(404, f"No profile for {email}")
+        try:
+            job = submit_analysis(email, image_path, product_name, profile=wants_profile(request))
+        except QueueFullError as e:
+            return error(503, str(e), headers={"Retry-After": "30"})
+        remove_after_job(job, uploads)
+        uploads = []
+    finally:
+        remove_uploads(uploads)
+
+    if request.query.get("stream") in ("1", "true"):
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        last = None
+        while True:
+            status = job_state(job)
+            event = {key: status[key] for key in ("id", "status", "done", "total", "message")}
+            if event != last:
+                await response.write((_dumps(event) + "\n").encode())
+                last = event
+            if status["status"] in ("done", "failed"):
+                await response.write((_dumps({"id": job.id, "result": status["result"], "error": status["error"],
+                                              "error_type": status.get("error_type")}) + "\n").encode())
+                break
+            await asyncio.sleep(API_POLL_SECONDS)
+        await response.write_eof()
+        return response
+
+    return await wait_for_job(job)
+
+
+# Function to answer with a job's result once it finishes, or 202 with its id
+# after API_ANALYZE_TIMEOUT_SECONDS
+async def wait_for_job(job):
+    waited = 0.0
+    while True:
+        status = job_state(job)
+        if status["status"] == "done":
+            return json_response({"id": job.id, "result": status["result"]})
+        if status["status"] == "failed":
+            return job_error(status)
+        if waited >= API_ANALYZE_TIMEOUT:
+            # Still running; the client can poll /v1/jobs/{id}
+            return json_response({"id": job.id, "status": status["status"]}, status=202)
+        await asyncio.sleep(API_POLL_SECONDS)
+        waited += API_POLL_SECONDS
+
+
+# POST /v1/basket (multipart: email and several images; each file name is
+# used as the product name)
+async def basket(request):
+    fields, images = await read_upload(request, max_files=BASKET_MAX_ITEMS)
+    uploads = [path for path, _ in images]
+    try:
+        email = fields.get("email")
+        if not images or not email:
+            return error(400, "email and at least one image are required")
+        if await run_blocking(fetch_user_profile, email) is None:
+            return error(404, f"No profile for {email}")
+        items = [(path, os.path.splitext(filename)[0]) for path, filename in images]
+        try:
+            job = submit_basket(email, items, profile=wants_profile(request))
+        except QueueFullError as e:
+            return error(503, str(e), headers={"Retry-After": "30"})
+        remove_after_job(job, uploads)
+        uploads = []
+    finally:
+        remove_uploads(uploads)
+    return await wait_for_job(job)
+
+
+# GET /v1/jobs/{id}?email=...
+async def job_status(request):
+    status = get_analysis_queue().status(request.match_info["job_id"])
+    if status is None or status.get("owner") != request.query.get("email"):
+        return error(404, "No such job")
+    return json_response(status)
+
+
+# POST /v1/extract (multipart with an image, or JSON {"ocr_text": ...})
+async def extract(request):
+    if request.content_type.startswith("multipart/"):
+        _, images = await read_upload(request, max_files=1)
+        try:
+            if len(images) != 1:
+                return error(400, "one image is required")
+            ocr_text = await run_blocking(run_ocr, images[0][0])
+        finally:
+            remove_uploads([path for path, _ in images])
+    else:
+        body = await read_json(request)
+        if body is None:
+            return error(400, "the body must be a JSON object")
+        ocr_text = body.get("ocr_text")
+        if not ocr_text:
+            return error(400, "ocr_text is required")
+    try:
+        with usage_scope(endpoint="api_extract"):
+            product_info = await run_blocking(extract_product_info, ocr_text)
+    except ProductExtractionError as e:
+        return error(422, str(e))
+    except PromptBudgetError as e:
+        return error(413, str(e))
+    return json_response({"ocr_text": ocr_text, "product_info": product_info})
+
+
+# POST /v1/translate (JSON {"text": ..., "target_lang": ...})
+# Streams the translation chunk by chunk as plain text
+async def translate(request):
+    body = await read_json(request)
+    if body is None:
+        return error(400, "the body must be a JSON object")
+    text, target_lang = body.get("text"), body.get("target_lang")
+    if not text or not target_lang:
+        return error(400, "text and target_lang are required")
+    chunks = translate_chunks(text, target_lang)
+    response = web.StreamResponse(headers={"Content-Type": "text/plain; charset=utf-8"})
+    await response.prepare(request)
+    while True:
+        try:
+            chunk = await run_blocking(next, chunks, None)
+        except Exception as e:
+            # Headers are already sent; end the body with the error
+            await response.write(f"\nTranslation error: {e}".encode())
+            break
+        if chunk is None:
+            break
+        await response.write(chunk.encode())
+    await response.write_eof()
+    return response
+
+
+# GET /v1/products/{key}, or /v1/products?name=...&brand=...
+async def product(request):
+    key = request.match_info.get("key")
+    if key is None:
+        if not request.query.get("name"):
+            return error(400, "name is required")
+        key = product_key(request.query["name"], request.query.get("brand"))
+    product_info = await run_blocking(find_product, key)
+    if product_info is None:
+        return error(404, "Product not found")
+    return json_response(product_info)
+
+
+async def warm_up_models(app):
+    start_warm_up()
+
+
+def create_app():
+    if not API_KEYS:
+        raise RuntimeError("Set LABELWISE_API_KEYS to at least one key before starting the API")
+    app = web.Application(middlewares=[trace_request, require_api_key],
+                          client_max_size=int(API_MAX_UPLOAD_MB * 1024 * 1024))
+    app.add_routes([
+        web.get("/healthz", healthz),
+        web.get("/metrics", metrics),
+        web.post("/v1/analyze", analyze),
+        web.post("/v1/basket", basket),
+        web.get("/v1/jobs/{job_id}", job_status),
+        web.post("/v1/extract", extract),
+        web.post("/v1/translate", translate),
+        web.get("/v1/products", product),
+        web.get("/v1/products/{key}", product),
+    ])
+    app.on_response_prepare.append(add_trace_header)
+    app.on_startup.append(warm_up_models)
+    return app
+
+
+# python api.py --port 8080
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LabelWise HTTP API")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+    configure_logging()
+    web.run_app(create_app(), host=args.host, port=args.port)
@@ -0,0 +1,132 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from allergens import find_allergens, label_ingredients
+from history import record_analysis
+from labelhash import perceptual_hash, find_similar_label, remember_label
+from llm_usage import PROMPT_TOKEN_BUDGET, estimate_tokens, usage_scope
+from pipeline import run_ocr, analyze_basket_texts, BASKET_PROMPT
+from profiles import fetch_user_profile
+from products import find_product
+from profiling import profile_request
+from scoring import extract_llm_rating
+
+BASKET_MAX_ITEMS = int(os.getenv("BASKET_MAX_ITEMS", "30"))
+BASKET_OCR_WORKERS = int(os.getenv("BASKET_OCR_WORKERS", "4"))
+# Label text packed into one LLM call, and the reply each item needs. Mistral's
+# context window is 32k tokens; this leaves room for the reply.
+BASKET_PROMPT_TOKENS = int(os.getenv("BASKET_PROMPT_TOKENS", "12000"))
+BASKET_REPLY_TOKENS_PER_ITEM = 200
+BASKET_MAX_REPLY_TOKENS = int(os.getenv("BASKET_MAX_REPLY_TOKENS", "3000"))
+# Ratings at or above this are "eat freely", below the lower one "avoid"
+FREQUENT_RATING = 8
+AVOID_RATING = 5
+
+
+# Function to split label texts into as few LLM calls as the prompt and reply
+# budgets allow, keeping basket order. Returns lists of item positions.
+# prompt_tokens defaults to the smaller of the basket and prompt budgets.
+def pack_items(ocr_texts, prompt_tokens=None):
+    if prompt_tokens is None:
+        prompt_tokens = min(BASKET_PROMPT_TOKENS, PROMPT_TOKEN_BUDGET or BASKET_PROMPT_TOKENS)
+    budget = prompt_tokens - estimate_tokens(BASKET_PROMPT)
+    max_items = max(1, BASKET_MAX_REPLY_TOKENS // BASKET_REPLY_TOKENS_PER_ITEM)
+    batches, current, used = [], [], 0
+    for position, text in enumerate(ocr_texts):
+        tokens = estimate_tokens(text) + 10  # item header
+        if current and (used + tokens > budget or len(current) == max_items):
+            batches.append(current)
+            current, used = [], 0
+        current.append(position)
+        used += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+# Function to OCR one label, reusing the stored text of a re-photographed one.
+# Returns (hash, text, stored label record or None).
+def read_label(image_path):
+    label_hash = perceptual_hash(image_path)
+    seen_label = find_similar_label(label_hash)
+    if seen_label:
+        return label_hash, seen_label["ocr_text"], seen_label
+    return label_hash, run_ocr(image_path), None
+
+
+# Function to summarise a basket from its per-item results
+def basket_summary(items):
+    rated = [item for item in items if item["rating"] is not None]
+    ratings = [item["rating"] for item in rated]
+    return {
+        "items": len(items),
+        "rated": len(rated),
+        "average_rating": round(sum(ratings) / len(ratings), 1) if ratings else None,
+        "frequent": [item["name"] for item in rated if item["rating"] >= FREQUENT_RATING],
+        "moderate": [item["name"] for item in rated if AVOID_RATING <= item["rating"] < FREQUENT_RATING],
+        "avoid": [item["name"] for item in rated if item["rating"] < AVOID_RATING],
+        "allergens": [item["name"] for item in items if any(not match["trace"] for match in item["allergens"])],
+        "unrated": [item["name"] for item in items if item["rating"] is None],
+    }
+
+
+# Function to analyse a basket of labels as one job: OCR in parallel, one
+# profile lookup, and the labels packed into as few LLM calls as fit.
+# items is a list of (image path, product name).
+def analyse_basket(job, email, items, profile=False):
+    with profile_request("basket", force=profile), usage_scope(user=email, endpoint="basket"):
+        return _analyse_basket(job, email, items)
+
+
+def _analyse_basket(job, email, items):
+    if len(items) > BASKET_MAX_ITEMS:
+        raise ValueError(f"A basket can hold at most {BASKET_MAX_ITEMS} labels")
+    if not items:
+        return {"items": [], "summary": basket_summary([]), "llm_calls": 0}
+    user = fetch_user_profile(email)
+    if user is None:
+        raise ValueError(f"No profile for {email}")
+    names = [name for _, name in items]
+
+    job.progress(0, len(items) + 1, f"Reading {len(items)} labels...")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=BASKET_OCR_WORKERS) as pool:
+        labels = []
+        for label in pool.map(read_label, [path for path, _ in items]):
+            labels.append(label)
+            job.progress(len(labels), message=f"Read {len(labels)} of {len(items)} labels")
+    ocr_seconds = time.perf_counter() - started
+    ocr_texts = [text for _, text, _ in labels]
+    for label_hash, text, seen in labels:
+        if not seen:
+            remember_label(label_hash, text)
+    # Allergens are read from the stored product's extracted fields, as for
+    # a single label, and from the label's ingredients list otherwise
+    products = [(find_product(seen["product_key"]) if seen and seen.get("product_key") else None)
+                or label_ingredients(text) for _, text, seen in labels]
+
+    batches = pack_items(ocr_texts)
+    texts = [None] * len(items)
+    started = time.perf_counter()
+    for number, batch in enumerate(batches, 1):
+        job.progress(len(items), message=f"Analyzing the basket ({number} of {len(batches)})...")
+        for position, text in zip(batch, analyze_basket_texts([ocr_texts[i] for i in batch], user)):
+            texts[position] = text
+    # One share of the LLM time per item, for the history timings
+    analysis_seconds = (time.perf_counter() - started) / len(items)
+
+    results = []
+    for position, name in enumerate(names):
+        text = texts[position]
+        allergens = find_allergens(user.get("allergies"), products[position])
+        results.append({
+            "name": name,
+            "rating": extract_llm_rating(text),
+            "analysis": text,
+            "allergens": allergens,
+        })
+        if text:
+            record_analysis(email, text, user, product_name=name,
+                            timings={"ocr": ocr_seconds / len(items), "analysis": analysis_seconds})
+    job.progress(len(items) + 1, message="Done")
+    return {"items": results, "summary": basket_summary(results), "llm_calls": len(batches)}
@@ -0,0 +1,228 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.mock_llm import start_mock_llm  # noqa: E402
+from benchmarks.stubs import StubTranslator  # noqa: E402
+
+SEED_IMAGES = os.path.join(ROOT, "screenshots_demo")
+BENCH_EMAIL = "bench@example.com"
+BENCH_USER = {
+    "name": "Bench User",
+    "email": BENCH_EMAIL,
+    "age": 42,
+    "height": 175,
+    "weight": 82,
+    "bmi": 26.78,
+    "allergies": ["Peanuts"],
+    "health_conditions": ["Type 2 diabetes"],
+    "activity_level": "Low",
+    "dietary_preferences": "No preference",
+    "health_goals": ["Lose weight"],
+}
+SYNTHETIC_NUTRIENTS = [("Energy", "kcal", 40, 550), ("Protein", "g", 0, 30), ("Carbohydrates", "g", 0, 80),
+                       ("Total Sugars", "g", 0, 45), ("Fat", "g", 0, 35), ("Saturated Fat", "g", 0, 15),
+                       ("Fibre", "g", 0, 12), ("Sodium", "mg", 0, 1500)]
+SYNTHETIC_INGREDIENTS = ["whole grain oats", "sugar", "palm oil", "salt", "milk powder", "cocoa", "peanuts",
+                         "wheat flour", "soy lecithin", "honey", "rice", "almonds", "barley malt extract"]
+
+
+# Function to draw a synthetic nutrition label, photo-sized, for the corpus
+def synthetic_label(path, rng):
+    from PIL import Image, ImageDraw, ImageFont
+    image = Image.new("RGB", (1600, 2000), "white")
+    draw = ImageDraw.Draw(image)
+    title, body = ImageFont.load_default(size=72), ImageFont.load_default(size=48)
+    draw.text((80, 60), f"Benchmark Crunch {rng.randint(1, 999)}", font=title, fill="black")
+    draw.text((80, 180), "Nutrition Information per 100g", font=body, fill="black")
+    y = 280
+    for name, unit, low, high in SYNTHETIC_NUTRIENTS:
+        draw.text((80, y), name, font=body, fill="black")
+        draw.text((1100, y), f"{rng.uniform(low, high):.1f}{unit}", font=body, fill="black")
+        draw.line((80, y + 70, 1520, y + 70), fill="gray", width=3)
+        y += 100
+    ingredients = ", ".join(rng.sample(SYNTHETIC_INGREDIENTS, 6))
+    draw.text((80, y + 60), "Ingredients:", font=body, fill="black")
+    for line_number in range(0, len(ingredients), 40):
+        y += 70
+        draw.text((80, y + 60), ingredients[line_number:line_number + 40], font=body, fill="black")
+    draw.text((80, y + 200), "Manufactured by Mock Foods Ltd.", font=body, fill="black")
+    image.save(path, quality=90)
+
+
+# Function to build the fixture corpus: the demo screenshots plus synthetic
+# labels, the same files for the same seed
+def build_corpus(directory, synthetic, seed=0):
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for image in sorted(glob.glob(os.path.join(SEED_IMAGES, "*.jpg"))):
+        target = os.path.join(directory, os.path.basename(image))
+        if not os.path.exists(target):
+            shutil.copyfile(image, target)
+        paths.append(target)
+    for number in range(synthetic):
+        target = os.path.join(directory, f"synthetic_{seed}_{number:03d}.jpg")
+        if not os.path.exists(target):
+            synthetic_label(target, random.Random(f"{seed}-{number}"))
+        paths.append(target)
+    return paths
+
+
+def percentiles(samples):
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {"n": len(samples), "p50": float(p50), "p95": float(p95), "p99": float(p99),
+            "mean": float(np.mean(samples)), "max": float(np.max(samples))}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(stages, end_to_end):
+    print(f"{'stage':<22}{'n':>6}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'mean ms':>11}")
+    for name, summary in sorted(stages.items()) + [("end to end", end_to_end)]:
+        print(f"{name:<22}{summary['n']:>6}" + "".join(f"{summary[key] * 1000:>11.1f}"
+                                                        for key in ("p50", "p95", "p99", "mean")))
+
+
+def run(args):
+    server = start_mock_llm(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                            ms_per_token=args.ms_per_token, seed=args.seed)
+    # Set before the app's modules are imported: they read these at import
+    os.environ["MONGODB_URI"] = "mongomock://localhost"
+    os.environ["MISTRAL_ENDPOINT"] = f"http://127.0.0.1:{server.server_port}"
+    os.environ["MISTRAL_API_KEY"] = "benchmark"
+    os.environ["LABELWISE_WARM_UP"] = "0"
+    os.chdir(ROOT)
+
+    import metrics
+    import pipeline
+    from analysis import analyse_label
+    from database import get_database
+    from jobs import Job
+    StubTranslator.delay_ms = args.translate_ms
+    pipeline.make_translator = StubTranslator
+
+    db = get_database()
+    db.customer.insert_one(dict(BENCH_USER))
+    corpus = build_corpus(args.corpus_dir, args.synthetic, args.seed)
+
+    samples = {}
+    recording = False
+
+    def observe(stage, seconds, outcome):
+        if recording:
+            samples.setdefault(stage, []).append(seconds)
+
+    metrics.add_stage_observer(observe)
+    end_to_end = []
+    runs = [(path, False) for path in corpus[:args.warmup]] + [(path, True) for _ in range(args.repeat)
+                                                               for path in corpus]
+    for number, (path, recording) in enumerate(runs, 1):
+        if not args.warm_labels:
+            # Every run reads its label from scratch instead of reusing stored OCR text
+            db.label_hash.delete_many({})
+            db.analysis.delete_many({})
+        name = os.path.splitext(os.path.basename(path))[0]
+        started = time.perf_counter()
+        with metrics.trace():
+            result = analyse_label(Job("benchmark", analyse_label), BENCH_EMAIL, path, name)
+            if result["analysis_result"] and args.translate_lang:
+                pipeline.translate_text(result["analysis_result"], args.translate_lang)
+        elapsed = time.perf_counter() - started
+        if recording:
+            end_to_end.append(elapsed)
+        print(f"[{number}/{len(runs)}] {name}: {elapsed * 1000:.0f} ms" + ("" if recording else " (warm-up)"),
+              file=sys.stderr)
+    metrics.remove_stage_observer(observe)
+    server.shutdown()
+
+    results = {
+        "label": args.label,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("compare", "output")},
+        "corpus": [os.path.basename(path) for path in corpus],
+        "stages": {stage: percentiles(values) for stage, values in samples.items()},
+        "end_to_end": percentiles(end_to_end),
+        "samples": {**samples, "end_to_end": end_to_end},
+    }
+    print_table(results["stages"], results["end_to_end"])
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"results written to {args.output}")
+    return results
+
+
+# Function to print how each stage moved between two saved runs. Returns
+# True when any p95 got slower by more than threshold (a fraction).
+def compare(baseline_path, candidate_path, threshold):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(candidate_path) as f:
+        candidate = json.load(f)
+    print(f"baseline {baseline.get('label') or baseline_path} ({baseline.get('git_commit')}) vs "
+          f"candidate {candidate.get('label') or candidate_path} ({candidate.get('git_commit')})")
+    print(f"{'stage':<22}" + "".join(f"{key + ' ms':>22}" for key in ("p50", "p95", "p99")))
+    regressed = False
+    rows = sorted(set(baseline["stages"]) | set(candidate["stages"]))
+    for name in rows + ["end to end"]:
+        old = baseline["end_to_end"] if name == "end to end" else baseline["stages"].get(name)
+        new = candidate["end_to_end"] if name == "end to end" else candidate["stages"].get(name)
+        if old is None or new is None:
+            print(f"{name:<22}{'only in ' + ('candidate' if old is None else 'baseline'):>22}")
+            continue
+        cells = []
+        for key in ("p50", "p95", "p99"):
+            change = (new[key] - old[key]) / old[key] if old[key] else 0.0
+            cells.append(f"{old[key] * 1000:.0f} -> {new[key] * 1000:.0f} ({change:+.0%})")
+            if key == "p95" and change > threshold:
+                regressed = True
+        print(f"{name:<22}" + "".join(f"{cell:>22}" for cell in cells))
+    if regressed:
+        print(f"p95 regressed by more than {threshold:.0%} in at least one stage")
+    return regressed
+
+
+# python -m benchmarks.bench_pipeline --repeat 3 --output before.json
+# python -m benchmarks.bench_pipeline --compare before.json after.json
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the label pipeline end to end on a fixture corpus, "
+                                                 "with a mock LLM, in-memory MongoDB and a stub translator")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"), help="compare two result files")
+    parser.add_argument("--threshold", type=float, default=0.10, help="p95 slowdown that counts as a regression")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--label", help="name for this run in the results")
+    parser.add_argument("--corpus-dir", default=os.path.join(ROOT, "temp", "bench_corpus"))
+    parser.add_argument("--synthetic", type=int, default=8, help="synthetic labels added to the demo screenshots")
+    parser.add_argument("--repeat", type=int, default=1, help="passes over the corpus")
+    parser.add_argument("--warmup", type=int, default=1, help="unrecorded runs first, which load the models")
+    parser.add_argument("--warm-labels", action="store_true", help="let repeat runs reuse stored OCR text")
+    parser.add_argument("--latency-ms", type=float, default=500, help="mock LLM latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=100)
+    parser.add_argument("--ms-per-token", type=float, default=0, help="mock LLM time per generated token")
+    parser.add_argument("--translate-lang", default="hi", help="translate each analysis; empty to skip")
+    parser.add_argument("--translate-ms", type=float, default=50, help="stub translator time per chunk")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+    run(args)
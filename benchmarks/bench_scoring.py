@@ -0,0 +1,55 @@
+import argparse
+import time
+import numpy as np
+from scoring import SCORE_COLUMNS, score_products
+
+# Rough upper bounds per 100g for synthetic catalog values
+SYNTHETIC_MAXIMUMS = {
+    "energy_kcal": 900,
+    "sugar_g": 60,
+    "saturated_fat_g": 20,
+    "sodium_mg": 2000,
+    "fiber_g": 15,
+    "protein_g": 40,
+}
+
+BENCH_PROFILE = {
+    "health_goals": ["Lose weight"],
+    "health_conditions": ["Type 2 diabetes", "High blood pressure"],
+    "dietary_preferences": "No preference",
+    "activity_level": "Low",
+}
+
+
+# Function to build a synthetic catalog with some missing values
+def synthetic_columns(count, seed=0, missing_rate=0.1):
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for column in SCORE_COLUMNS:
+        values = rng.uniform(0, SYNTHETIC_MAXIMUMS[column], count)
+        values[rng.random(count) < missing_rate] = np.nan
+        columns[column] = values
+    return columns
+
+
+def bench(count, repeat):
+    columns = synthetic_columns(count)
+    score_products(columns, BENCH_PROFILE)  # warm-up
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        score_products(columns, BENCH_PROFILE)
+        timings.append(time.perf_counter() - started)
+    best, median = min(timings), float(np.median(timings))
+    print(f"{count:>8} products: best {best * 1000:8.2f} ms, median {median * 1000:8.2f} ms, "
+          f"{count / median / 1e6:6.2f} M products/s")
+
+
+# python -m benchmarks.bench_scoring --sizes 10000 100000
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the vectorised nutrient scorer")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    for size in args.sizes:
+        bench(size, args.repeat)
@@ -0,0 +1,57 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in a fresh interpreter so every import is cold. Time-to-first-paint is
+# taken as the time until the first script run (the Home page) has finished,
+# which is when Streamlit has sent the page to the browser.
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file({script!r}, default_timeout={timeout})
+app.run()
+first_paint = time.perf_counter() - started
+modules = [name for name in ("torch", "easyocr", "llama_index.core", "translate") if name in sys.modules]
+print(json.dumps({{"first_paint": first_paint, "exception": bool(app.exception), "heavy_modules": modules}}))
+"""
+
+
+def measure(script, eager, timeout):
+    env = dict(os.environ)
+    env["LABELWISE_EAGER_MODELS"] = "1" if eager else "0"
+    # Keep the background warm-up from loading models while we look
+    env["LABELWISE_WARM_UP"] = "0"
+    output = subprocess.run([sys.executable, "-c", CHILD.format(script=script, timeout=timeout)],
+                            cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def bench(script, eager, repeat, timeout):
+    runs = [measure(script, eager, timeout) for _ in range(repeat)]
+    timings = [run["first_paint"] for run in runs]
+    label = "eager models" if eager else "lazy models"
+    print(f"{label:>13}: first paint median {statistics.median(timings):6.2f} s, "
+          f"best {min(timings):6.2f} s over {repeat} run(s); heavy modules loaded: "
+          f"{', '.join(runs[-1]['heavy_modules']) or 'none'}"
+          + ("; the script raised an exception" if any(run["exception"] for run in runs) else ""))
+    return statistics.median(timings)
+
+
+# python -m benchmarks.bench_startup --repeat 3
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure cold-start time to the first rendered page")
+    parser.add_argument("--script", default="food_label_analyzer.py")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--lazy-only", action="store_true", help="skip the eager (pre-change) baseline")
+    args = parser.parse_args()
+    lazy = bench(args.script, False, args.repeat, args.timeout)
+    if not args.lazy_only:
+        eager = bench(args.script, True, args.repeat, args.timeout)
+        print(f"lazy loading saves {eager - lazy:.2f} s ({(eager - lazy) / eager:.0%}) of time to first paint")
@@ -0,0 +1,72 @@
+import argparse
+import gzip
+import os
+import sys
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from render import BACKGROUND_VIDEO_URL, POSTER, STATIC_DIR, page_markup, static_url  # noqa: E402
+
+
+# Function to read a remote file's size from a HEAD request, or None
+def remote_size(url, timeout):
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, method="HEAD"), timeout=timeout) as response:
+            length = response.headers.get("Content-Length")
+            return int(length) if length else None
+    except OSError:
+        return None
+
+
+# Function to list what one render mode adds to the page on top of Streamlit
+# itself, as (asset, bytes on the wire)
+def page_weight(mode, network, timeout):
+    markup = page_markup(mode).encode()
+    # Streamlit sends the markup over a deflate-compressed websocket
+    assets = [("inline style and markup", len(gzip.compress(markup)))]
+    assets.append((f"{STATIC_DIR}/{POSTER}", os.path.getsize(os.path.join(STATIC_DIR, POSTER))))
+    if "<video" in page_markup(mode):
+        size = remote_size(BACKGROUND_VIDEO_URL, timeout) if network else None
+        assets.append(("background video", size))
+    return assets
+
+
+# Function to check that a running app serves the poster with long-lived caching
+def check_served(url, timeout):
+    with urllib.request.urlopen(f"{url.rstrip('/')}/{static_url(POSTER)}", timeout=timeout) as response:
+        cache_control = response.headers.get("Cache-Control", "")
+        print(f"served {POSTER}: {response.status} {response.headers.get('Content-Type')}, "
+              f"Cache-Control: {cache_control or 'none'}")
+        return "max-age" in cache_control and "max-age=0" not in cache_control
+
+
+# python -m benchmarks.check_page_weight --budget-kb 50
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the page weight each render mode adds against a budget")
+    parser.add_argument("--budget-kb", type=float, default=50, help="budget for the lite page")
+    parser.add_argument("--full-budget-kb", type=float, help="budget for the full page, video included")
+    parser.add_argument("--network", action="store_true", help="measure the remote background video too")
+    parser.add_argument("--url", help="running app, e.g. http://localhost:8501, to check static caching")
+    parser.add_argument("--timeout", type=float, default=10)
+    args = parser.parse_args()
+
+    over = False
+    for mode, budget in (("lite", args.budget_kb), ("full", args.full_budget_kb)):
+        assets = page_weight(mode, args.network, args.timeout)
+        total = sum(size or 0 for _, size in assets) / 1024
+        unmeasured = [name for name, size in assets if size is None]
+        print(f"{mode} page: {total:.1f} KB" + (f" plus {', '.join(unmeasured)} (not measured)" if unmeasured else ""))
+        for name, size in assets:
+            print(f"  {name:<28} {'?' if size is None else f'{size / 1024:.1f} KB':>10}")
+        if budget is not None:
+            within = total <= budget and not unmeasured
+            over = over or not within
+            print(f"  budget {budget:.0f} KB: {'ok' if within else 'OVER'}")
+    if args.url and not check_served(args.url, args.timeout):
+        print("the poster is not served with a long-lived Cache-Control header; "
+              "is server.enableStaticServing on?")
+        over = True
+    sys.exit(1 if over else 0)
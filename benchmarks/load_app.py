@@ -0,0 +1,15 @@
+import os
+import runpy
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmarks.stubs import install_stubs  # noqa: E402
+
+# Streamlit entry point for load tests: the real app with stubbed backends.
+# benchmarks/loadtest_app.py starts it; to run it by hand:
+# MONGODB_URI=mongomock:// MISTRAL_ENDPOINT=http://127.0.0.1:8765 streamlit run benchmarks/load_app.py
+install_stubs()
+runpy.run_path(os.path.join(ROOT, "food_label_analyzer.py"), run_name="__main__")
@@ -0,0 +1,84 @@
+import argparse
+import asyncio
+import os
+import time
+import aiohttp
+import numpy as np
+
+
+# Function to build one request for the chosen endpoint
+def make_request(args):
+    headers = {"X-API-Key": args.api_key}
+    if args.endpoint == "product":
+        return "GET", f"{args.url}/v1/products", {"params": {"name": args.product_name, "brand": args.brand},
+                                                  "headers": headers}
+    if args.endpoint == "translate":
+        return "POST", f"{args.url}/v1/translate", {"json": {"text": args.text, "target_lang": args.target_lang},
+                                                    "headers": headers}
+    form = aiohttp.FormData()
+    if args.endpoint == "extract":
+        form.add_field("image", args.image_bytes, filename=os.path.basename(args.image), content_type=args.image_type)
+        return "POST", f"{args.url}/v1/extract", {"data": form, "headers": headers}
+    form.add_field("email", args.email)
+    form.add_field("product_name", args.product_name)
+    form.add_field("image", args.image_bytes, filename=os.path.basename(args.image), content_type=args.image_type)
+    return "POST", f"{args.url}/v1/analyze", {"data": form, "headers": headers}
+
+
+async def worker(session, args, remaining, latencies, statuses):
+    while remaining:
+        remaining.pop()
+        method, url, options = make_request(args)
+        started = time.perf_counter()
+        try:
+            async with session.request(method, url, **options) as response:
+                # Read the whole (possibly streamed) body
+                await response.read()
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+        except aiohttp.ClientError as e:
+            statuses[type(e).__name__] = statuses.get(type(e).__name__, 0) + 1
+        latencies.append(time.perf_counter() - started)
+
+
+async def run(args):
+    remaining = list(range(args.requests))
+    latencies, statuses = [], {}
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(session, args, remaining, latencies, statuses)
+                               for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    print(f"{args.endpoint}: {len(latencies)} requests, concurrency {args.concurrency}, "
+          f"{len(latencies) / elapsed:.1f} req/s")
+    print(f"latency p50 {p50:.0f} ms, p95 {p95:.0f} ms, p99 {p99:.0f} ms, max {max(latencies) * 1000:.0f} ms")
+    print("responses: " + ", ".join(f"{status}: {count}" for status, count in sorted(statuses.items(), key=str)))
+
+
+# python -m benchmarks.loadtest_api --endpoint product --requests 500 --concurrency 20
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the LabelWise HTTP API")
+    parser.add_argument("--url", default="http://localhost:8080")
+    parser.add_argument("--api-key", default=os.getenv("LABELWISE_API_KEY", ""))
+    parser.add_argument("--endpoint", choices=["product", "translate", "extract", "analyze"], default="product")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--image", help="label image for extract/analyze")
+    parser.add_argument("--image-type", default="image/jpeg")
+    parser.add_argument("--email", help="registered user for analyze")
+    parser.add_argument("--product-name", default="Load Test Product")
+    parser.add_argument("--brand", default="Not specified")
+    parser.add_argument("--text", default="This food is high in sugar and should be eaten in moderation.")
+    parser.add_argument("--target-lang", default="hi")
+    args = parser.parse_args()
+    if args.endpoint in ("extract", "analyze") and not args.image:
+        parser.error(f"--image is required for {args.endpoint}")
+    if args.endpoint == "analyze" and not args.email:
+        parser.error("--email is required for analyze")
+    if args.image:
+        with open(args.image, "rb") as f:
+            args.image_bytes = f.read()
+    asyncio.run(run(args))
@@ -0,0 +1,296 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+import numpy as np
+import psutil
+from playwright.async_api import async_playwright
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.bench_pipeline import build_corpus  # noqa: E402
+from benchmarks.mock_llm import start_mock_llm  # noqa: E402
+from benchmarks.stubs import LOADTEST_PASSWORD, LOADTEST_USERS, load_user_email  # noqa: E402
+
+STEPS = ("load", "login", "upload", "analyze", "translate")
+# A level counts as saturated when errors pass this rate, or its scenario
+# p95 reaches this multiple of the first level's
+SATURATION_ERROR_RATE = 0.05
+SATURATION_SLOWDOWN = 3.0
+
+
+# Function to start the app with stubbed backends and wait until it answers
+def start_server(args, llm_url):
+    env = dict(os.environ)
+    env.update({
+        "MONGODB_URI": "mongomock://localhost",
+        "MISTRAL_ENDPOINT": llm_url,
+        "MISTRAL_API_KEY": "loadtest",
+        "LOADTEST_USERS": str(max(args.users, LOADTEST_USERS)),
+        "LOADTEST_TRANSLATE_MS": str(args.translate_ms),
+        "LOADTEST_STUB_EMBEDDINGS": "0" if args.real_embeddings else "1",
+        # Every upload is read and analysed, rather than matched to an earlier one
+        "LABEL_HASH_MAX_DISTANCE": "-1",
+    })
+    if args.ocr_ms > 0:
+        env["LOADTEST_OCR_MS"] = str(args.ocr_ms)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", os.path.join("benchmarks", "load_app.py"),
+         "--server.headless", "true", "--server.port", str(args.port), "--browser.gatherUsageStats", "false"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL if not args.server_logs else None, stderr=subprocess.STDOUT)
+    url = f"http://localhost:{args.port}"
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/_stcore/health", timeout=2):
+                return server, url
+        except OSError:
+            if server.poll() is not None:
+                raise RuntimeError("Streamlit exited during start-up; run with --server-logs to see why")
+            time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError("Streamlit did not answer its health check within 120 s")
+
+
+class LoadStats:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.active_users = 0
+        # User count of the ramp level in progress; events and samples are
+        # grouped by it
+        self.level = 0
+        self.events = []
+        self.samples = []
+
+    def record(self, kind, seconds, ok, error=None):
+        self.events.append({"t": time.monotonic() - self.started, "users": self.level, "kind": kind,
+                            "seconds": seconds, "ok": ok, "error": error})
+
+
+async def timed_step(stats, name, coroutine):
+    started = time.perf_counter()
+    try:
+        await coroutine
+    except Exception as e:
+        stats.record(name, time.perf_counter() - started, False, f"{type(e).__name__}: {str(e)[:200]}")
+        raise
+    stats.record(name, time.perf_counter() - started, True)
+
+
+async def login(page, email, timeout):
+    # The navigation bar is a component in its own iframe
+    await page.frame_locator('iframe[title*="option_menu"]').get_by_text("Login", exact=True).click(timeout=timeout)
+    await page.get_by_label("Email").fill(email)
+    await page.get_by_label("Password").fill(LOADTEST_PASSWORD)
+    await page.get_by_label("Password").press("Enter")
+    await page.get_by_role("button", name="Login").click()
+    await page.get_by_text("Upload Food Label for Analysis").wait_for(timeout=timeout)
+
+
+async def upload(page, image, timeout):
+    await page.get_by_label("Product Name").fill(os.path.splitext(os.path.basename(image))[0])
+    await page.get_by_label("Product Name").press("Enter")
+    # The first file input is the single-label uploader; the basket has the second
+    await page.locator('input[type="file"]').first.set_input_files(image)
+    await page.get_by_role("button", name="Analyze Food Label").wait_for(timeout=timeout)
+
+
+async def analyze(page, timeout):
+    await page.get_by_role("button", name="Analyze Food Label").click()
+    await page.get_by_text("Translate Analysis").wait_for(timeout=timeout)
+
+
+async def translate(page, timeout):
+    await page.get_by_role("button", name="Translate", exact=True).click()
+    await page.get_by_text("Translated Analysis").wait_for(timeout=timeout)
+
+
+# One simulated visitor, repeating login -> upload -> analyze -> translate in
+# a fresh session until told to stop
+async def virtual_user(browser, number, url, images, args, stats, stop):
+    context = await browser.new_context()
+    page = await context.new_page()
+    email = load_user_email(number)
+    timeout = args.timeout * 1000
+    iteration = 0
+    stats.active_users += 1
+    try:
+        while not stop.is_set():
+            image = images[(number + iteration * args.users) % len(images)]
+            iteration += 1
+            started = time.perf_counter()
+            try:
+                await timed_step(stats, "load", page.goto(url, timeout=timeout))
+                await timed_step(stats, "login", login(page, email, timeout))
+                await timed_step(stats, "upload", upload(page, image, timeout))
+                await timed_step(stats, "analyze", analyze(page, timeout))
+                await timed_step(stats, "translate", translate(page, timeout))
+                stats.record("scenario", time.perf_counter() - started, True)
+            except Exception as e:
+                stats.record("scenario", time.perf_counter() - started, False, type(e).__name__)
+                await asyncio.sleep(1)
+            if args.think_seconds:
+                await asyncio.sleep(args.think_seconds)
+    finally:
+        stats.active_users -= 1
+        await context.close()
+
+
+# Function to sample the server's memory, threads and CPU at a fixed interval
+async def sample_server(pid, stats, interval, stop):
+    if pid is None:
+        return
+    process = psutil.Process(pid)
+    process.cpu_percent()
+    while not stop.is_set():
+        try:
+            with process.oneshot():
+                stats.samples.append({
+                    "t": time.monotonic() - stats.started, "users": stats.level, "active": stats.active_users,
+                    "rss_mb": process.memory_info().rss / 2 ** 20, "threads": process.num_threads(),
+                    "cpu_percent": process.cpu_percent(),
+                })
+        except psutil.NoSuchProcess:
+            return
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+# Function to summarise each user-count level of the ramp and find the first
+# one where the node saturated
+def summarise(stats, levels, interval):
+    summary = []
+    for users in levels:
+        scenarios = [event for event in stats.events if event["kind"] == "scenario" and event["users"] == users]
+        samples = [sample for sample in stats.samples if sample["users"] == users]
+        if not scenarios:
+            continue
+        done = [event["seconds"] for event in scenarios if event["ok"]]
+        level = {
+            "users": users,
+            "scenarios": len(scenarios),
+            "error_rate": 1 - len(done) / len(scenarios),
+            "throughput_per_min": len(done) / interval * 60,
+            "rss_mb_max": max((sample["rss_mb"] for sample in samples), default=None),
+            "threads_max": max((sample["threads"] for sample in samples), default=None),
+        }
+        if done:
+            level["p50"], level["p95"] = (float(value) for value in np.percentile(done, [50, 95]))
+        for step in STEPS:
+            durations = [event["seconds"] for event in stats.events
+                         if event["kind"] == step and event["users"] == users and event["ok"]]
+            if durations:
+                level[f"{step}_p95"] = float(np.percentile(durations, 95))
+        summary.append(level)
+
+    saturated_at = None
+    baseline = next((level.get("p95") for level in summary if level.get("p95")), None)
+    for level in summary:
+        slow = baseline and level.get("p95") and level["p95"] >= SATURATION_SLOWDOWN * baseline
+        if level["error_rate"] > SATURATION_ERROR_RATE or slow:
+            saturated_at = level["users"]
+            break
+    return summary, saturated_at
+
+
+def _cell(level, key, width, fmt):
+    value = level.get(key)
+    return f"{'-' if value is None else format(value, fmt):>{width}}"
+
+
+def print_summary(summary, saturated_at):
+    print(f"{'users':>6}{'scenarios':>11}{'errors':>9}{'per min':>9}{'p50 s':>8}{'p95 s':>8}"
+          f"{'analyze p95':>13}{'RSS MB':>9}{'threads':>9}")
+    for level in summary:
+        print(f"{level['users']:>6}{level['scenarios']:>11}{level['error_rate']:>9.0%}"
+              + _cell(level, "throughput_per_min", 9, ".1f") + _cell(level, "p50", 8, ".1f")
+              + _cell(level, "p95", 8, ".1f") + _cell(level, "analyze_p95", 13, ".1f")
+              + _cell(level, "rss_mb_max", 9, ".0f") + _cell(level, "threads_max", 9, "d"))
+    if saturated_at is None:
+        print("no saturation within the tested range; ramp further with --users")
+    else:
+        print(f"saturated at {saturated_at} concurrent users "
+              f"(error rate over {SATURATION_ERROR_RATE:.0%} or p95 {SATURATION_SLOWDOWN:.0f}x the first level)")
+
+
+async def run(args):
+    server = llm = None
+    if args.url:
+        url, pid = args.url.rstrip("/"), args.server_pid
+    else:
+        llm = start_mock_llm(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms)
+        server, url = start_server(args, f"http://127.0.0.1:{llm.server_port}")
+        pid = server.pid
+    images = build_corpus(args.corpus_dir, args.images)
+
+    stats = LoadStats()
+    stop = asyncio.Event()
+    levels = list(range(args.ramp_step, args.users + 1, args.ramp_step)) or [args.users]
+    if levels[-1] != args.users:
+        levels.append(args.users)
+    try:
+        async with async_playwright() as playwright:
+            browser = await playwright.chromium.launch(headless=not args.headed)
+            sampler = asyncio.create_task(sample_server(pid, stats, args.sample_interval, stop))
+            users = []
+            for level in levels:
+                while len(users) < level:
+                    users.append(asyncio.create_task(
+                        virtual_user(browser, len(users), url, images, args, stats, stop)))
+                stats.level = level
+                print(f"{level} users", file=sys.stderr)
+                await asyncio.sleep(args.ramp_interval)
+            stop.set()
+            await asyncio.gather(*users, sampler, return_exceptions=True)
+            await browser.close()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        if llm is not None:
+            llm.shutdown()
+
+    summary, saturated_at = summarise(stats, levels, args.ramp_interval)
+    print_summary(summary, saturated_at)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"settings": vars(args), "levels": summary, "saturated_at": saturated_at,
+                       "samples": stats.samples, "events": stats.events}, f, indent=2)
+        print(f"results written to {args.output}")
+
+
+# pip install playwright psutil && playwright install chromium
+# python -m benchmarks.loadtest_app --users 20 --ramp-step 2 --ramp-interval 60 --output ramp.json
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ramp simulated users against the Streamlit app "
+                                                 "(stubbed backends) and find where one node saturates")
+    parser.add_argument("--url", help="test a running app instead of starting one (backends as configured)")
+    parser.add_argument("--server-pid", type=int, help="with --url, the server process to sample")
+    parser.add_argument("--port", type=int, default=8599)
+    parser.add_argument("--users", type=int, default=10, help="users at the end of the ramp")
+    parser.add_argument("--ramp-step", type=int, default=2, help="users added at each level")
+    parser.add_argument("--ramp-interval", type=float, default=60, help="seconds at each level")
+    parser.add_argument("--think-seconds", type=float, default=2, help="pause between a user's scenarios")
+    parser.add_argument("--timeout", type=float, default=180, help="seconds before a step counts as failed")
+    parser.add_argument("--sample-interval", type=float, default=2, help="seconds between server samples")
+    parser.add_argument("--images", type=int, default=20, help="synthetic labels to upload, round robin")
+    parser.add_argument("--corpus-dir", default=os.path.join(ROOT, "temp", "bench_corpus"))
+    parser.add_argument("--latency-ms", type=float, default=800, help="mock LLM latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=200)
+    parser.add_argument("--ocr-ms", type=float, default=1500, help="stub OCR time per label; 0 runs EasyOCR")
+    parser.add_argument("--translate-ms", type=float, default=50, help="stub translator time per chunk")
+    parser.add_argument("--real-embeddings", action="store_true", help="load the bge model instead of a stub")
+    parser.add_argument("--headed", action="store_true", help="show the browsers")
+    parser.add_argument("--server-logs", action="store_true", help="pass the app's output through")
+    parser.add_argument("--output", help="write the timeline and per-level summary as JSON")
+    args = parser.parse_args()
+    if args.users > LOADTEST_USERS and args.url:
+        parser.error(f"a running app only has {LOADTEST_USERS} seeded accounts (LOADTEST_USERS)")
+    asyncio.run(run(args))
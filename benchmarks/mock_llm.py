@@ -0,0 +1,144 @@
+import argparse
+import http.server
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+ANALYSIS_REPLY = """**Health Rating: {rating}/10**
+
+**Detailed Breakdown**
+- The food contains 12g sugar, 4g saturated fat and 320mg sodium per 100g.
+- It provides 6g protein and 3g fiber per 100g.
+
+**Personalized Evaluation**
+This food is moderately high in sugar, which may not align with your goal of maintaining stable blood sugar levels.
+
+**Advice**
+Eat it **in moderation**, alongside foods that are higher in fiber and protein.
+"""
+
+EXTRACTION_REPLY = """{{
+    "Product Name": "Benchmark Crunch {number}",
+    "Brand Name": "Mock Foods",
+    "Weight": "400g",
+    "Nutritional information": {{
+        "per 100g": {{
+            "Energy": "{energy}kcal",
+            "Protein": "6g",
+            "Carbohydrates": "70g",
+            "Total Sugars": "12g",
+            "Fat": "9g",
+            "Saturated Fat": "4g",
+            "Fiber": "3g",
+            "Sodium": "320mg"
+        }}
+    }},
+    "Ingredients": "Whole grain oats, sugar, palm oil, salt",
+    "Product Category": "Breakfast Cereal",
+    "Proprietary Claims": "High in fiber"
+}}"""
+
+BASKET_ITEM_REPLY = """### Item {number}
+Rating: {rating}/10
+This item is fairly high in sugar for your goals. Eat it in moderation.
+"""
+
+
+# Rough token count, as the real API would report it
+def count_tokens(text):
+    return len(text) // 4 + 1
+
+
+# Function to write a plausible reply for one of the app's prompts, so the
+# real parsing code downstream has something to parse
+def canned_reply(prompt, rng):
+    if "correcting and structuring the OCR text" in prompt:
+        return EXTRACTION_REPLY.format(number=rng.randint(1, 10_000), energy=rng.randint(80, 550))
+    basket = re.search(r"analyzing (\d+) food labels", prompt)
+    if basket:
+        return "\n".join(BASKET_ITEM_REPLY.format(number=number, rating=rng.randint(2, 9))
+                         for number in range(1, int(basket.group(1)) + 1))
+    return ANALYSIS_REPLY.format(rating=rng.randint(2, 9))
+
+
+# Answers POST .../chat/completions like Mistral's API, after a configurable
+# delay: latency_ms (plus up to jitter_ms) per request and ms_per_token per
+# generated token
+class MockLLMHandler(http.server.BaseHTTPRequestHandler):
+    latency_ms = 500
+    jitter_ms = 0
+    ms_per_token = 0
+    rng = random.Random(0)
+    rng_lock = threading.Lock()
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "mistral-mock", "object": "model"}]})
+        else:
+            self._send_json(404, {"message": "Not found"})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"message": "Not found"})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        prompt = "\n".join(str(message.get("content", "")) for message in request.get("messages", []))
+        with self.rng_lock:
+            reply = canned_reply(prompt, self.rng)
+            delay = self.latency_ms + self.rng.uniform(0, self.jitter_ms)
+        prompt_tokens, completion_tokens = count_tokens(prompt), count_tokens(reply)
+        time.sleep((delay + self.ms_per_token * completion_tokens) / 1000)
+        self._send_json(200, {
+            "id": uuid.uuid4().hex,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mistral-mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": reply},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Function to start the mock server on a daemon thread. Port 0 picks a free
+# port; the server's URL is http://127.0.0.1:{server.server_port}.
+def start_mock_llm(port=0, latency_ms=500, jitter_ms=0, ms_per_token=0, seed=0):
+    handler = type("ConfiguredMockLLMHandler", (MockLLMHandler,), {
+        "latency_ms": latency_ms, "jitter_ms": jitter_ms, "ms_per_token": ms_per_token,
+        "rng": random.Random(seed), "rng_lock": threading.Lock(),
+    })
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-llm", daemon=True).start()
+    return server
+
+
+# python -m benchmarks.mock_llm --port 8765 --latency-ms 800
+# then run the app with MISTRAL_ENDPOINT=http://127.0.0.1:8765
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a Mistral-compatible chat API with canned replies")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=500)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--ms-per-token", type=float, default=0)
+    args = parser.parse_args()
+    server = start_mock_llm(args.port, args.latency_ms, args.jitter_ms, args.ms_per_token)
+    print(f"Mock LLM listening on http://127.0.0.1:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,86 @@
+import hashlib
+import os
+import threading
+import time
+
+# Accounts seeded for load tests: loaduser0@example.com ... with one password
+LOADTEST_USERS = int(os.getenv("LOADTEST_USERS", "50"))
+LOADTEST_PASSWORD = "LoadTest#1"
+# Stub timings; LOADTEST_OCR_MS unset keeps the real EasyOCR reader
+LOADTEST_OCR_MS = os.getenv("LOADTEST_OCR_MS")
+LOADTEST_TRANSLATE_MS = float(os.getenv("LOADTEST_TRANSLATE_MS", "50"))
+LOADTEST_STUB_EMBEDDINGS = os.getenv("LOADTEST_STUB_EMBEDDINGS") == "1"
+STUB_EMBEDDING_DIM = 768
+STUB_LABEL_LINES = [
+    "Nutrition Information per 100g", "Energy 371kcal", "Protein 6g", "Carbohydrates 70g", "Total Sugars 12g",
+    "Fat 9g", "Saturated Fat 4g", "Fibre 3g", "Sodium 320mg",
+    "Ingredients: whole grain oats, sugar, palm oil, salt", "Manufactured by Mock Foods Ltd.",
+]
+
+
+def load_user_email(number):
+    return f"loaduser{number}@example.com"
+
+
+# Stands in for the translate library: sleeps like a network round trip and
+# tags the text instead of translating it
+class StubTranslator:
+    delay_ms = LOADTEST_TRANSLATE_MS
+
+    def __init__(self, target_lang):
+        self.target_lang = target_lang
+
+    def translate(self, text):
+        time.sleep(self.delay_ms / 1000)
+        return f"[{self.target_lang}] {text}"
+
+
+# Stands in for the EasyOCR reader: sleeps, then reads the same label text
+class StubReader:
+    def __init__(self, delay_ms):
+        self.delay_ms = delay_ms
+
+    def readtext(self, image_path):
+        time.sleep(self.delay_ms / 1000)
+        return [(None, line, 0.99) for line in STUB_LABEL_LINES]
+
+
+def _load_stub_embedding():
+    from llama_index.core import MockEmbedding, Settings
+    embedding_model = MockEmbedding(embed_dim=STUB_EMBEDDING_DIM)
+    Settings.embed_model = embedding_model
+    return embedding_model
+
+
+_installed = False
+_install_lock = threading.Lock()
+
+
+# Function to swap the stubs into the app's modules and seed the load-test
+# accounts, once per process. Expects MONGODB_URI=mongomock:// and
+# MISTRAL_ENDPOINT at the mock LLM, set before the app's modules load.
+def install_stubs():
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        import pipeline
+        from database import get_database
+        from models import registry
+
+        pipeline.make_translator = StubTranslator
+        if LOADTEST_OCR_MS:
+            delay_ms = float(LOADTEST_OCR_MS)
+            registry.register("ocr", lambda: StubReader(delay_ms))
+        if LOADTEST_STUB_EMBEDDINGS:
+            registry.register("embedding", _load_stub_embedding)
+
+        password = hashlib.sha256(LOADTEST_PASSWORD.encode()).hexdigest()
+        customers = get_database().customer
+        for number in range(LOADTEST_USERS):
+            customers.update_one({"email": load_user_email(number)}, {"$setOnInsert": {
+                "name": f"Load User {number}", "password": password, "age": 35, "height": 170, "weight": 70,
+                "bmi": 24.22, "allergies": ["Peanuts"], "health_conditions": [], "activity_level": "Moderate",
+                "dietary_preferences": "No preference", "health_goals": ["General well-being"],
+            }}, upsert=True)
+        _installed = True
@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+from pymongo import MongoClient, monitoring
+from dotenv import load_dotenv
+from metrics import mongo_command_metrics, register_collector
+from schema import ensure_indexes
+
+# Load environment variables
+load_dotenv()
+
+# Connection settings, all overridable through the environment
+MONGODB_URI = os.getenv("MONGODB_URI")
+DATABASE_NAME = os.getenv("MONGODB_DATABASE", "Health")
+MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "50"))
+MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "0"))
+MAX_IDLE_TIME_MS = int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "300000"))
+WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+CONNECT_TIMEOUT_MS = int(os.getenv("MONGODB_CONNECT_TIMEOUT_MS", "5000"))
+SOCKET_TIMEOUT_MS = int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", "20000"))
+SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+READ_PREFERENCE = os.getenv("MONGODB_READ_PREFERENCE", "primary")
+
+
+# Collects connection pool events so pool usage can be reported as metrics
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._values = {
+            "checkouts": 0,
+            "checkout_failures": 0,
+            "checkins": 0,
+            "checked_out": 0,
+            "waiting": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "connections_created": 0,
+            "connections_closed": 0,
+            "connections_open": 0,
+            "pool_clears": 0,
+        }
+
+    def _add(self, key, amount=1):
+        with self._lock:
+            self._values[key] += amount
+
+    def _finish_wait(self):
+        started = getattr(self._local, "checkout_started", None)
+        self._local.checkout_started = None
+        with self._lock:
+            self._values["waiting"] -= 1
+            if started is not None:
+                waited = time.monotonic() - started
+                self._values["wait_seconds_total"] += waited
+                self._values["wait_seconds_max"] = max(self._values["wait_seconds_max"], waited)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._add("pool_clears")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._add("connections_created")
+        self._add("connections_open")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._add("connections_closed")
+        self._add("connections_open", -1)
+
+    def connection_check_out_started(self, event):
+        self._local.checkout_started = time.monotonic()
+        self._add("waiting")
+
+    def connection_check_out_failed(self, event):
+        self._finish_wait()
+        self._add("checkout_failures")
+
+    def connection_checked_out(self, event):
+        self._finish_wait()
+        self._add("checkouts")
+        self._add("checked_out")
+
+    def connection_checked_in(self, event):
+        self._add("checkins")
+        self._add("checked_out", -1)
+
+
+pool_metrics = PoolMetrics()
+
+_client = None
+_client_lock = threading.Lock()
+
+
+# Keyword arguments for the shared MongoClient
+def client_options():
+    return {
+        "maxPoolSize": MAX_POOL_SIZE,
+        "minPoolSize": MIN_POOL_SIZE,
+        "maxIdleTimeMS": MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": WAIT_QUEUE_TIMEOUT_MS,
+        "connectTimeoutMS": CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": SOCKET_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": SERVER_SELECTION_TIMEOUT_MS,
+        "readPreference": READ_PREFERENCE,
+        "event_listeners": [pool_metrics, mongo_command_metrics],
+    }
+
+
+# Process-wide MongoClient. Streamlit re-executes the page script on every
+# rerun but keeps imported modules, so the client and its pool survive reruns.
+# A mongomock:// URI uses an in-memory stand-in (pip install mongomock), for
+# benchmarks and demos without a server.
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if (MONGODB_URI or "").startswith("mongomock://"):
+                    import mongomock
+                    _client = mongomock.MongoClient()
+                else:
+                    _client = MongoClient(MONGODB_URI, **client_options())
+    return _client
+
+
+# Indexes are created on first use, once per process
+def get_database():
+    db = get_client()[DATABASE_NAME]
+    ensure_indexes(db)
+    return db
+
+
+# Snapshot of connection pool usage (checkouts, waits, open connections)
+def get_pool_metrics():
+    return pool_metrics.snapshot()
+
+
+# Pool usage in the Prometheus export
+@register_collector
+def pool_samples():
+    values = pool_metrics.snapshot()
+    gauges = ("checked_out", "waiting", "connections_open", "wait_seconds_max")
+    return [(f"labelwise_mongo_pool_{name}", "gauge" if name in gauges else "counter",
+             f"MongoDB connection pool {name.replace('_', ' ')}", (), {(): value})
+            for name, value in values.items()]
+
+
+def close_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
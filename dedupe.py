@@ -0,0 +1,141 @@
+import hashlib
+import os
+import re
+import threading
+import numpy as np
+from products import product_collection, normalise_text, UNSPECIFIED
+
+# 16 bands of 4 rows: pairs with a feature Jaccard of about 0.5 or more land
+# in a shared bucket with high probability
+NUM_PERMUTATIONS = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERMUTATIONS // BANDS
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", "0.7"))
+NAME_WEIGHT = 0.6
+
+_rng = np.random.default_rng(20240611)
+_A = _rng.integers(1, 1 << 32, NUM_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.integers(0, 1 << 32, NUM_PERMUTATIONS, dtype=np.uint64)
+
+
+def _words(text):
+    text = normalise_text(text)
+    if text == UNSPECIFIED:
+        return set()
+    # "2-Minute" and "2 minute" should produce the same tokens
+    return set(re.findall(r"\w+", text))
+
+
+def _trigrams(words):
+    joined = " ".join(sorted(words))
+    return {joined[i:i + 3] for i in range(len(joined) - 2)}
+
+
+# Function to split a product into the token sets that are compared
+def product_features(product_info):
+    name = _words(product_info.get("Product Name"))
+    return {
+        "name": name,
+        "brand": _words(product_info.get("Brand Name")),
+        "ingredients": _words(product_info.get("Ingredients")),
+        "shingles": {f"n:{token}" for token in name | _trigrams(name)}
+                    | {f"i:{token}" for token in _words(product_info.get("Ingredients"))},
+    }
+
+
+def _token_hash(token):
+    return int.from_bytes(hashlib.blake2b(token.encode(), digest_size=4).digest(), "little")
+
+
+# Function to compute the MinHash signature of a set of tokens
+def minhash(tokens):
+    if not tokens:
+        return None
+    hashes = np.fromiter((_token_hash(token) for token in tokens), dtype=np.uint64, count=len(tokens))
+    # (a * x + b) mod p for every permutation and token; a, x < 2^32 so it fits in 64 bits
+    permuted = (np.outer(hashes, _A) + _B) % MERSENNE_PRIME
+    return permuted.min(axis=0)
+
+
+def jaccard(left, right):
+    if not left or not right:
+        return None
+    return len(left & right) / len(left | right)
+
+
+# MinHash LSH index over product names and ingredients
+class DuplicateIndex:
+    def __init__(self):
+        self.buckets = {}
+        self.features = {}
+        self.names = {}
+        self._lock = threading.Lock()
+
+    def _band_keys(self, signature):
+        for band in range(BANDS):
+            rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+            yield band, rows.tobytes()
+
+    def add(self, key, product_info):
+        features = product_features(product_info)
+        signature = minhash(features["shingles"])
+        if signature is None:
+            return
+        with self._lock:
+            self.features[key] = features
+            self.names[key] = product_info.get("Product Name")
+            for band_key in self._band_keys(signature):
+                self.buckets.setdefault(band_key, set()).add(key)
+
+    # Function to return likely duplicates as (similarity, key, name), best first
+    def candidates(self, product_info, threshold=DUPLICATE_THRESHOLD, exclude_key=None):
+        features = product_features(product_info)
+        signature = minhash(features["shingles"])
+        if signature is None:
+            return []
+        with self._lock:
+            keys = set()
+            for band_key in self._band_keys(signature):
+                keys |= self.buckets.get(band_key, set())
+            keys.discard(exclude_key)
+            matches = []
+            for key in keys:
+                other = self.features[key]
+                brand = jaccard(features["brand"], other["brand"])
+                if brand is not None and brand < 0.5:
+                    # Same-looking product from a different brand
+                    continue
+                name = jaccard(features["name"], other["name"]) or 0.0
+                ingredients = jaccard(features["ingredients"], other["ingredients"])
+                similarity = name if ingredients is None else NAME_WEIGHT * name + (1 - NAME_WEIGHT) * ingredients
+                if similarity >= threshold:
+                    matches.append((similarity, key, self.names[key]))
+        return sorted(matches, reverse=True)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+# Process-wide index, built from the product collection on first use
+def get_duplicate_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = DuplicateIndex()
+                projection = {"product_key": 1, "Product Name": 1, "Brand Name": 1, "Ingredients": 1}
+                for doc in product_collection.find({"product_key": {"$exists": True}}, projection):
+                    index.add(doc["product_key"], doc)
+                _index = index
+    return _index
+
+
+# Function to find the best likely duplicate of a product, or None
+def find_duplicate(product_info, exclude_key=None):
+    matches = get_duplicate_index().candidates(product_info, exclude_key=exclude_key)
+    if not matches:
+        return None
+    similarity, key, name = matches[0]
+    return {"product_key": key, "name": name, "similarity": similarity}
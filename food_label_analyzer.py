@@ -1,39 +1,51 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from streamlit_option_menu import option_menu
 from streamlit_extras.switch_page_button import switch_page
 import time
 import base64
-from pymongo import MongoClient
+import logging
+from contextlib import contextmanager
+from pymongo.errors import DuplicateKeyError
 import hashlib
 import os
-import easyocr
-import difflib
-from llama_index.core import VectorStoreIndex, Document, Settings
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from llama_index.llms.mistralai import MistralAI
-from translate import Translator
 from dotenv import load_dotenv
+from database import get_database
+from products import upsert_product
+from profiles import fetch_user_profile, fetch_user_credentials, clear_session_profiles
+from profiles import update_user_profile as write_user_profile
+from recommend import index_product
+from labelhash import link_label
+from dedupe import get_duplicate_index
+from history import fetch_history, analysis_text
+from rerating import schedule_rerating, rerating_status
+from analysis import submit_analysis, submit_basket, analysis_status
+from basket import BASKET_MAX_ITEMS
+from jobs import QueueFullError
+from models import embed_text, memory_report, start_warm_up
+from memory import deep_size, record_session_size
+from metrics import configure_logging, continue_trace, start_metrics_server, timed, trace
+from pipeline import translate_text
+from render import choose_render_mode, page_markup
+from thumbnails import thumbnail_path
+from profiling import is_admin, recent_profiles, hottest_frames, profile_path
 import re
-from streamlit.components.v1 import html
-import ast
 import json
 import uuid
 
+# Seconds between progress checks while an analysis job runs
+ANALYSIS_POLL_SECONDS = 1.0
+# LABELWISE_SHOW_TIMINGS=1 shows how long the page and each section took to render
+SHOW_RERUN_TIMINGS = os.getenv("LABELWISE_SHOW_TIMINGS") == "1"
+
+logger = logging.getLogger(__name__)
+configure_logging()
+
 # Connect to MongoDB
-client = MongoClient(os.getenv("MONGODB_URI"))
-db = client.Health
+db = get_database()
 customer_collection = db.customer
 product_collection = db.product
 
-# Initialize OCR and LlamaIndex models
-reader = easyocr.Reader(['en'])
-embedding_model = HuggingFaceEmbedding(model_name="BAAI/bge-base-en-v1.5")
-llm = MistralAI(api_key=os.getenv("MISTRAL_API_KEY"))
-
-# Set the embedding model and LLM globally
-Settings.embed_model = embedding_model
-Settings.llm = llm
-
 # Function to hash passwords
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
@@ -48,220 +60,110 @@ def calculate_bmi(weight, height):
     bmi = weight / (height_in_meters ** 2)
     return round(bmi, 2)
 
-# Function to correct OCR mistakes
-nutritional_terms = [
-    "calories", "fat", "trans fat", "saturated fat", "cholesterol",
-    "sodium", "carbohydrates", "sugar", "protein", "fiber", "vitamin", "iron"
-]
-
-def correct_ocr_mistakes(text):
-    corrected_text = []
-    for word in text.split():
-        closest_match = difflib.get_close_matches(word.lower(), nutritional_terms, n=1, cutoff=0.7)
-        corrected_text.append(closest_match[0] if closest_match else word)
-    return ' '.join(corrected_text)
-
-# Function to fetch user details
+# Function to fetch user details (cached per session and per process, no password hash)
 def fetch_user_details(email):
-    return customer_collection.find_one({"email": email})
-
-# Function to analyze food label and user profile
-def prepare_data_for_rag(ocr_text, user_profile):
-    documents = [
-        Document(text=f"OCR corrected text from food label: {ocr_text}"),
-        Document(text=f"User Profile: {user_profile}")
-    ]
-    return documents
-
-def analyze_with_llama_index(ocr_text, user_profile):
-    documents = prepare_data_for_rag(ocr_text, user_profile)
-    index = VectorStoreIndex.from_documents(documents)
-
-    query = query = """
-You are tasked with analyzing the contents of a food label and evaluating its healthiness for a specific user.
-
-1. **Health Rating:**
-   - Give Rating in large size text
-   - Based on the corrected food label and the user's dietary preferences, health goals, allergies, and activity level, assign a health rating on a scale from 1 to 10 (where 10 is the healthiest).
-   - If the food contains any ingredients to which the user is allergic (e.g., food contains peanuts and user has a nut allergy), assign a health rating of **0/10** and include a clear warning and also before doing this be double sure that the food has a substance to which the user is allergic .
-   - If the food does not have an allergen to which the user is allergic to and yet the user should avoid the food altogether, assign a rating from 1 to 4.
-   - If the user should consume the food in moderation, assign a rating from 5 to 7.
-   - If the user can consume the food frequently, assign a rating from 8 to 10.
-
-2. **Health Analysis:**
-   - *Detailed Breakdown*: Present a statistical breakdown of the food's nutritional content in bullet format (e.g., "The food contains 2% saturated fat, 12g sugar, and 10g protein"). Ensure all terms and values are correctly spelled and reflect the accurate content of the food item.
-   - *Personalized Evaluation*: Explain why the food item is either good or bad for the user based on their specific health profile. Double check if there actually is an item in food to which user is allergic to.  Identify any ingredients or nutritional aspects that align well or poorly with the user's dietary needs (e.g., "This food is high in sugar, which may not align with your goal of maintaining stable blood sugar levels"). **If the food contains an allergen, make sure to emphasize that.ze the risk for the user.
-   - *Advice*: Provide guidance on whether the user should consume this food frequently, in moderation, or avoid it altogether, considering their health goals, dietary restrictions, and any allergens. **If the food contains an allergen, recommend avoiding it entirely and issue a warning in the conclusion.
-
-if you mention any of the user's allergies or health conditions or health goals dont write them in list format if there is more than one. Just write them in a string.
-Ensure that the output is free from spelling mistakes and important points or warnings are clearly communicated with bold keywords and underline  relevant details.
-"""
-
-    query_engine = index.as_query_engine()
-    response = query_engine.query(query)
-
-    return response.response
-
-# Function for food label analysis
-def analyze_food_label(image_path, email):
-    result = reader.readtext(image_path)
-    ocr_text = ' '.join([res[1] for res in result])
-    corrected_text = correct_ocr_mistakes(ocr_text)
-
-    user = fetch_user_details(email)
-    if user:
-        user_profile = {
-            "BMI": user.get("bmi", "Not provided"),
-            "Allergies": user.get("allergies", []),  # Now a list
-            "Health Conditions": user.get("health_conditions", []),  # Now a list
-            "Dietary Preferences": user.get("dietary_preferences", "None"),
-            "Activity Level": user.get("activity_level", "Moderate"),
-            "Health Goals": user.get("health_goals", ["General well-being"])  # Assuming this is already a list
-        }
-
-        llama_output = analyze_with_llama_index(corrected_text, user_profile)
-        return llama_output
-    else:
-        return None
+    return fetch_user_profile(email, st.session_state)
 
 def update_user_profile(email, updated_data):
-    customer_collection.update_one({"email": email}, {"$set": updated_data})
-
-# Function to translate text using the translate library
-def translate_text(text, target_lang):
-    translator = Translator(to_lang=target_lang)
-    max_length = 500
-    translated_text = ""
-
-    try:
-        # Split the text into chunks of max_length characters
-        chunks = [text[i:i+max_length] for i in range(0, len(text), max_length)]
-
-        # Translate each chunk separately
-        for chunk in chunks:
-            translation = translator.translate(chunk)
-            translated_text += translation
-
-        return translated_text
-    except Exception as e:
-        return f"Translation error: {str(e)}"
-
-def product_exists(product_name, brand_name):
-    existing_product = product_collection.find_one({
-        "Product Name": product_name,
-        "Brand Name": brand_name
-    })
-    return existing_product is not None
-
-# Function to update product database
-def update_product_database(ocr_text, product_type=None, consumption_frequency=None):
-    documents = [Document(text=f"OCR text from food label: {ocr_text}")]
-    index = VectorStoreIndex.from_documents(documents)
-    query_engine = index.as_query_engine()
-
-    query = """
-    You are tasked with correcting and structuring the OCR text from a food label. Please:
-    1. Correct any spelling mistakes or grammatical errors in the OCR text.
-    2. Extract and structure the following information:
-       - Product Name
-       - Brand Name (look for company names following by "manufactured by" or "owned by" or "produced by")
-       - Weight in Grams/ML
-       - Nutritional information: Include the serving size (e.g., "per 100g", "per 200ml") as specified on the label. If multiple serving sizes are given, use the one that provides the most comprehensive nutritional breakdown.
-       - Ingredients
-       - Product Category
-       - Proprietary Claims: Include any claims such as "sugar-free", "low-fat", etc. If no such claims are present, leave this field empty.
-    3. Present the information as a Python dictionary. The 'Nutritional information' should be a nested dictionary with the serving size as the key and the nutritional details as the value. Do not include any additional text, markdown formatting, or code blocks. Just return the dictionary.
-
-    Example format:
-    {
-        "Product Name": "Example Cereal",
-        "Brand Name": "HealthyBrands",
-        "Weight": "500g",
-        "Nutritional information": {
-            "per 100g": {
-                "Energy": "370kcal",
-                "Protein": "8g",
-                "Carbohydrates": "80g",
-                "Fat": "2g"
-            }
-        },
-        "Ingredients": "Whole grain wheat, sugar, salt",
-        "Product Category": "Breakfast Cereal",
-        "Proprietary Claims": "High in fiber, Low in fat"
-    }
-
-    If certain information is not available in the OCR text, use "Not specified" as the value for that key.
-    """
-
-    response = query_engine.query(query)
-    
-    # Extract the dictionary from the response
-    dict_match = re.search(r'\{.*\}', response.response, re.DOTALL)
-    if dict_match:
-        try:
-            product_info = ast.literal_eval(dict_match.group())
-        except:
-            st.error("Failed to parse the AI response. Please try again.")
-            return None
-    else:
-        st.error("Could not extract product information from the AI response. Please try again.")
-        return None
-
-    if product_type and consumption_frequency:
-        product_info['product_type'] = product_type
-        product_info['consumption_frequency'] = consumption_frequency
-
-    return product_info
-
-#Custom CSS
-def local_css(file_name):
-    with open(file_name, "r") as f:
-        st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
-
-def add_video_background():
-    st.markdown("""
-<style>
-body {
-  background-color: transparent !important;
-}
-.reportview-container {
-  background-color: transparent !important;
-}
-.block-container {
-  background-color: transparent !important;
-}
-
-#myVideo {
-  position: fixed;
-  right: 0;
-  bottom: 0;
-  min-width: 100%; 
-  min-height: 100%;
-  z-index: -1;
-}
-
-.content {
-  position: fixed;
-  bottom: 0;
-  background: rgba(0, 0, 0, 0.5);
-  color: #000000;
-  width: 100%;
-  padding: 20px;
-}
-</style>    
-<video autoplay muted loop id="myVideo">
-  <source src="https://www.spinat.fr/wp-content/uploads/2020/11/green-color-powder-explosion-on-black-isolated-bac-A5B68UY.webmhd.mp4" type="video/mp4">
-  Your browser does not support HTML5 video.
-</video>
-""", unsafe_allow_html=True)
-    
+    write_user_profile(email, updated_data, st.session_state)
+    # Past ratings were made for the old profile; refresh them in the background
+    schedule_rerating(email)
+
+def show_score_preview(preview):
+    if not preview:
+        return
+    st.caption(f"Quick nutrient score: {preview['rating']}/10 (grade {preview['grade']}, "
+               f"{preview['coverage']:.0%} of key nutrients found on the label)")
+    check = preview["check"]
+    if check and check["disagrees"]:
+        st.warning(f"The AI rating ({check['llm_rating']}/10) is far from the nutrient score "
+                   f"({check['preview_rating']}/10). Please double-check the label.")
+    if preview["alternatives"]:
+        st.markdown("**Healthier alternatives in the same category:**")
+        for alternative in preview["alternatives"]:
+            st.markdown(f"- {alternative['name']} ({alternative['rating']}/10, grade {alternative['grade']})")
+
+# Function to check on a queued job kept under a session key. Shows its
+# progress while it runs. Returns (result once finished or None, still running);
+# a failed job's result is {"failed": True}.
+def poll_job(state_key):
+    status = analysis_status(st.session_state[state_key], st.session_state.user_email)
+    if status is None or status["status"] == "failed":
+        st.session_state[state_key] = None
+        return {"failed": True, "analysis_result": None}, False
+    if status["status"] == "done":
+        st.session_state[state_key] = None
+        return status["result"], False
+    total = status["total"] or 1
+    st.progress(status["done"] / total, text=status["message"] or "Waiting for a free analyzer...")
+    return None, True
+
+# Function to show a finished basket job's per-item ratings and summary
+def show_basket_result(result):
+    if result.get("failed"):
+        st.error("Error analyzing the basket. Please try again.")
+        return
+    summary = result["summary"]
+    if summary["average_rating"] is not None:
+        st.metric("Basket rating", f"{summary['average_rating']}/10")
+    if summary["allergens"]:
+        st.error(f"Contains your allergens: {', '.join(summary['allergens'])}")
+    for label, names in (("Good to eat often", summary["frequent"]), ("Eat in moderation", summary["moderate"]),
+                         ("Best avoided", summary["avoid"]), ("Could not be rated", summary["unrated"])):
+        if names:
+            st.markdown(f"**{label}:** {', '.join(names)}")
+    for item in result["items"]:
+        rating = f"{item['rating']}/10" if item["rating"] is not None else "no rating"
+        with st.expander(f"{item['name']} ({rating})"):
+            for match in item["allergens"]:
+                label = "may contain traces of" if match["trace"] else "contains"
+                st.warning(f"This product {label} {match['ingredient']} ({match['allergen']} allergy).")
+            st.write(item["analysis"] or "This label was not covered by the analysis. Please analyze it on its own.")
+
+# Function to show a finished analysis job's result (new products are shown
+# by the "Add to Database" form instead)
+def show_analysis_result(result):
+    analysis_result = result["analysis_result"]
+    if not analysis_result:
+        st.error("Error analyzing food label. Please try again.")
+        return
+    if result["previous_at"]:
+        st.caption(f"Your earlier analysis from {result['previous_at']:%d %b %Y}")
+    st.write(analysis_result)
+
+    product_info = result["product_info"]
+    if not product_info:
+        if result["extraction_error"]:
+            st.error(result["extraction_error"])
+        st.error("Failed to extract product information. Please try again.")
+        return
+    show_score_preview(result["score_preview"])
+    if result["product_status"] == "known":
+        st.info(f"This label matches '{product_info.get('Product Name')}', which is already in our database.")
+    elif result["product_status"] == "exists":
+        st.info("This product is already in our database.")
+    elif result["product_status"] == "duplicate":
+        st.info(f"This product looks like '{result['duplicate_name']}', which is already in our database.")
+
+# Function to add the stylesheet and background for this visitor's render
+# mode (see render.py); the markup is built once per process
+def apply_page_style():
+    mode = choose_render_mode(st.context.headers, st.query_params.get("render"))
+    st.markdown(page_markup(mode, st.get_option("server.enableStaticServing")), unsafe_allow_html=True)
 
 # Navigation bar
 def navigation():
+    options = ["Home", "About", "Login", "Register", "History"]
+    icons = ["house", "info-circle", "box-arrow-in-right", "person-plus", "clock-history"]
+    if st.session_state.logged_in and is_admin(st.session_state.user_email):
+        options.append("Profiles")
+        icons.append("speedometer2")
     selected = option_menu(
         menu_title=None,
-        options=["Home", "About", "Login", "Register"],
-        icons=["house", "info-circle", "box-arrow-in-right", "person-plus"],
+        options=options,
+        icons=icons,
+        # Keeps the selection when the admin-only option appears after login
+        key="navigation",
         menu_icon="cast",
         default_index=0,
         orientation="horizontal",
@@ -345,7 +247,7 @@ def login():
     password = st.text_input("Password", type="password", key="login_password")
 
     if st.button("Login"):
-        user = fetch_user_details(email)
+        user = fetch_user_credentials(email)
         if user and check_password(user['password'], password):
             st.session_state.logged_in = True
             st.session_state.user_email = email
@@ -382,7 +284,7 @@ def register():
 
         if submitted:
             # Check if email is already registered
-            existing_user = customer_collection.find_one({"email": email})
+            existing_user = customer_collection.find_one({"email": email}, {"_id": 1})
             if existing_user:
                 st.error("This email is already registered. Please use a different email.")
                 return
@@ -413,7 +315,12 @@ def register():
                     "dietary_preferences": dietary_preferences,
                     "health_goals": health_goals
                 }
-                customer_collection.insert_one(user_data)
+                try:
+                    customer_collection.insert_one(user_data)
+                except DuplicateKeyError:
+                    # Another registration with this email won the race
+                    st.error("This email is already registered. Please use a different email.")
+                    return
                 st.success(f"Registration successful! Your BMI is {bmi}. Please log in.")
                 return True
     return False
@@ -437,10 +344,329 @@ def check_email_exists(email):
     st.write(f"Checking email: {email}")
     st.write(f"User exists: {existing_user is not None}")
     return existing_user is not None
+# Past analyses, read from the analysis collection without recomputing anything
+def history_page():
+    st.subheader("Your Analysis History")
+    status = rerating_status(st.session_state.user_email)
+    if status and status["status"] in ("queued", "running"):
+        total = status["total"] or 0
+        st.progress(status["done"] / total if total else 0.0,
+                    text=status["message"] or "Updating your past ratings for your new profile...")
+    # Cursors of the pages before the current one, for the Previous button
+    if "history_cursors" not in st.session_state:
+        st.session_state.history_cursors = [None]
+    cursor = st.session_state.history_cursors[-1]
+    docs, next_cursor = fetch_history(st.session_state.user_email, cursor)
+    if not docs:
+        st.info("You haven't analysed any food labels yet.")
+        return
+
+    for doc in docs:
+        title = doc.get("product_name") or "Unnamed product"
+        rerated = doc.get("rerated")
+        rating = rerated["rating"] if rerated and rerated["method"] != "llm" else doc.get("rating")
+        rating = f"{rating}/10" if rating is not None else "no rating"
+        with st.expander(f"{doc['created_at']:%d %b %Y, %H:%M} - {title} ({rating})"):
+            if rerated and rerated["method"] != "llm":
+                st.info(f"Re-rated for your current profile: {rerated['rating']}/10 "
+                        f"(was {rerated['previous_rating']}/10). The analysis below was written for your earlier profile.")
+            for match in (rerated or {}).get("allergens", []):
+                label = "may contain traces of" if match["trace"] else "contains"
+                st.warning(f"This product {label} {match['ingredient']} ({match['allergen']} allergy).")
+            st.write(analysis_text(doc))
+            if doc.get("preview_rating") is not None:
+                st.caption(f"Quick nutrient score: {doc['preview_rating']}/10 (grade {doc['grade']})")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        if len(st.session_state.history_cursors) > 1 and st.button("Previous"):
+            st.session_state.history_cursors.pop()
+            st.rerun()
+    with col2:
+        if next_cursor and st.button("Next"):
+            st.session_state.history_cursors.append(next_cursor)
+            st.rerun()
+
+def _megabytes(size):
+    return round(size / 2 ** 20, 1)
+
+# What the process holds in memory and which models account for it, for admins
+def memory_panel():
+    report = memory_report()
+    st.subheader("Memory")
+    budget = f" of a {_megabytes(report['budget_bytes']):.0f} MB budget" if report["budget_bytes"] else ""
+    sessions = report["sessions"]
+    st.write(f"Resident memory {_megabytes(report['rss_bytes']):.0f} MB{budget}. "
+             f"{sessions['sessions']} recent sessions hold about {_megabytes(sessions['total_bytes'])} MB "
+             f"of state (largest {_megabytes(sessions['max_bytes'])} MB).")
+    st.dataframe([{
+        "Model": model["name"],
+        "Loaded": model["loaded"],
+        "Parameters (MB)": _megabytes(model["parameter_bytes"]),
+        "RSS at load (MB)": _megabytes(model["load_rss_bytes"]),
+        "Load (s)": round(model["load_seconds"], 1),
+        "Idle (s)": None if model["idle_seconds"] is None else round(model["idle_seconds"]),
+    } for model in report["models"]], hide_index=True)
+
+# Function to record this session's state size for the memory report
+def record_session_memory():
+    ctx = get_script_run_ctx()
+    if ctx is not None:
+        record_session_size(ctx.session_id, deep_size(st.session_state.to_dict()))
+
+# Memory use, then recent per-request profiles and their hottest frames, for admins
+def profiles_page():
+    memory_panel()
+    st.subheader("Request Profiles")
+    profiles = recent_profiles()
+    if not profiles:
+        st.info("No profiles yet. Tick \"Profile this analysis\" before analyzing a label, "
+                "or set LABELWISE_PROFILE_SAMPLE_RATE.")
+        return
+    st.dataframe([{
+        "Trace ID": profile["trace_id"],
+        "Request": profile["name"],
+        "Started": time.strftime("%d %b %Y %H:%M:%S", time.localtime(profile["started_at"])),
+        "Seconds": round(profile["seconds"], 2),
+        "Samples": profile["samples"],
+    } for profile in profiles], hide_index=True)
+
+    chosen = st.selectbox("Profile", profiles, format_func=lambda profile: f"{profile['trace_id']} "
+                          f"({profile['name']}, {profile['seconds']:.1f} s)")
+    samples = chosen["samples"] or 1
+    st.write("Hottest frames (self: samples in the frame itself; total: including what it called)")
+    st.dataframe([{"Frame": frame, "Self": f"{own / samples:.1%}", "Total": f"{inclusive / samples:.1%}"}
+                  for frame, own, inclusive in hottest_frames(chosen["trace_id"])], hide_index=True)
+    with open(profile_path(chosen["trace_id"]), "rb") as f:
+        st.download_button("Download collapsed stacks (flamegraph.pl, speedscope)", f.read(),
+                           file_name=f"{chosen['trace_id']}.collapsed")
+
+# Per-rerun timing of the page and of each fragment, in milliseconds
+@contextmanager
+def timed_section(name):
+    started = time.perf_counter()
+    try:
+        # A fragment rerun on its own starts a trace of its own
+        with continue_trace(), timed(f"render_{name}"):
+            yield
+    finally:
+        elapsed = (time.perf_counter() - started) * 1000
+        st.session_state.setdefault("rerun_timings", {})[name] = elapsed
+        logger.info("Rendered %s in %.1f ms", name, elapsed)
+
+# Profile editing reruns only this section
+@st.fragment
+def profile_section():
+    with timed_section("profile"):
+        # Profile Update Section
+        st.subheader("Update Your Profile")
+        update_profile = st.checkbox("Edit Profile")
+
+        if update_profile:
+            user = fetch_user_details(st.session_state.user_email)
+        
+            with st.form("profile_update_form"):
+                st.subheader("Update Your Profile")
+            
+                name = st.text_input("Name", value=user.get('name', ''))
+                age = st.number_input("Age", value=user.get('age', 0), min_value=1, max_value=120)
+                height = st.number_input("Height (in cm)", value=user.get('height', 0), min_value=50, max_value=250)
+                weight = st.number_input("Weight (in kg)", value=user.get('weight', 0), min_value=10, max_value=300)
+            
+                # Convert allergies list to string for display
+                allergies_str = ', '.join(user.get('allergies', []))
+                allergies = st.text_area("Allergies (one per line)", value=allergies_str)
+            
+                # Convert health conditions list to string for display
+                health_conditions_str = ', '.join(user.get('health_conditions', []))
+                health_conditions = st.text_area("Health Conditions (one per line)", value=health_conditions_str)
+            
+                activity_level = st.selectbox("Activity Level", ["Low", "Moderate", "High"], 
+                                            index=["Low", "Moderate", "High"].index(user.get('activity_level', 'Moderate')))
+            
+                dietary_preferences = st.selectbox("Dietary Preferences", 
+                                                ["Vegetarian", "Vegan", "Gluten-Free", "Keto", "Paleo", "No preference"], 
+                                                index=["Vegetarian", "Vegan", "Gluten-Free", "Keto", "Paleo", "No preference"].index(user.get('dietary_preferences', 'No preference')))
+            
+                # Convert health goals list to indices for multiselect
+                all_health_goals = ["Lose weight", "Gain muscle", "Maintain weight", "Improve stamina", "General well-being"]
+                user_health_goals = user.get('health_goals', ['General well-being'])
+            
+                # Ensure that user_health_goals only contains valid options
+                valid_user_health_goals = [goal for goal in user_health_goals if goal in all_health_goals]
+            
+                # If no valid goals are found, default to "General well-being"
+                if not valid_user_health_goals:
+                    valid_user_health_goals = ["General well-being"]
+            
+                health_goals = st.multiselect("Health Goals", all_health_goals, default=valid_user_health_goals)
+
+                # Submit button inside the form
+                update_submitted = st.form_submit_button("Update Profile")
+
+                # Form processing outside the form
+                if update_submitted:
+                    bmi = calculate_bmi(weight, height)
+                    updated_data = {
+                        "name": name,
+                        "age": age,
+                        "height": height,
+                        "weight": weight,
+                        "bmi": bmi,
+                        "allergies": [allergy.strip() for allergy in allergies.split('\n') if allergy.strip()],
+                        "health_conditions": [condition.strip() for condition in health_conditions.split('\n') if condition.strip()],
+                        "activity_level": activity_level,
+                        "dietary_preferences": dietary_preferences,
+                        "health_goals": health_goals
+                    }
+                    update_user_profile(st.session_state.user_email, updated_data)
+                    st.success(f"Profile updated successfully! Your new BMI is {bmi}.")
+
+# Function to keep a finished single-label job's result in the session
+def finish_analysis(result):
+    st.session_state.analysis_outcome = None
+    if result["analysis_result"]:
+        st.session_state.analysis_result = result["analysis_result"]
+        st.session_state.score_preview = result["score_preview"]
+    if result["analysis_result"] and result["product_info"] and result["product_status"] == "new":
+        # Shown by the "Add to Database" form instead
+        st.session_state.new_product_info = result["product_info"]
+        st.session_state.new_product_label = result["label_phash"]
+    else:
+        st.session_state.analysis_outcome = result
+
+# Label upload, analysis progress and the "Add to Database" form. The section
+# polls itself only while a job is running.
+def analysis_section():
+    run_every = ANALYSIS_POLL_SECONDS if st.session_state.analysis_job else None
+    st.fragment(_analysis_section, run_every=run_every)()
+
+def _analysis_section():
+    with timed_section("analysis"):
+        st.subheader("Upload Food Label for Analysis")
+
+        product_name_input = st.text_input("Product Name").strip()
+        uploaded_file = st.file_uploader("Upload Food Label Image", type=["jpg", "jpeg", "png"])
+
+        if uploaded_file and product_name_input:
+            # Unique per upload, so a queued job never reads another user's file
+            image_path = os.path.join("temp", f"{uuid.uuid4().hex}_{uploaded_file.name}")
+            st.success(f"Image '{uploaded_file.name}' uploaded successfully!")
+            st.image(thumbnail_path(uploaded_file.getvalue()), caption="Uploaded Food Label", use_column_width=True)
+            profile = is_admin(st.session_state.user_email) and st.checkbox("Profile this analysis")
+
+            if st.button("Analyze Food Label"):
+                os.makedirs("temp", exist_ok=True)
+                with open(image_path, "wb") as f:
+                    f.write(uploaded_file.getbuffer())
+                try:
+                    job = submit_analysis(st.session_state.user_email, image_path, product_name_input, profile)
+                    st.session_state.analysis_job = job.id
+                    st.session_state.analysis_outcome = None
+                    st.session_state.new_product_info = None
+                    # Rerun the page so this section starts polling
+                    st.rerun()
+                except QueueFullError:
+                    st.warning("LabelWise is busy analyzing other labels right now. Please try again in a minute.")
+
+        # The analysis runs on a worker; poll its progress
+        if st.session_state.analysis_job:
+            result, running = poll_job("analysis_job")
+            if not running:
+                finish_analysis(result)
+                # Rerun the page to stop polling and show the translation section
+                st.rerun()
+        elif st.session_state.analysis_outcome:
+            show_analysis_result(st.session_state.analysis_outcome)
+
+        # Handle new product information
+        if st.session_state.new_product_info:
+            st.subheader("Food Label Analysis")
+            st.write(st.session_state.analysis_result)
+            show_score_preview(st.session_state.score_preview)
+
+            st.info("This product is not in our database. Please provide additional information:")
+            with st.form(key='product_info_form'):
+                product_type = st.selectbox("Product Type", ["Nutritional", "Regular", "Recreational"])
+                consumption_frequency = st.selectbox("Consumption Frequency", ["Daily", "Weekly", "Monthly"])
+                submit_button = st.form_submit_button(label='Add to Database')
+        
+            if submit_button:
+                st.session_state.new_product_info['product_type'] = product_type
+                st.session_state.new_product_info['consumption_frequency'] = consumption_frequency
+                inserted = upsert_product(st.session_state.new_product_info)
+                # Either way the product is in the database now
+                link_label(st.session_state.new_product_label, st.session_state.new_product_info["product_key"])
+                if inserted:
+                    index_product(st.session_state.new_product_info, embed_text)
+                    get_duplicate_index().add(st.session_state.new_product_info["product_key"], st.session_state.new_product_info)
+                    st.success("Thank you for contributing! Product information successfully added to the database.")
+                else:
+                    st.info("This product is already in our database. Thank you for your contribution!")
+                st.session_state.new_product_info = None
+                st.rerun()
+
+# Shopping basket: many labels analysed together
+def basket_section():
+    run_every = ANALYSIS_POLL_SECONDS if st.session_state.basket_job else None
+    st.fragment(_basket_section, run_every=run_every)()
+
+def _basket_section():
+    with timed_section("basket"):
+        st.subheader("Analyze a Shopping Basket")
+        basket_files = st.file_uploader("Upload several food labels", type=["jpg", "jpeg", "png"],
+                                        accept_multiple_files=True, key="basket_files")
+        profile = is_admin(st.session_state.user_email) and st.checkbox("Profile this basket")
+        if len(basket_files or []) > BASKET_MAX_ITEMS:
+            st.warning(f"Please upload at most {BASKET_MAX_ITEMS} labels at a time.")
+        elif basket_files and st.button("Analyze Basket"):
+            os.makedirs("temp", exist_ok=True)
+            items = []
+            for basket_file in basket_files:
+                path = os.path.join("temp", f"{uuid.uuid4().hex}_{basket_file.name}")
+                with open(path, "wb") as f:
+                    f.write(basket_file.getbuffer())
+                items.append((path, os.path.splitext(basket_file.name)[0]))
+            try:
+                st.session_state.basket_job = submit_basket(st.session_state.user_email, items, profile).id
+                st.session_state.basket_outcome = None
+                st.rerun()
+            except QueueFullError:
+                st.warning("LabelWise is busy analyzing other labels right now. Please try again in a minute.")
+        if st.session_state.basket_job:
+            result, running = poll_job("basket_job")
+            if not running:
+                st.session_state.basket_outcome = result
+                st.rerun()
+        elif st.session_state.basket_outcome:
+            show_basket_result(st.session_state.basket_outcome)
+
+# Translating reruns only this section
+@st.fragment
+def translation_section():
+    with timed_section("translation"):
+        # Translation Section
+        if st.session_state.analysis_result:
+            st.subheader("Translate Analysis")
+            languages = {
+                "Hindi": "hi", "Bengali": "bn", "Telugu": "te", "Marathi": "mr", "Tamil": "ta",
+                "Urdu": "ur", "Gujarati": "gu", "Kannada": "kn", "Odia": "or", "Malayalam": "ml",
+                "Spanish": "es", "French": "fr", "German": "de", "Chinese": "zh", "Japanese": "ja"
+            }
+            target_lang = st.selectbox("Select language for translation:", list(languages.keys()))
+
+            if st.button("Translate"):
+                with st.spinner("Translating..."):
+                    translated_result = translate_text(st.session_state.analysis_result, languages[target_lang])
+                    if translated_result.startswith("Translation error"):
+                        st.error(translated_result)
+                    else:
+                        st.subheader(f"Translated Analysis ({target_lang}):")
+                        st.write(translated_result)
+
 def main():
     st.set_page_config(layout="wide", page_icon="🥑")
-    add_video_background()
-    local_css("style.css")
+    apply_page_style()
     
 
     # Initialize session state variables
@@ -454,6 +680,16 @@ def main():
         st.session_state.analysis_result = None
     if "new_product_info" not in st.session_state:
         st.session_state.new_product_info = None
+    if "score_preview" not in st.session_state:
+        st.session_state.score_preview = None
+    if "analysis_job" not in st.session_state:
+        st.session_state.analysis_job = None
+    if "basket_job" not in st.session_state:
+        st.session_state.basket_job = None
+    if "analysis_outcome" not in st.session_state:
+        st.session_state.analysis_outcome = None
+    if "basket_outcome" not in st.session_state:
+        st.session_state.basket_outcome = None
     if "show_steps" not in st.session_state:
         st.session_state.show_steps = False
     if "show_about" not in st.session_state:
@@ -482,168 +718,50 @@ def main():
             login()
         elif selected == "Register":
             register()
+        elif selected == "History":
+            st.info("Please log in to see your analysis history.")
     else:
         if selected == "Home":
             home()
         elif selected == "About":
             about()
+        elif selected == "History":
+            history_page()
+        elif selected == "Profiles":
+            profiles_page()
         else:
             st.success(f"Welcome back, {st.session_state.user_email}!")
             
-            # Profile Update Section
-            st.subheader("Update Your Profile")
-            update_profile = st.checkbox("Edit Profile")
-
-            if update_profile:
-                user = fetch_user_details(st.session_state.user_email)
-                
-                with st.form("profile_update_form"):
-                    st.subheader("Update Your Profile")
-                    
-                    name = st.text_input("Name", value=user.get('name', ''))
-                    age = st.number_input("Age", value=user.get('age', 0), min_value=1, max_value=120)
-                    height = st.number_input("Height (in cm)", value=user.get('height', 0), min_value=50, max_value=250)
-                    weight = st.number_input("Weight (in kg)", value=user.get('weight', 0), min_value=10, max_value=300)
-                    
-                    # Convert allergies list to string for display
-                    allergies_str = ', '.join(user.get('allergies', []))
-                    allergies = st.text_area("Allergies (one per line)", value=allergies_str)
-                    
-                    # Convert health conditions list to string for display
-                    health_conditions_str = ', '.join(user.get('health_conditions', []))
-                    health_conditions = st.text_area("Health Conditions (one per line)", value=health_conditions_str)
-                    
-                    activity_level = st.selectbox("Activity Level", ["Low", "Moderate", "High"], 
-                                                index=["Low", "Moderate", "High"].index(user.get('activity_level', 'Moderate')))
-                    
-                    dietary_preferences = st.selectbox("Dietary Preferences", 
-                                                    ["Vegetarian", "Vegan", "Gluten-Free", "Keto", "Paleo", "No preference"], 
-                                                    index=["Vegetarian", "Vegan", "Gluten-Free", "Keto", "Paleo", "No preference"].index(user.get('dietary_preferences', 'No preference')))
-                    
-                    # Convert health goals list to indices for multiselect
-                    all_health_goals = ["Lose weight", "Gain muscle", "Maintain weight", "Improve stamina", "General well-being"]
-                    user_health_goals = user.get('health_goals', ['General well-being'])
-                    
-                    # Ensure that user_health_goals only contains valid options
-                    valid_user_health_goals = [goal for goal in user_health_goals if goal in all_health_goals]
-                    
-                    # If no valid goals are found, default to "General well-being"
-                    if not valid_user_health_goals:
-                        valid_user_health_goals = ["General well-being"]
-                    
-                    health_goals = st.multiselect("Health Goals", all_health_goals, default=valid_user_health_goals)
-
-                    # Submit button inside the form
-                    update_submitted = st.form_submit_button("Update Profile")
-
-                    # Form processing outside the form
-                    if update_submitted:
-                        bmi = calculate_bmi(weight, height)
-                        updated_data = {
-                            "name": name,
-                            "age": age,
-                            "height": height,
-                            "weight": weight,
-                            "bmi": bmi,
-                            "allergies": [allergy.strip() for allergy in allergies.split('\n') if allergy.strip()],
-                            "health_conditions": [condition.strip() for condition in health_conditions.split('\n') if condition.strip()],
-                            "activity_level": activity_level,
-                            "dietary_preferences": dietary_preferences,
-                            "health_goals": health_goals
-                        }
-                        update_user_profile(st.session_state.user_email, updated_data)
-                        st.success(f"Profile updated successfully! Your new BMI is {bmi}.")
-                        st.rerun()
-
-            # Food Label Analysis Section
-            st.subheader("Upload Food Label for Analysis")
-
-            product_name_input = st.text_input("Product Name").lower()
-            uploaded_file = st.file_uploader("Upload Food Label Image", type=["jpg", "jpeg", "png"])
-
-            if uploaded_file and product_name_input:
-                image_path = os.path.join("temp", uploaded_file.name)
-                os.makedirs("temp", exist_ok=True)
-                with open(image_path, "wb") as f:
-                    f.write(uploaded_file.getbuffer())
-
-                st.success(f"Image '{uploaded_file.name}' uploaded successfully!")
-
-                if st.button("Analyze Food Label"):
-                    with st.spinner("Analyzing food label..."):
-                        result = reader.readtext(image_path)
-                        ocr_text = ' '.join([res[1] for res in result])
-
-                        analysis_result = analyze_food_label(image_path, st.session_state.user_email)
-                        if analysis_result:
-                            st.session_state.analysis_result = analysis_result
-                            st.write(analysis_result)
-
-                            product_info = update_product_database(ocr_text)
-                            if product_info:
-                                product_info["Product Name"] = product_name_input
-                                brand_name = product_info.get("Brand Name", "Not specified")
-
-                                if not product_exists(product_name_input, brand_name):
-                                    st.session_state.new_product_info = product_info
-                                    st.rerun()
-                                else:
-                                    st.info("This product is already in our database.")
-                            else:
-                                st.error("Failed to extract product information. Please try again.")
-                        else:
-                            st.error("Error analyzing food label. Please try again.")
-
-            # Handle new product information
-            if st.session_state.new_product_info:
-                st.subheader("Food Label Analysis")
-                st.write(st.session_state.analysis_result)
-
-                st.info("This product is not in our database. Please provide additional information:")
-                with st.form(key='product_info_form'):
-                    product_type = st.selectbox("Product Type", ["Nutritional", "Regular", "Recreational"])
-                    consumption_frequency = st.selectbox("Consumption Frequency", ["Daily", "Weekly", "Monthly"])
-                    submit_button = st.form_submit_button(label='Add to Database')
-                
-                if submit_button:
-                    st.session_state.new_product_info['product_type'] = product_type
-                    st.session_state.new_product_info['consumption_frequency'] = consumption_frequency
-                    product_collection.insert_one(st.session_state.new_product_info)
-                    st.success("Thank you for contributing! Product information successfully added to the database.")
-                    st.session_state.new_product_info = None
-                    st.rerun()
-
-            # Translation Section
-            if st.session_state.analysis_result:
-                st.subheader("Translate Analysis")
-                languages = {
-                    "Hindi": "hi", "Bengali": "bn", "Telugu": "te", "Marathi": "mr", "Tamil": "ta",
-                    "Urdu": "ur", "Gujarati": "gu", "Kannada": "kn", "Odia": "or", "Malayalam": "ml",
-                    "Spanish": "es", "French": "fr", "German": "de", "Chinese": "zh", "Japanese": "ja"
-                }
-                target_lang = st.selectbox("Select language for translation:", list(languages.keys()))
+            profile_section()
+            analysis_section()
+            basket_section()
+            translation_section()
 
-                if st.button("Translate"):
-                    with st.spinner("Translating..."):
-                        translated_result = translate_text(st.session_state.analysis_result, languages[target_lang])
-                        if translated_result.startswith("Translation error"):
-                            st.error(translated_result)
-                        else:
-                            st.subheader(f"Translated Analysis ({target_lang}):")
-                            st.write(translated_result)
+        if SHOW_RERUN_TIMINGS and st.session_state.get("rerun_timings"):
+            st.caption("Render times: " + ", ".join(f"{name} {ms:.0f} ms"
+                                                    for name, ms in st.session_state.rerun_timings.items()))
 
         # Logout button
         if st.button("Logout"):
+            clear_session_profiles(st.session_state)
             st.session_state.logged_in = False
             st.session_state.user_email = None
             st.session_state.analysis_result = None
             st.session_state.new_product_info = None
+            st.session_state.score_preview = None
+            st.session_state.analysis_job = None
+            st.session_state.basket_job = None
+            st.session_state.analysis_outcome = None
+            st.session_state.basket_outcome = None
+            st.session_state.pop("history_cursors", None)
             st.rerun()
 
 
 if __name__ == "__main__":
-    main()
-favicon_html = """
-    <link rel="icon" href="data:image/svg+xml,<svg xmlns=%22http://www.w3.org/2000/svg%22 viewBox=%220 0 100 100%22><text y=%22.9em%22 font-size=%2290%22>🥑</text></svg>">
-"""
-html(favicon_html)
+    # Each page run is one trace; jobs it queues log under the same ID
+    with trace(), timed_section("page"):
+        main()
+    record_session_memory()
+    # The page has rendered; load the models for the first analysis in the background
+    start_warm_up()
+    start_metrics_server()
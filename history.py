@@ -0,0 +1,81 @@
+import hashlib
+import json
+import zlib
+from datetime import datetime, timezone
+from bson import Binary
+from pymongo import DESCENDING
+from database import get_database
+from profiles import ANALYSIS_FIELDS
+from scoring import extract_llm_rating
+
+db = get_database()
+analysis_collection = db.analysis
+
+HISTORY_PAGE_SIZE = 10
+
+
+# Function to fingerprint the profile fields an analysis depends on, so a
+# stored result can be matched to the profile it was computed for
+def profile_fingerprint(user_profile):
+    fields = {field: (user_profile or {}).get(field) for field in ANALYSIS_FIELDS}
+    encoded = json.dumps(fields, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+def compress_text(text):
+    return Binary(zlib.compress((text or "").encode("utf-8"), 6))
+
+
+def analysis_text(doc):
+    if not doc or doc.get("body") is None:
+        return None
+    return zlib.decompress(doc["body"]).decode("utf-8")
+
+
+# Function to store one analysis result. timings maps stage name to seconds.
+def record_analysis(email, analysis_result, user_profile, product_key=None, product_name=None,
+                    preview=None, timings=None):
+    doc = {
+        "email": email,
+        "product_key": product_key,
+        "product_name": product_name,
+        "profile_fingerprint": profile_fingerprint(user_profile),
+        "rating": extract_llm_rating(analysis_result),
+        "preview_rating": preview["rating"] if preview else None,
+        "grade": preview["grade"] if preview else None,
+        "timings": {stage: round(seconds, 3) for stage, seconds in (timings or {}).items()},
+        "body": compress_text(analysis_result),
+        "created_at": datetime.now(timezone.utc),
+    }
+    return analysis_collection.insert_one(doc).inserted_id
+
+
+# Function to fetch the user's latest analysis of a product for an unchanged
+# profile, or None
+def find_previous_analysis(email, product_key, user_profile):
+    return analysis_collection.find_one(
+        {"email": email, "product_key": product_key, "profile_fingerprint": profile_fingerprint(user_profile)},
+        sort=[("created_at", DESCENDING), ("_id", DESCENDING)]
+    )
+
+
+# Function to fetch one page of a user's history, newest first. Pages are
+# keyed on the last (created_at, _id) seen rather than skipped over, so
+# later pages cost the same as the first.
+# Returns (documents, cursor for the next page or None).
+def fetch_history(email, after=None, limit=HISTORY_PAGE_SIZE):
+    query = {"email": email}
+    if after:
+        created_at, last_id = after
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": last_id}},
+        ]
+    docs = list(analysis_collection.find(query)
+                .sort([("created_at", DESCENDING), ("_id", DESCENDING)])
+                .limit(limit + 1))
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = (docs[-1]["created_at"], docs[-1]["_id"])
+    return docs, next_cursor
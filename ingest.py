@@ -0,0 +1,262 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from models import embed_text
+from pipeline import run_ocr, extract_product_info, ProductExtractionError
+from products import product_collection, product_upsert_spec
+from recommend import get_index, index_product
+from scoring import SCORE_COLUMNS
+from dedupe import find_duplicate, get_duplicate_index
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+DUPLICATE_KEY_ERROR = 11000
+
+
+# Function to list label images from directories, CSV manifests
+# (path,product_type,consumption_frequency) or plain one-path-per-line manifests
+def collect_items(sources, product_type=None, consumption_frequency=None):
+    for source in sources:
+        extension = os.path.splitext(source)[1].lower()
+        if os.path.isdir(source):
+            for root, dirs, files in os.walk(source):
+                dirs.sort()
+                for name in sorted(files):
+                    if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                        yield {"path": os.path.join(root, name), "product_type": product_type,
+                               "consumption_frequency": consumption_frequency}
+        elif extension in IMAGE_EXTENSIONS:
+            yield {"path": source, "product_type": product_type, "consumption_frequency": consumption_frequency}
+        elif extension == ".csv":
+            base = os.path.dirname(source)
+            with open(source, newline="") as f:
+                for row in csv.DictReader(f):
+                    yield {"path": os.path.join(base, row["path"]),
+                           "product_type": row.get("product_type") or product_type,
+                           "consumption_frequency": row.get("consumption_frequency") or consumption_frequency}
+        else:
+            base = os.path.dirname(source)
+            with open(source) as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith("#"):
+                        yield {"path": os.path.join(base, line), "product_type": product_type,
+                               "consumption_frequency": consumption_frequency}
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Append-only record of finished images, keyed by content hash, so a crashed
+# or interrupted run resumes where it stopped
+class Checkpoint:
+    def __init__(self, path):
+        self.path = path
+        self.status = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A partial last line from a crash
+                        continue
+                    self.status[entry["sha256"]] = entry["status"]
+
+    def is_done(self, digest, retry_failed=False):
+        status = self.status.get(digest)
+        return status in ("ok", "duplicate") or (status == "failed" and not retry_failed)
+
+    def record(self, entries):
+        if not entries:
+            return
+        with open(self.path, "a") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+                self.status[entry["sha256"]] = entry["status"]
+            f.flush()
+            os.fsync(f.fileno())
+
+
+# Function to run OCR, extraction and key normalisation for one image
+def process_item(item, checkpoint, retry_failed):
+    try:
+        entry = {"path": item["path"], "sha256": file_digest(item["path"])}
+    except OSError as e:
+        # Unreadable files are keyed by path so they still show up in the checkpoint
+        entry = {"path": item["path"], "sha256": "path:" + item["path"], "status": "failed", "error": str(e)}
+        return entry, None, {"status": "failed"}
+    if checkpoint.is_done(entry["sha256"], retry_failed):
+        return entry, None, {"status": "skipped"}
+
+    timings = {"status": "ok"}
+    try:
+        started = time.perf_counter()
+        ocr_text = run_ocr(item["path"])
+        timings["ocr"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        product_info = extract_product_info(ocr_text, item["product_type"], item["consumption_frequency"])
+        timings["extract"] = time.perf_counter() - started
+    except ProductExtractionError as e:
+        entry.update(status="failed", error=str(e))
+        return entry, None, {"status": "failed"}
+    except Exception as e:
+        entry.update(status="failed", error=f"{type(e).__name__}: {e}")
+        return entry, None, {"status": "failed"}
+
+    key_filter, update = product_upsert_spec(product_info)
+    entry.update(status="ok", product_key=key_filter["product_key"])
+    return entry, (key_filter, update), timings
+
+
+class Ingester:
+    def __init__(self, checkpoint, batch_size=100, workers=4, retry_failed=False):
+        self.checkpoint = checkpoint
+        self.batch_size = batch_size
+        self.workers = workers
+        self.retry_failed = retry_failed
+        self.operations = []
+        self.documents = []
+        self.entries = []
+        self.embed = None
+        self.stats = {"processed": 0, "inserted": 0, "existing": 0, "duplicates": 0, "failed": 0, "skipped": 0,
+                      "bulk_writes": 0, "ocr_seconds": 0.0, "extract_seconds": 0.0}
+
+    def run(self, items):
+        started = time.perf_counter()
+        pending = set()
+        # Not a with block: leaving one waits for every queued label, even
+        # after Ctrl-C
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            for item in items:
+                # Keep a bounded number of images in flight
+                if len(pending) >= self.workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    self.collect(done)
+                pending.add(executor.submit(process_item, item, self.checkpoint, self.retry_failed))
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                self.collect(done)
+        except KeyboardInterrupt:
+            print("Interrupted; saving finished work to the checkpoint.", file=sys.stderr)
+            # Labels not started are dropped; those being read are finished and kept
+            executor.shutdown(wait=True, cancel_futures=True)
+            self.collect([future for future in pending if not future.cancelled()])
+            raise
+        finally:
+            executor.shutdown(wait=True)
+            self.flush()
+            self.stats["elapsed_seconds"] = time.perf_counter() - started
+        return self.stats
+
+    def collect(self, futures):
+        for future in futures:
+            entry, spec, timings = future.result()
+            status = timings["status"]
+            if status == "skipped":
+                self.stats["skipped"] += 1
+                continue
+            self.stats["processed"] += 1
+            if status == "failed":
+                self.stats["failed"] += 1
+                self.checkpoint.record([entry])
+                continue
+            self.stats["ocr_seconds"] += timings["ocr"]
+            self.stats["extract_seconds"] += timings["extract"]
+            key_filter, update = spec
+            document = update["$setOnInsert"]
+            duplicate = find_duplicate(document, exclude_key=key_filter["product_key"])
+            if duplicate:
+                # Near-duplicate of a stored (or already queued) product
+                self.stats["duplicates"] += 1
+                entry.update(status="duplicate", duplicate_of=duplicate["product_key"])
+                self.checkpoint.record([entry])
+                continue
+            get_duplicate_index().add(key_filter["product_key"], document)
+            self.operations.append(UpdateOne(key_filter, update, upsert=True))
+            self.documents.append(document)
+            self.entries.append(entry)
+            if len(self.operations) >= self.batch_size:
+                self.flush()
+
+    # Function to write the current batch with one bulk_write and checkpoint it
+    def flush(self):
+        if not self.operations:
+            return
+        failed_indexes = set()
+        try:
+            result = product_collection.bulk_write(self.operations, ordered=False)
+            inserted = result.upserted_count
+            upserted = list(result.upserted_ids)
+        except BulkWriteError as e:
+            details = e.details
+            inserted = details.get("nUpserted", 0)
+            upserted = [item["index"] for item in details.get("upserted", [])]
+            for error in details.get("writeErrors", []):
+                # A concurrent insert of the same key means the product exists
+                if error.get("code") != DUPLICATE_KEY_ERROR:
+                    failed_indexes.add(error["index"])
+                    self.entries[error["index"]].update(status="failed", error=error.get("errmsg"))
+        self.stats["bulk_writes"] += 1
+        self.stats["inserted"] += inserted
+        self.stats["failed"] += len(failed_indexes)
+        self.stats["existing"] += len(self.operations) - inserted - len(failed_indexes)
+        self.checkpoint.record(self.entries)
+        # Newly inserted products become available to recommendations
+        for position in upserted:
+            index_product(self.documents[position], self.embed)
+        self.operations = []
+        self.documents = []
+        self.entries = []
+
+
+def print_stats(stats):
+    elapsed = stats["elapsed_seconds"]
+    succeeded = stats["processed"] - stats["failed"]
+    print(f"Processed {stats['processed']} image(s) in {elapsed:.1f}s "
+          f"({stats['processed'] / elapsed if elapsed else 0:.2f} images/s)")
+    print(f"  inserted: {stats['inserted']}, already in database: {stats['existing']}, "
+          f"likely duplicates: {stats['duplicates']}, failed: {stats['failed']}, skipped from checkpoint: {stats['skipped']}")
+    print(f"  bulk writes: {stats['bulk_writes']}")
+    if succeeded:
+        print(f"  mean OCR time: {stats['ocr_seconds'] / succeeded:.2f}s, "
+              f"mean extraction time: {stats['extract_seconds'] / succeeded:.2f}s")
+
+
+# python ingest.py labels/ manifest.csv --workers 4 --batch-size 100
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-load food label images into the product database")
+    parser.add_argument("sources", nargs="+", help="image directories, image files or manifests (.csv or one path per line)")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--checkpoint", default=".ingest_checkpoint.jsonl")
+    parser.add_argument("--retry-failed", action="store_true", help="process images that failed in an earlier run")
+    parser.add_argument("--product-type", choices=["Nutritional", "Regular", "Recreational"])
+    parser.add_argument("--consumption-frequency", choices=["Daily", "Weekly", "Monthly"])
+    args = parser.parse_args()
+
+    ingester = Ingester(Checkpoint(args.checkpoint), args.batch_size, args.workers, args.retry_failed)
+    if get_index().dimension != len(SCORE_COLUMNS):
+        # Match the recommendation index, which includes text embeddings unless
+        # it was built with --no-embeddings
+        ingester.embed = embed_text
+    items = collect_items(args.sources, args.product_type, args.consumption_frequency)
+    try:
+        stats = ingester.run(items)
+    except KeyboardInterrupt:
+        print_stats(ingester.stats)
+        sys.exit(130)
+    print_stats(stats)
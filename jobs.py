@@ -0,0 +1,271 @@
+import logging
+import queue
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime, timezone
+from bson.errors import InvalidDocument
+from pymongo.errors import PyMongoError
+from metrics import Gauge, Histogram, current_trace_id, trace
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+# Finished jobs stay readable in memory this long, then are dropped
+FINISHED_JOB_SECONDS = 3600
+
+
+job_seconds = Histogram("labelwise_job_seconds", "Time jobs take to run", ["queue", "kind", "status"])
+job_wait_seconds = Histogram("labelwise_job_wait_seconds", "Time jobs wait in the queue", ["queue", "kind"])
+queue_depth = Gauge("labelwise_job_queue_depth", "Jobs waiting in each queue", ["queue"])
+
+
+# Raised by submit when the queue is at its maximum depth
+class QueueFullError(Exception):
+    pass
+
+
+# One unit of background work. The function receives the job first so it can
+# report progress.
+class Job:
+    def __init__(self, kind, func, args=(), kwargs=None, key=None, owner=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.key = key
+        self.owner = owner
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.status = QUEUED
+        self.done = 0
+        self.total = None
+        self.message = None
+        self.result = None
+        self.error = None
+        self.error_type = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.store = None
+        # Logs from the worker carry the trace ID of the request that queued it
+        self.trace_id = current_trace_id()
+
+    def progress(self, done, total=None, message=None):
+        self.done = done
+        if total is not None:
+            self.total = total
+        if message is not None:
+            self.message = message
+        if self.store is not None:
+            self.store.save(self)
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED)
+
+    def to_dict(self):
+        return {
+            "id": self.id, "kind": self.kind, "key": self.key, "owner": self.owner, "status": self.status,
+            "done": self.done, "total": self.total, "message": self.message, "result": self.result,
+            "error": self.error, "error_type": self.error_type, "created_at": self.created_at, "started_at": self.started_at,
+            "finished_at": self.finished_at, "trace_id": self.trace_id,
+        }
+
+
+# In-process broker for single-node use: a bounded FIFO shared by the
+# workers of one JobQueue. Another broker needs the same put/get methods,
+# with put raising queue.Full when it cannot take more work.
+class LocalBroker:
+    def __init__(self, max_depth=0):
+        self._queue = queue.Queue(maxsize=max_depth)
+
+    def put(self, job):
+        self._queue.put(job, block=False)
+
+    def get(self):
+        return self._queue.get()
+
+    def depth(self):
+        return self._queue.qsize()
+
+
+# Function to copy a job result into something BSON can hold: sets and
+# tuples become lists, keys strings, and unknown types their str()
+def bson_safe(value):
+    if isinstance(value, dict):
+        return {str(key): bson_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [bson_safe(item) for item in value]
+    if value is None or isinstance(value, (str, int, float, bool, datetime, bytes)):
+        return value
+    return str(value)
+
+
+# Persists job state to a MongoDB collection so any page (or a restarted
+# server) can read a job's progress and result
+class JobStore:
+    def __init__(self, collection):
+        self.collection = collection
+
+    # Function to write the job's state; returns False when it could not
+    def save(self, job):
+        state = job.to_dict()
+        state["_id"] = state.pop("id")
+        state["updated_at"] = datetime.now(timezone.utc)
+        try:
+            try:
+                self.collection.replace_one({"_id": job.id}, state, upsert=True)
+            except InvalidDocument:
+                # A result BSON can't encode, such as a set from the LLM's dictionary
+                state["result"] = bson_safe(state["result"])
+                self.collection.replace_one({"_id": job.id}, state, upsert=True)
+        except (PyMongoError, InvalidDocument) as e:
+            # Progress is advisory; the job itself keeps running
+            logger.warning("Could not persist job %s: %s", job.id, e)
+            return False
+        return True
+
+    def discard(self, job_id):
+        try:
+            self.collection.delete_one({"_id": job_id})
+        except PyMongoError as e:
+            logger.warning("Could not remove job %s: %s", job_id, e)
+
+    def load(self, job_id):
+        state = self.collection.find_one({"_id": job_id})
+        if state:
+            state["id"] = state.pop("_id")
+        return state
+
+    # Function to mark jobs left unfinished by an earlier process as failed;
+    # a local broker loses its queue when the process exits
+    def fail_interrupted(self, *kinds):
+        self.collection.update_many(
+            {"kind": {"$in": list(kinds)}, "status": {"$in": [QUEUED, RUNNING]}},
+            {"$set": {"status": FAILED, "error": "Interrupted by a server restart",
+                      "updated_at": datetime.now(timezone.utc)}}
+        )
+
+
+# Job queue served by a pool of daemon worker threads
+class JobQueue:
+    def __init__(self, workers=1, name="jobs", max_depth=0, broker=None, store=None):
+        self.name = name
+        self.broker = broker or LocalBroker(max_depth)
+        self.store = store
+        self._jobs = {}
+        self._latest = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        for number in range(workers):
+            thread = threading.Thread(target=self._work, name=f"{name}-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    # Function to queue func(job, *args, **kwargs). A job with the same key
+    # that has not started yet is returned instead of queueing a second one.
+    # Raises QueueFullError when the broker is at its maximum depth.
+    def submit(self, kind, func, *args, key=None, owner=None, **kwargs):
+        with self._lock:
+            if key is not None:
+                pending = self._latest.get(key)
+                if pending is not None and pending.status == QUEUED:
+                    return pending
+            job = Job(kind, func, args, kwargs, key, owner)
+            job.store = self.store
+            # Saved before a worker can pick it up, so the queued state never
+            # overwrites a later one
+            if self.store is not None:
+                self.store.save(job)
+            try:
+                self.broker.put(job)
+            except queue.Full:
+                if self.store is not None:
+                    self.store.discard(job.id)
+                raise QueueFullError(f"{self.name} queue is full ({self.depth()} waiting)")
+            self._jobs[job.id] = job
+            if key is not None:
+                self._latest[key] = job
+        queue_depth.set(self.depth(), queue=self.name)
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    # Function to return a job's state, from memory or from the job store
+    def status(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        return self.store.load(job_id) if self.store is not None else None
+
+    # Function to return the most recent job submitted with this key
+    def latest(self, key):
+        return self._latest.get(key)
+
+    def depth(self):
+        return self.broker.depth()
+
+    def _work(self):
+        while True:
+            job = self.broker.get()
+            queue_depth.set(self.depth(), queue=self.name)
+            job.status = RUNNING
+            job.started_at = time.time()
+            job_wait_seconds.observe(job.started_at - job.created_at, queue=self.name, kind=job.kind)
+            if self.store is not None:
+                self.store.save(job)
+            with trace(job.trace_id):
+                try:
+                    job.result = job.func(job, *job.args, **job.kwargs)
+                    job.status = DONE
+                except Exception as e:
+                    job.error = str(e)
+                    job.error_type = type(e).__name__
+                    job.status = FAILED
+                    logger.error("Job %s (%s) failed:\n%s", job.id, job.kind, traceback.format_exc())
+                finally:
+                    job.finished_at = time.time()
+                    job_seconds.observe(job.finished_at - job.started_at, queue=self.name, kind=job.kind,
+                                        status=job.status)
+                    saved = False
+                    try:
+                        if self.store is not None:
+                            saved = self.store.save(job)
+                    except Exception:
+                        # The worker must outlive anything a job leaves behind
+                        logger.exception("Could not save job %s", job.id)
+                    if saved and job.key is None:
+                        # Served from the store from here on; a job the store
+                        # didn't take stays in memory until it is pruned
+                        with self._lock:
+                            self._jobs.pop(job.id, None)
+                    self._prune()
+
+    # Function to forget jobs finished more than FINISHED_JOB_SECONDS ago, so
+    # a queue without a store doesn't keep every job it ever ran
+    def _prune(self):
+        cutoff = time.time() - FINISHED_JOB_SECONDS
+        with self._lock:
+            for jobs in (self._jobs, self._latest):
+                for key, job in list(jobs.items()):
+                    if job.finished and job.finished_at < cutoff:
+                        del jobs[key]
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+# Process-wide queue for background maintenance work
+def get_job_queue():
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = JobQueue(workers=1, name="background")
+    return _queue
@@ -0,0 +1,136 @@
+import os
+import threading
+from datetime import datetime, timezone
+import numpy as np
+from PIL import Image, ImageOps
+from database import get_database
+from products import normalise_text
+
+db = get_database()
+label_hash_collection = db.label_hash
+
+HASH_SIZE = 8
+IMAGE_SIZE = 32
+# Largest Hamming distance (out of 64 bits) still treated as the same label
+MAX_DISTANCE = int(os.getenv("LABEL_HASH_MAX_DISTANCE", "8"))
+
+
+def _dct_matrix(size):
+    matrix = np.zeros((size, size))
+    for k in range(size):
+        scale = np.sqrt((1 if k == 0 else 2) / size)
+        for n in range(size):
+            matrix[k, n] = scale * np.cos(np.pi * (2 * n + 1) * k / (2 * size))
+    return matrix
+
+
+_DCT = _dct_matrix(IMAGE_SIZE)
+
+
+# Function to compute a 64-bit perceptual hash (pHash) of a label photo.
+# It survives re-encoding, resizing and small changes in framing or lighting.
+def perceptual_hash(image_path):
+    with Image.open(image_path) as image:
+        image = ImageOps.exif_transpose(image).convert("L").resize((IMAGE_SIZE, IMAGE_SIZE), Image.LANCZOS)
+        pixels = np.asarray(image, dtype=np.float64)
+    frequencies = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE].flatten()
+    # Skip the DC term, which only reflects overall brightness
+    bits = frequencies > np.median(frequencies[1:])
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def hamming(left, right):
+    return bin(left ^ right).count("1")
+
+
+# Bits set in every byte value, for a vectorised popcount
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+# Index of 64-bit hashes searched by Hamming distance. A vectorised XOR and
+# popcount over every stored hash is faster than a BK-tree at these radii,
+# where a BK-tree ends up visiting most of its nodes.
+class HashIndex:
+    def __init__(self):
+        self.hashes = np.zeros(0, dtype=np.uint64)
+        self.items = []
+        self.size = 0
+        self._lock = threading.Lock()
+
+    def add(self, value, item):
+        with self._lock:
+            if self.size == len(self.hashes):
+                grown = np.zeros(max(64, self.size * 2), dtype=np.uint64)
+                grown[:self.size] = self.hashes[:self.size]
+                self.hashes = grown
+            self.hashes[self.size] = value
+            self.items.append(item)
+            self.size += 1
+
+    # Function to return (distance, item) pairs within max_distance, closest first
+    def search(self, value, max_distance):
+        with self._lock:
+            differences = self.hashes[:self.size] ^ np.uint64(value)
+            distances = _POPCOUNT[differences.view(np.uint8).reshape(-1, 8)].sum(axis=1)
+            rows = np.flatnonzero(distances <= max_distance)
+            rows = rows[np.argsort(distances[rows], kind="stable")]
+            return [(int(distances[row]), self.items[row]) for row in rows]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+# Process-wide index of past labels, loaded from MongoDB on first use
+def get_label_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = HashIndex()
+                for doc in label_hash_collection.find({}, {"_id": 0, "phash": 1}):
+                    index.add(int(doc["phash"], 16), doc["phash"])
+                _index = index
+    return _index
+
+
+# Function to find a previously seen label that looks like this one.
+# Returns the stored record (OCR text, product key) or None. Flavours of one
+# product line can have near-identical labels, so with product_name a label
+# stored under a product of another name is not a match.
+def find_similar_label(label_hash, max_distance=MAX_DISTANCE, product_name=None):
+    for distance, phash in get_label_index().search(label_hash, max_distance):
+        record = label_hash_collection.find_one({"phash": phash}, {"_id": 0})
+        if not record:
+            continue
+        if product_name is not None and record.get("product_key") \
+                and record["product_key"].split("|", 1)[-1] != normalise_text(product_name):
+            continue
+        record["distance"] = distance
+        return record
+    return None
+
+
+# Function to store a label's hash with its OCR text and product key
+def remember_label(label_hash, ocr_text, product_key=None):
+    phash = f"{label_hash:016x}"
+    result = label_hash_collection.update_one(
+        {"phash": phash},
+        {"$set": {"ocr_text": ocr_text, "product_key": product_key, "updated_at": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+    if result.upserted_id is not None:
+        get_label_index().add(label_hash, phash)
+    return phash
+
+
+# Function to link a remembered label to its product once the product is
+# in the database
+def link_label(phash, product_key):
+    label_hash_collection.update_one(
+        {"phash": phash},
+        {"$set": {"product_key": product_key, "updated_at": datetime.now(timezone.utc)}}
+    )
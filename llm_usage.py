@@ -0,0 +1,230 @@
+import argparse
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from pymongo.errors import PyMongoError
+from database import get_database
+from metrics import Counter, current_trace_id
+
+logger = logging.getLogger(__name__)
+
+# Estimated prompt tokens allowed per LLM call, and what to do with a prompt
+# over it: "trim" the label text to fit, or "reject" the call
+PROMPT_TOKEN_BUDGET = int(os.getenv("LABELWISE_PROMPT_TOKEN_BUDGET", "12000"))
+PROMPT_BUDGET_ACTION = os.getenv("LABELWISE_PROMPT_BUDGET_ACTION", "trim")
+# LlamaIndex wraps the query and retrieved text in its own QA template
+PROMPT_OVERHEAD_TOKENS = 200
+# USD per million (prompt, completion) tokens. Check current pricing;
+# LABELWISE_LLM_PRICE_INPUT / _OUTPUT override it for every model.
+LLM_PRICES = {
+    "mistral-large-latest": (2.0, 6.0),
+    "mistral-medium-latest": (0.4, 2.0),
+    "mistral-small-latest": (0.1, 0.3),
+    "open-mistral-nemo": (0.15, 0.15),
+}
+PRICE_INPUT = os.getenv("LABELWISE_LLM_PRICE_INPUT")
+PRICE_OUTPUT = os.getenv("LABELWISE_LLM_PRICE_OUTPUT")
+REPORT_FIELDS = ("day", "user", "endpoint", "call", "model")
+
+llm_tokens = Counter("labelwise_llm_tokens_total", "LLM tokens used", ["endpoint", "call", "model", "kind"])
+llm_cost = Counter("labelwise_llm_cost_usd_total", "Estimated LLM spend in USD", ["endpoint", "call", "model"])
+llm_calls = Counter("labelwise_llm_calls_total", "LLM calls", ["endpoint", "call", "model"])
+prompts_over_budget = Counter("labelwise_llm_prompts_over_budget_total",
+                              "Prompts over LABELWISE_PROMPT_TOKEN_BUDGET", ["call", "action"])
+
+
+# Raised instead of calling the LLM when a prompt is over the token budget
+# and LABELWISE_PROMPT_BUDGET_ACTION is "reject"
+class PromptBudgetError(Exception):
+    pass
+
+
+# Rough token count for Latin-script text
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+# Function to make a prompt's variable text (usually the label's OCR text)
+# fit the token budget next to the fixed text around it. Trims the end off,
+# where labels carry the least (addresses, barcodes), or raises
+# PromptBudgetError, depending on LABELWISE_PROMPT_BUDGET_ACTION.
+def fit_prompt(text, fixed_text, call, budget=None):
+    budget = PROMPT_TOKEN_BUDGET if budget is None else budget
+    if not budget:
+        return text
+    fixed = estimate_tokens(fixed_text) + PROMPT_OVERHEAD_TOKENS
+    tokens = fixed + estimate_tokens(text)
+    if tokens <= budget:
+        return text
+    prompts_over_budget.inc(call=call, action=PROMPT_BUDGET_ACTION)
+    if PROMPT_BUDGET_ACTION == "reject" or fixed >= budget:
+        raise PromptBudgetError(f"The label text is too long to analyze (about {tokens} tokens, "
+                                f"the limit is {budget}).")
+    logger.warning("Trimming the %s prompt from about %d to %d tokens", call, tokens, budget)
+    return text[:(budget - fixed - 1) * 4]
+
+
+_scope = ContextVar("llm_usage_scope", default={})
+
+
+# Function to attribute the LLM calls made inside the block: user and
+# endpoint (the feature: analysis, basket, rerating, API) are set where the
+# work starts, call (which prompt) where the LLM is called. Nested scopes add
+# to the outer one.
+@contextmanager
+def usage_scope(**fields):
+    token = _scope.set({**_scope.get(), **fields})
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def llm_price(model):
+    input_price, output_price = LLM_PRICES.get(model, (0.0, 0.0))
+    return (float(PRICE_INPUT) if PRICE_INPUT else input_price,
+            float(PRICE_OUTPUT) if PRICE_OUTPUT else output_price)
+
+
+# Function to record one LLM call: metrics, and a document in llm_usage for
+# the reports. Accounting never fails the call it describes.
+def record_usage(model, prompt_tokens, completion_tokens, seconds, estimated=False):
+    scope = _scope.get()
+    endpoint, call = scope.get("endpoint", "other"), scope.get("call", "other")
+    input_price, output_price = llm_price(model)
+    cost = (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+    llm_calls.inc(endpoint=endpoint, call=call, model=model)
+    llm_tokens.inc(prompt_tokens, endpoint=endpoint, call=call, model=model, kind="prompt")
+    llm_tokens.inc(completion_tokens, endpoint=endpoint, call=call, model=model, kind="completion")
+    llm_cost.inc(cost, endpoint=endpoint, call=call, model=model)
+    now = datetime.now(timezone.utc)
+    try:
+        usage_collection().insert_one({
+            "created_at": now, "day": now.strftime("%Y-%m-%d"), "user": scope.get("user"),
+            "endpoint": endpoint, "call": call, "model": model, "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens, "seconds": seconds, "cost_usd": cost,
+            "estimated": estimated, "trace_id": current_trace_id(),
+        })
+    except PyMongoError as e:
+        logger.warning("Could not record LLM usage: %s", e)
+
+
+# The collection is looked up on first use, so importing the pipeline doesn't
+# connect to MongoDB
+def usage_collection():
+    return get_database().llm_usage
+
+
+def _field(value, name):
+    if isinstance(value, dict):
+        return value.get(name)
+    return getattr(value, name, None)
+
+
+# Function to read the token counts from an LLM response: the counts the
+# Mistral client reports, or an estimate from the text when it has none.
+# Returns (prompt tokens, completion tokens, model, estimated).
+def response_usage(response, prompt_text, default_model):
+    counts = getattr(response, "additional_kwargs", None) or {}
+    raw = getattr(response, "raw", None) or {}
+    usage = _field(raw, "usage") or {}
+    prompt_tokens = counts.get("prompt_tokens") or _field(usage, "prompt_tokens")
+    completion_tokens = counts.get("completion_tokens") or _field(usage, "completion_tokens")
+    model = _field(raw, "model") or default_model
+    if prompt_tokens is None or completion_tokens is None:
+        return estimate_tokens(prompt_text), estimate_tokens(str(response or "")), model, True
+    return prompt_tokens, completion_tokens, model, False
+
+
+_handler = None
+_handler_lock = threading.Lock()
+
+
+# Function to add a callback handler recording every LLM call to LlamaIndex's
+# global callback manager, once per process. It has to be the global one:
+# reading Settings.llm (index query engines do) replaces the LLM's own
+# callback manager with it. The class is built on first use so importing
+# this module doesn't import LlamaIndex.
+def install_usage_handler(default_model):
+    global _handler
+    from llama_index.core import Settings
+    with _handler_lock:
+        if _handler is None:
+            _handler = _usage_handler_class()(default_model)
+        _handler.default_model = default_model
+        manager = Settings.callback_manager
+        if _handler not in manager.handlers:
+            manager.add_handler(_handler)
+    return _handler
+
+
+def _usage_handler_class():
+    from llama_index.core.callbacks import CBEventType, EventPayload
+    from llama_index.core.callbacks.base_handler import BaseCallbackHandler
+
+    class UsageHandler(BaseCallbackHandler):
+        def __init__(self, default_model):
+            super().__init__(event_starts_to_ignore=[], event_ends_to_ignore=[])
+            self.default_model = default_model
+            self._started = {}
+
+        def on_event_start(self, event_type, payload=None, event_id="", parent_id="", **kwargs):
+            if event_type == CBEventType.LLM:
+                payload = payload or {}
+                prompt = payload.get(EventPayload.PROMPT) or payload.get(EventPayload.MESSAGES) or ""
+                self._started[event_id] = (time.perf_counter(), str(prompt))
+            return event_id
+
+        def on_event_end(self, event_type, payload=None, event_id="", **kwargs):
+            if event_type != CBEventType.LLM or event_id not in self._started:
+                return
+            started, prompt = self._started.pop(event_id)
+            payload = payload or {}
+            response = payload.get(EventPayload.RESPONSE) or payload.get(EventPayload.COMPLETION)
+            prompt_tokens, completion_tokens, model, estimated = response_usage(response, prompt,
+                                                                                self.default_model)
+            record_usage(model, prompt_tokens, completion_tokens, time.perf_counter() - started, estimated)
+
+        def start_trace(self, trace_id=None):
+            pass
+
+        def end_trace(self, trace_id=None, trace_map=None):
+            pass
+
+    return UsageHandler
+
+
+# Function to total LLM usage over the last `days` days, grouped by any of
+# day, user, endpoint, call and model, most expensive first
+def usage_report(days=30, by=("day",)):
+    since = (datetime.now(timezone.utc) - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+    rows = usage_collection().aggregate([
+        {"$match": {"day": {"$gte": since}}},
+        {"$group": {"_id": {field: f"${field}" for field in by}, "calls": {"$sum": 1},
+                    "prompt_tokens": {"$sum": "$prompt_tokens"},
+                    "completion_tokens": {"$sum": "$completion_tokens"},
+                    "cost_usd": {"$sum": "$cost_usd"}, "seconds": {"$sum": "$seconds"}}},
+        {"$sort": {"cost_usd": -1}},
+    ])
+    return [{**row.pop("_id"), **row} for row in rows]
+
+
+# python llm_usage.py                       spend per day, last 30 days
+# python llm_usage.py --by user endpoint    spend per user and endpoint
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report LLM token use and cost")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--by", nargs="+", choices=REPORT_FIELDS, default=["day"])
+    args = parser.parse_args()
+    rows = usage_report(args.days, args.by)
+    print("".join(f"{field:<28}" for field in args.by)
+          + f"{'calls':>8}{'prompt':>12}{'completion':>12}{'seconds':>10}{'USD':>10}")
+    for row in rows:
+        print("".join(f"{str(row.get(field)):<28}" for field in args.by)
+              + f"{row['calls']:>8}{row['prompt_tokens']:>12}{row['completion_tokens']:>12}"
+              + f"{row['seconds']:>10.1f}{row['cost_usd']:>10.4f}")
+    print(f"Total: {sum(row['calls'] for row in rows)} calls, ${sum(row['cost_usd'] for row in rows):.4f}")
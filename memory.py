@@ -0,0 +1,115 @@
+import os
+import sys
+import threading
+import time
+
+# Resident memory the process should stay under, in MB; 0 means no budget
+MEMORY_BUDGET_MB = float(os.getenv("LABELWISE_MEMORY_BUDGET_MB", "0"))
+# Session sizes older than this are dropped from the report
+SESSION_REPORT_SECONDS = 30 * 60
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+# Function to read the process's current resident set size in bytes
+def current_rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        # Peak rather than current, but the best the standard library offers
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def budget_bytes():
+    return int(MEMORY_BUDGET_MB * 2 ** 20)
+
+
+def _is_module(value):
+    return callable(getattr(value, "parameters", None)) and callable(getattr(value, "buffers", None))
+
+
+# Function to add up the parameter and buffer memory of the torch modules in
+# a model wrapper (EasyOCR's detector and recogniser, the embedding model's
+# transformer), without importing torch. Shared tensors count once.
+def parameter_bytes(model, depth=2):
+    seen, modules = set(), []
+
+    def collect(value, level):
+        if id(value) in seen:
+            return
+        seen.add(id(value))
+        if _is_module(value):
+            modules.append(value)
+        elif level > 0 and hasattr(value, "__dict__"):
+            for attribute in vars(value).values():
+                collect(attribute, level - 1)
+
+    collect(model, depth)
+    tensors, total = set(), 0
+    for module in modules:
+        for tensor in list(module.parameters()) + list(module.buffers()):
+            if id(tensor) not in tensors:
+                tensors.add(id(tensor))
+                total += tensor.numel() * tensor.element_size()
+    return total
+
+
+# Function to estimate the memory held by a value and everything it
+# references, counting shared objects once. Good enough to compare sessions,
+# not an exact figure.
+def deep_size(value, limit=100_000):
+    seen, stack, total = set(), [value], 0
+    while stack and len(seen) < limit:
+        item = stack.pop()
+        if id(item) in seen or isinstance(item, type):
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item, 0)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        elif hasattr(item, "__dict__"):
+            stack.append(vars(item))
+    return total
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+# Function to remember one session's state size, measured at the end of a run
+def record_session_size(session_id, size):
+    now = time.time()
+    with _sessions_lock:
+        _sessions[session_id] = (size, now)
+        for stale in [key for key, (_, seen) in _sessions.items() if now - seen > SESSION_REPORT_SECONDS]:
+            del _sessions[stale]
+
+
+# Function to summarise the state sizes of recently active sessions
+def session_sizes():
+    with _sessions_lock:
+        sizes = [size for size, _ in _sessions.values()]
+    return {"sessions": len(sizes), "total_bytes": sum(sizes), "max_bytes": max(sizes, default=0)}
+
+
+# python memory.py loads every model and reports what each one costs
+if __name__ == "__main__":
+    from models import registry, memory_report
+    for name in registry.names():
+        registry.get(name)
+    report = memory_report()
+    print(f"RSS {report['rss_bytes'] / 2 ** 20:.0f} MB"
+          + (f" of a {report['budget_bytes'] / 2 ** 20:.0f} MB budget" if report["budget_bytes"] else ""))
+    for model in report["models"]:
+        print(f"  {model['name']:<10} parameters {model['parameter_bytes'] / 2 ** 20:7.1f} MB, "
+              f"RSS at load {model['load_rss_bytes'] / 2 ** 20:7.1f} MB, loaded in {model['load_seconds']:.1f} s")
@@ -0,0 +1,306 @@
+import contextvars
+import http.server
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+# Port for a /metrics endpoint inside the Streamlit process; unset disables it
+METRICS_PORT = os.getenv("LABELWISE_METRICS_PORT")
+# Upper bounds, in seconds, of the latency histogram buckets: from a Mongo
+# lookup to a slow LLM call
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(trace_id)s] %(name)s: %(message)s"
+
+# Trace ID of the request (page run, API call or job) the current code serves
+current_trace = contextvars.ContextVar("trace_id", default="-")
+
+
+def new_trace_id():
+    return uuid.uuid4().hex[:16]
+
+
+def current_trace_id():
+    return current_trace.get()
+
+
+# Function to run a block under a trace ID, a new one unless given
+@contextmanager
+def trace(trace_id=None):
+    token = current_trace.set(trace_id or new_trace_id())
+    try:
+        yield current_trace.get()
+    finally:
+        current_trace.reset(token)
+
+
+# Function to keep the current trace, or start one when there is none
+def continue_trace():
+    trace_id = current_trace.get()
+    return trace(None if trace_id == "-" else trace_id)
+
+
+# Every log record carries the trace ID, so LOG_FORMAT can show it whichever
+# logger wrote the record
+_record_factory = logging.getLogRecordFactory()
+
+
+def _trace_record_factory(*args, **kwargs):
+    record = _record_factory(*args, **kwargs)
+    record.trace_id = current_trace.get()
+    return record
+
+
+if getattr(_record_factory, "__name__", "") != "_trace_record_factory":
+    logging.setLogRecordFactory(_trace_record_factory)
+
+
+def configure_logging(level=logging.INFO):
+    logging.basicConfig(level=level, format=LOG_FORMAT)
+
+
+def _label_text(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+# Base for the metric types: one value per combination of label values
+class Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def lines(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for key, value in sorted(self.snapshot().items()):
+            yield from self._sample_lines(key, value)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def _sample_lines(self, key, value):
+        yield f"{self.name}{_label_text(self.labelnames, key)} {value}"
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # Per-bucket counts, then the +Inf count and the sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[position] += 1
+                    break
+            else:
+                counts[len(self.buckets)] += 1
+            counts[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {key: list(counts) for key, counts in self._values.items()}
+
+    def _sample_lines(self, key, counts):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), counts):
+            cumulative += count
+            yield f"{self.name}_bucket{_label_text(self.labelnames, key, [('le', bound)])} {cumulative}"
+        yield f"{self.name}_sum{_label_text(self.labelnames, key)} {counts[-1]}"
+        yield f"{self.name}_count{_label_text(self.labelnames, key)} {cumulative}"
+
+
+REGISTRY = []
+# Functions returning extra samples at export time, as a list of
+# (name, kind, help, label names, {label values: value}), e.g. the Mongo pool
+_collectors = []
+
+
+def register_collector(func):
+    _collectors.append(func)
+    return func
+
+
+stage_seconds = Histogram("labelwise_stage_seconds", "Time spent in each pipeline stage", ["stage"])
+stage_total = Counter("labelwise_stage_total", "Pipeline stage runs by outcome", ["stage", "outcome"])
+stage_in_flight = Gauge("labelwise_stage_in_flight", "Pipeline stage runs in progress", ["stage"])
+mongo_seconds = Histogram("labelwise_mongo_command_seconds", "MongoDB command latency", ["command"])
+mongo_total = Counter("labelwise_mongo_commands_total", "MongoDB commands by outcome", ["command", "outcome"])
+mongo_in_flight = Gauge("labelwise_mongo_commands_in_flight", "MongoDB commands in progress", ["command"])
+
+
+# Functions called with (stage, seconds, outcome) after every timed stage,
+# for tools that need the raw timings rather than histogram buckets
+_stage_observers = []
+
+
+def add_stage_observer(func):
+    _stage_observers.append(func)
+
+
+def remove_stage_observer(func):
+    _stage_observers.remove(func)
+
+
+# Function to time a pipeline stage (OCR, embedding, LLM query, translation).
+# Works as a context manager or a decorator.
+@contextmanager
+def timed(stage):
+    stage_in_flight.inc(stage=stage)
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_in_flight.dec(stage=stage)
+        stage_seconds.observe(elapsed, stage=stage)
+        stage_total.inc(stage=stage, outcome=outcome)
+        logger.debug("Stage %s took %.3f s (%s)", stage, elapsed, outcome)
+        for observer in list(_stage_observers):
+            observer(stage, elapsed, outcome)
+
+
+# Times every MongoDB command the shared client sends. pymongo calls it on
+# the thread that issued the command, so logs carry that request's trace ID.
+class MongoCommandMetrics(monitoring.CommandListener):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = {}
+
+    def started(self, event):
+        with self._lock:
+            self._started[(event.connection_id, event.request_id)] = event.command_name
+        mongo_in_flight.inc(command=event.command_name)
+
+    def _finish(self, event, outcome):
+        with self._lock:
+            command = self._started.pop((event.connection_id, event.request_id), None)
+        if command is None:
+            return
+        mongo_in_flight.dec(command=command)
+        # duration_micros is measured by the driver around the round trip
+        mongo_seconds.observe(event.duration_micros / 1e6, command=command)
+        mongo_total.inc(command=command, outcome=outcome)
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+
+    def failed(self, event):
+        self._finish(event, "error")
+
+
+mongo_command_metrics = MongoCommandMetrics()
+
+
+# Function to render every metric in the Prometheus text exposition format
+def export_prometheus():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.lines())
+    for collector in _collectors:
+        try:
+            samples = collector()
+        except Exception as e:
+            logger.warning("Metrics collector %s failed: %s", collector.__name__, e)
+            continue
+        for name, kind, help_text, labelnames, values in samples:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in values.items():
+                lines.append(f"{name}{_label_text(labelnames, key)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = export_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+# Function to serve /metrics on its own port from a daemon thread, once per
+# process. The Streamlit app uses it when LABELWISE_METRICS_PORT is set; the
+# HTTP API serves /metrics itself.
+def start_metrics_server(port=None):
+    global _server
+    port = port or METRICS_PORT
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = http.server.ThreadingHTTPServer(("0.0.0.0", int(port)), _MetricsHandler)
+            except OSError as e:
+                logger.warning("Could not serve metrics on port %s: %s", port, e)
+                return None
+            threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+    return _server
@@ -0,0 +1,279 @@
+import gc
+import logging
+import os
+import sys
+import threading
+import time
+from dotenv import load_dotenv
+from memory import budget_bytes, current_rss, parameter_bytes, session_sizes
+from metrics import Counter, register_collector, timed
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL_NAME = "BAAI/bge-base-en-v1.5"
+# Set to 0 to load models only when a request needs them
+WARM_UP = os.getenv("LABELWISE_WARM_UP", "1") == "1"
+# Models used more recently than this are never evicted to make room
+MIN_IDLE_SECONDS = float(os.getenv("LABELWISE_MODEL_MIN_IDLE_SECONDS", "60"))
+
+model_evictions = Counter("labelwise_model_evictions_total", "Models unloaded to stay under the memory budget",
+                          ["model"])
+model_refusals = Counter("labelwise_model_loads_refused_total", "Optional model loads refused by the memory budget",
+                         ["model"])
+
+
+# Heavy models (EasyOCR and torch, the HuggingFace embedding stack, the LLM
+# client) are imported and created on first use, so pages that never analyse
+# a label don't wait for them. Each load records what the model costs in
+# memory; with LABELWISE_MEMORY_BUDGET_MB set, idle models are evicted to make
+# room and optional loads that don't fit are refused.
+class ModelRegistry:
+    def __init__(self):
+        self._factories = {}
+        self._unloaders = {}
+        self._models = {}
+        self._locks = {}
+        self._budget_lock = threading.Lock()
+        self.load_seconds = {}
+        self.parameter_bytes = {}
+        self.load_rss_bytes = {}
+        self.last_used = {}
+
+    # unload, if given, is called with the model on eviction to drop any
+    # references held outside the registry
+    def register(self, name, factory, unload=None):
+        self._factories[name] = factory
+        self._unloaders[name] = unload
+        self._locks[name] = threading.Lock()
+
+    def names(self):
+        return list(self._factories)
+
+    def loaded(self, name):
+        return name in self._models
+
+    def get(self, name):
+        model = self._models.get(name)
+        if model is None:
+            model = self._load(name, optional=False)
+        self.last_used[name] = time.monotonic()
+        return model
+
+    # Function to load a model nothing is waiting on yet (warm-up): refused,
+    # returning None, when it doesn't fit in the memory budget
+    def preload(self, name):
+        model = self._models.get(name)
+        if model is None:
+            model = self._load(name, optional=True)
+        return model
+
+    def _load(self, name, optional):
+        with self._locks[name]:
+            model = self._models.get(name)
+            if model is not None:
+                return model
+            if not self._make_room(name):
+                if optional:
+                    model_refusals.inc(model=name)
+                    logger.warning("Not loading model %s: RSS %.0f MB is at the %.0f MB budget",
+                                   name, current_rss() / 2 ** 20, budget_bytes() / 2 ** 20)
+                    return None
+                logger.warning("Loading model %s over the %.0f MB memory budget", name, budget_bytes() / 2 ** 20)
+            # Loads on other threads at the same time inflate the RSS delta;
+            # the parameter bytes are exact
+            rss_before, started = current_rss(), time.perf_counter()
+            with timed(f"load_{name}"):
+                model = self._factories[name]()
+            self.load_seconds[name] = time.perf_counter() - started
+            self.load_rss_bytes[name] = max(current_rss() - rss_before, 0)
+            self.parameter_bytes[name] = parameter_bytes(model)
+            self.last_used[name] = time.monotonic()
+            self._models[name] = model
+            logger.info("Loaded model %s in %.1f s: %.0f MB of parameters, RSS +%.0f MB", name,
+                        self.load_seconds[name], self.parameter_bytes[name] / 2 ** 20,
+                        self.load_rss_bytes[name] / 2 ** 20)
+        return model
+
+    # Function to evict idle models, least recently used first, until loading
+    # the named one should fit in the budget. The expected size comes from
+    # the model's previous load, so the first load is only checked against
+    # the current RSS. Returns whether it fits.
+    def _make_room(self, name):
+        budget = budget_bytes()
+        if not budget:
+            return True
+        needed = self.load_rss_bytes.get(name, 0)
+        with self._budget_lock:
+            while current_rss() + needed > budget:
+                now = time.monotonic()
+                idle = [other for other in self._models
+                        if other != name and now - self.last_used.get(other, 0) >= MIN_IDLE_SECONDS]
+                if not idle:
+                    return False
+                victim = min(idle, key=lambda other: self.last_used.get(other, 0))
+                self.evict(victim)
+                model_evictions.inc(model=victim)
+        return True
+
+    # Function to unload a model; the next get() loads it again. Requests
+    # already holding it keep it alive until they finish.
+    def evict(self, name):
+        model = self._models.pop(name, None)
+        if model is None:
+            return False
+        if self._unloaders.get(name):
+            self._unloaders[name](model)
+        del model
+        gc.collect()
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        logger.info("Evicted model %s, RSS now %.0f MB", name, current_rss() / 2 ** 20)
+        return True
+
+
+def _load_ocr():
+    import easyocr
+    return easyocr.Reader(['en'])
+
+
+def _load_embedding():
+    from llama_index.core import Settings
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+    embedding_model = HuggingFaceEmbedding(model_name=EMBEDDING_MODEL_NAME)
+    # Set the embedding model globally for LlamaIndex
+    Settings.embed_model = embedding_model
+    return embedding_model
+
+
+def _unload_embedding(embedding_model):
+    from llama_index.core import Settings
+    # Clear the private field: assigning None through the setter would
+    # install a mock model. ensure_llama_index() reloads before any query.
+    if Settings._embed_model is embedding_model:
+        Settings._embed_model = None
+
+def _load_llm():
+    from llama_index.core import Settings
+    from llama_index.llms.mistralai import MistralAI
+    from llm_usage import install_usage_handler
+    # MISTRAL_ENDPOINT points the client at another Mistral-compatible
+    # server, such as benchmarks/mock_llm.py
+    endpoint = os.getenv("MISTRAL_ENDPOINT")
+    llm = MistralAI(api_key=os.getenv("MISTRAL_API_KEY"), **({"endpoint": endpoint} if endpoint else {}))
+    # Every LLM call records its tokens and cost (llm_usage.py). The handler
+    # sits on the global callback manager, which the client shares so that
+    # direct complete() calls are recorded as well as index queries
+    install_usage_handler(llm.model)
+    llm.callback_manager = Settings.callback_manager
+    # Set the LLM globally for LlamaIndex
+    Settings.llm = llm
+    return llm
+
+
+def _unload_llm(llm):
+    from llama_index.core import Settings
+    if Settings._llm is llm:
+        Settings._llm = None
+
+registry = ModelRegistry()
+registry.register("ocr", _load_ocr)
+registry.register("embedding", _load_embedding, unload=_unload_embedding)
+registry.register("llm", _load_llm, unload=_unload_llm)
+
+
+def get_reader():
+    return registry.get("ocr")
+
+
+def get_embedding_model():
+    return registry.get("embedding")
+
+
+def get_llm():
+    return registry.get("llm")
+
+
+# Function to make sure LlamaIndex's global Settings point at our models
+def ensure_llama_index():
+    get_embedding_model()
+    get_llm()
+
+
+# Function to embed a text with the shared embedding model
+def embed_text(text):
+    model = get_embedding_model()
+    with timed("embedding"):
+        return model.get_text_embedding(text)
+
+
+_warm_up_thread = None
+_warm_up_lock = threading.Lock()
+
+
+# Function to load every model on a background thread, once per process, so
+# the first analysis doesn't pay for it
+def start_warm_up():
+    global _warm_up_thread
+    if not WARM_UP:
+        return None
+    with _warm_up_lock:
+        if _warm_up_thread is not None:
+            return _warm_up_thread
+
+        def warm_up():
+            for name in registry.names():
+                try:
+                    registry.preload(name)
+                except Exception as e:
+                    # The request that needs the model will retry and report it
+                    logger.warning("Warm-up of model %s failed: %s", name, e)
+
+        _warm_up_thread = threading.Thread(target=warm_up, name="model-warm-up", daemon=True)
+        _warm_up_thread.start()
+        return _warm_up_thread
+
+
+# Function to report the process's memory and what each model costs
+def memory_report():
+    now = time.monotonic()
+    models = [{
+        "name": name,
+        "loaded": registry.loaded(name),
+        "parameter_bytes": registry.parameter_bytes.get(name, 0),
+        "load_rss_bytes": registry.load_rss_bytes.get(name, 0),
+        "load_seconds": registry.load_seconds.get(name, 0.0),
+        "idle_seconds": now - registry.last_used[name] if name in registry.last_used else None,
+    } for name in registry.names()]
+    return {"rss_bytes": current_rss(), "budget_bytes": budget_bytes(), "models": models,
+            "sessions": session_sizes()}
+
+
+@register_collector
+def memory_samples():
+    report = memory_report()
+    samples = [
+        ("labelwise_process_rss_bytes", "gauge", "Resident memory of the app process", (),
+         {(): report["rss_bytes"]}),
+        ("labelwise_memory_budget_bytes", "gauge", "Memory budget for resident models, 0 for none", (),
+         {(): report["budget_bytes"]}),
+        ("labelwise_session_state_bytes", "gauge", "Estimated session state held by recent sessions", (),
+         {(): report["sessions"]["total_bytes"]}),
+        ("labelwise_sessions_recent", "gauge", "Sessions active in the last 30 minutes", (),
+         {(): report["sessions"]["sessions"]}),
+    ]
+    for field, help_text in (("loaded", "Whether each model is resident"),
+                             ("parameter_bytes", "Parameter and buffer memory of each model"),
+                             ("load_rss_bytes", "Growth in RSS when each model last loaded")):
+        samples.append((f"labelwise_model_{field}", "gauge", help_text, ("model",),
+                        {(model["name"],): int(model[field]) for model in report["models"]}))
+    return samples
+
+
+# LABELWISE_EAGER_MODELS=1 loads everything at import, as the app used to
+if os.getenv("LABELWISE_EAGER_MODELS") == "1":
+    for _name in registry.names():
+        registry.get(_name)
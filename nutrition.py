@@ -0,0 +1,154 @@
+import re
+
+# Canonical nutrient fields and the unit each is stored in, per 100g/100ml
+NUTRIENT_UNITS = {
+    "energy_kcal": "kcal",
+    "protein_g": "g",
+    "carbohydrates_g": "g",
+    "sugar_g": "g",
+    "added_sugar_g": "g",
+    "fat_g": "g",
+    "saturated_fat_g": "g",
+    "trans_fat_g": "g",
+    "fiber_g": "g",
+    "sodium_mg": "mg",
+    "salt_g": "g",
+    "cholesterol_mg": "mg",
+}
+
+# Nutrients that get an index for server-side range queries and sorting
+INDEXED_NUTRIENTS = ["energy_kcal", "sugar_g", "fat_g", "saturated_fat_g", "sodium_mg", "protein_g", "fiber_g"]
+
+# Label names to canonical fields. Order matters: the more specific patterns
+# ("saturated fat", "added sugar") must be tried before "fat" and "sugar".
+# Mono- and polyunsaturated fat have no field; left to "fat" they would be
+# taken for the total.
+NUTRIENT_PATTERNS = [
+    (r"unsaturat", None),
+    (r"(?<!un)saturat|sat\.? fat", "saturated_fat_g"),
+    (r"trans", "trans_fat_g"),
+    (r"added sugar", "added_sugar_g"),
+    (r"sugar", "sugar_g"),
+    (r"fib(er|re)", "fiber_g"),
+    (r"carb", "carbohydrates_g"),
+    (r"protein", "protein_g"),
+    (r"cholesterol", "cholesterol_mg"),
+    (r"sodium", "sodium_mg"),
+    (r"salt", "salt_g"),
+    (r"energy|calori|kcal", "energy_kcal"),
+    (r"fat|lipid", "fat_g"),
+]
+
+# Grams per unit for mass values
+MASS_UNITS = {"kg": 1000.0, "g": 1.0, "gm": 1.0, "gms": 1.0, "mg": 0.001, "mcg": 1e-6, "ug": 1e-6, "µg": 1e-6, "μg": 1e-6}
+KJ_PER_KCAL = 4.184
+SODIUM_PER_SALT = 0.4
+
+# A comma before exactly three digits groups thousands ("1,000 mg");
+# otherwise it is a decimal comma ("1,5 g")
+THOUSANDS = r"[1-9]\d{0,2}(?:,\d{3})+(?!\d)(?:\.\d+)?"
+NUMBER = rf"(?:{THOUSANDS}|\d+(?:[.,]\d+)?)"
+VALUE_PATTERN = re.compile(rf"({NUMBER})\s*(kcal|kj|cal|kg|gms?|mg|mcg|µg|μg|ug|g|ml|l)?\b", re.IGNORECASE)
+BASIS_PATTERN = re.compile(rf"({NUMBER})\s*(kg|g|gm|gms|ml|l)\b", re.IGNORECASE)
+
+
+def _number(text):
+    if re.fullmatch(THOUSANDS, text):
+        return float(text.replace(",", ""))
+    return float(text.replace(",", "."))
+
+
+# Function to map a label nutrient name to its canonical field
+def canonical_nutrient(name):
+    name = name.lower()
+    for pattern, field in NUTRIENT_PATTERNS:
+        if re.search(pattern, name):
+            return field
+    return None
+
+
+# Function to convert a label value like "1548kJ / 370kcal" or "120 mg" into the
+# canonical unit for the field. Returns None if there is no number in it.
+def parse_value(value, field):
+    if isinstance(value, (int, float)):
+        return float(value)
+    matches = [(m.group(1), (m.group(2) or "").lower()) for m in VALUE_PATTERN.finditer(str(value))]
+    if not matches:
+        return None
+
+    if field == "energy_kcal":
+        for number, unit in matches:
+            if unit in ("kcal", "cal"):
+                return _number(number)
+        for number, unit in matches:
+            if unit == "kj":
+                return round(_number(number) / KJ_PER_KCAL, 1)
+        return _number(matches[0][0])
+
+    number, unit = matches[0]
+    if unit not in MASS_UNITS:
+        # No unit on the label: assume it is already in the canonical unit
+        return _number(number)
+    grams = _number(number) * MASS_UNITS[unit]
+    return grams * 1000 if NUTRIENT_UNITS[field] == "mg" else grams
+
+
+# Function to work out the reference quantity of a serving-size key such as
+# "per 100g", "per serving (30g)" or "per 250 ml". Returns (amount, "g"/"ml")
+def parse_basis(basis):
+    match = BASIS_PATTERN.search(str(basis))
+    if not match:
+        return None
+    amount, unit = _number(match.group(1)), match.group(2).lower()
+    if unit == "kg":
+        amount, unit = amount * 1000, "g"
+    elif unit == "l":
+        amount, unit = amount * 1000, "ml"
+    elif unit != "ml":
+        unit = "g"
+    return (amount, unit) if amount > 0 else None
+
+
+def _flatten(values, prefix=""):
+    for name, value in values.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{name} ")
+        else:
+            yield f"{prefix}{name}", value
+
+
+# Function to turn the free-text "Nutritional information" from the LLM into
+# numeric per-100g/100ml fields. Returns None when nothing can be normalised.
+def normalise_nutrition(nutritional_information):
+    if not isinstance(nutritional_information, dict):
+        return None
+
+    candidates = []
+    for basis, values in nutritional_information.items():
+        quantity = parse_basis(basis)
+        if quantity and isinstance(values, dict):
+            candidates.append((quantity, values))
+    if not candidates:
+        return None
+    # Prefer a per-100 column when the label gives several
+    candidates.sort(key=lambda candidate: candidate[0][0] != 100)
+    for (amount, unit), values in candidates:
+        nutrients = _normalise_column(values, 100.0 / amount)
+        if nutrients:
+            nutrients["basis"] = f"100{unit}"
+            return nutrients
+    return None
+
+
+def _normalise_column(values, scale):
+    nutrients = {}
+    for name, value in _flatten(values):
+        field = canonical_nutrient(name)
+        if field is None or field in nutrients:
+            continue
+        parsed = parse_value(value, field)
+        if parsed is not None:
+            nutrients[field] = round(parsed * scale, 3)
+    if "sodium_mg" not in nutrients and "salt_g" in nutrients:
+        nutrients["sodium_mg"] = round(nutrients["salt_g"] * SODIUM_PER_SALT * 1000, 3)
+    return nutrients
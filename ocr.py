@@ -3,6 +3,7 @@ import easyocr
 import cv2
 import numpy as np
 from PIL import Image
+from thumbnails import thumbnail_path
 
 # Title of the Streamlit app
 st.title('OCR using EasyOCR')
@@ -18,7 +19,7 @@ if uploaded_file is not None:
     img_array = np.array(img)
     
     # Display the uploaded image in the Streamlit app
-    st.image(img, caption='Uploaded Image', use_column_width=True)
+    st.image(thumbnail_path(uploaded_file.getvalue()), caption='Uploaded Image', use_column_width=True)
     
     # Create an EasyOCR reader object (with English as the language)
     reader = easyocr.Reader(['en'])
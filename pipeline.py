@@ -0,0 +1,216 @@
+import re
+import ast
+import difflib
+from llm_usage import fit_prompt, usage_scope
+from metrics import timed
+from models import get_reader, get_llm, ensure_llama_index
+
+
+# Raised when the LLM response cannot be turned into a product dictionary
+class ProductExtractionError(Exception):
+    pass
+
+
+# Function to run OCR on a label image and join the detected text
+def run_ocr(image_path):
+    reader = get_reader()
+    with timed("ocr"):
+        result = reader.readtext(image_path)
+    return ' '.join([res[1] for res in result])
+
+# Function to correct OCR mistakes
+nutritional_terms = [
+    "calories", "fat", "trans fat", "saturated fat", "cholesterol",
+    "sodium", "carbohydrates", "sugar", "protein", "fiber", "vitamin", "iron"
+]
+
+@timed("ocr_correction")
+def correct_ocr_mistakes(text):
+    corrected_text = []
+    for word in text.split():
+        closest_match = difflib.get_close_matches(word.lower(), nutritional_terms, n=1, cutoff=0.7)
+        corrected_text.append(closest_match[0] if closest_match else word)
+    return ' '.join(corrected_text)
+
+# Function to analyze food label and user profile
+def prepare_data_for_rag(ocr_text, user_profile):
+    from llama_index.core import Document
+    documents = [
+        Document(text=f"OCR corrected text from food label: {ocr_text}"),
+        Document(text=f"User Profile: {user_profile}")
+    ]
+    return documents
+
+def analyze_with_llama_index(ocr_text, user_profile):
+    from llama_index.core import VectorStoreIndex
+    ensure_llama_index()
+
+    query = query = """
+You are tasked with analyzing the contents of a food label and evaluating its healthiness for a specific user.
+
+1. **Health Rating:**
+   - Give Rating in large size text
+   - Based on the corrected food label and the user's dietary preferences, health goals, allergies, and activity level, assign a health rating on a scale from 1 to 10 (where 10 is the healthiest).
+   - If the food contains any ingredients to which the user is allergic (e.g., food contains peanuts and user has a nut allergy), assign a health rating of **0/10** and include a clear warning and also before doing this be double sure that the food has a substance to which the user is allergic .
+   - If the food does not have an allergen to which the user is allergic to and yet the user should avoid the food altogether, assign a rating from 1 to 4.
+   - If the user should consume the food in moderation, assign a rating from 5 to 7.
+   - If the user can consume the food frequently, assign a rating from 8 to 10.
+
+2. **Health Analysis:**
+   - *Detailed Breakdown*: Present a statistical breakdown of the food's nutritional content in bullet format (e.g., "The food contains 2% saturated fat, 12g sugar, and 10g protein"). Ensure all terms and values are correctly spelled and reflect the accurate content of the food item.
+   - *Personalized Evaluation*: Explain why the food item is either good or bad for the user based on their specific health profile. Double check if there actually is an item in food to which user is allergic to.  Identify any ingredients or nutritional aspects that align well or poorly with the user's dietary needs (e.g., "This food is high in sugar, which may not align with your goal of maintaining stable blood sugar levels"). **If the food contains an allergen, make sure to emphasize that.ze the risk for the user.
+   - *Advice*: Provide guidance on whether the user should consume this food frequently, in moderation, or avoid it altogether, considering their health goals, dietary restrictions, and any allergens. **If the food contains an allergen, recommend avoiding it entirely and issue a warning in the conclusion.
+
+if you mention any of the user's allergies or health conditions or health goals dont write them in list format if there is more than one. Just write them in a string.
+Ensure that the output is free from spelling mistakes and important points or warnings are clearly communicated with bold keywords and underline  relevant details.
+"""
+
+    # The OCR text is the one part of the prompt with no fixed length
+    ocr_text = fit_prompt(ocr_text, query + str(user_profile), "analysis")
+    documents = prepare_data_for_rag(ocr_text, user_profile)
+    with timed("embedding_index"):
+        index = VectorStoreIndex.from_documents(documents)
+    query_engine = index.as_query_engine()
+    with timed("llm_query"), usage_scope(call="analysis"):
+        response = query_engine.query(query)
+
+    return response.response
+
+# Function to build the profile section of the analysis prompt from a user record
+def analysis_profile(user):
+    return {
+        "BMI": user.get("bmi", "Not provided"),
+        "Allergies": user.get("allergies", []),  # Now a list
+        "Health Conditions": user.get("health_conditions", []),  # Now a list
+        "Dietary Preferences": user.get("dietary_preferences", "None"),
+        "Activity Level": user.get("activity_level", "Moderate"),
+        "Health Goals": user.get("health_goals", ["General well-being"])  # Assuming this is already a list
+    }
+
+# Function to analyze raw OCR text for a user record
+def analyze_label_text(ocr_text, user):
+    return analyze_with_llama_index(correct_ocr_mistakes(ocr_text), analysis_profile(user))
+
+BASKET_PROMPT = """
+You are analyzing {count} food labels from one shopping basket for a specific user.
+
+User Profile: {profile}
+
+For each item, write a section that starts with its header exactly as given (e.g. "### Item 1") and contains:
+- A health rating on a scale from 1 to 10 written as "Rating: X/10". If the item contains an ingredient the user is allergic to, the rating is 0/10 with a clear warning; be sure the allergen is really present.
+- Two or three sentences on why the item suits the user or not, and whether to eat it frequently, in moderation or avoid it.
+
+Keep the items in the given order and do not merge them. Use the corrected label text below.
+
+{labels}
+"""
+
+# Function to analyze several labels in one LLM call.
+# Returns one analysis text per label (None where the reply skipped one).
+def analyze_basket_texts(ocr_texts, user):
+    labels = "\n\n".join(f"### Item {number}\n{correct_ocr_mistakes(text)}"
+                          for number, text in enumerate(ocr_texts, 1))
+    profile = analysis_profile(user)
+    # Trimming drops the last items, which then come back unrated
+    labels = fit_prompt(labels, BASKET_PROMPT + str(profile), "basket")
+    prompt = BASKET_PROMPT.format(count=len(ocr_texts), profile=profile, labels=labels)
+    llm = get_llm()
+    with timed("llm_basket"), usage_scope(call="basket"):
+        response = llm.complete(prompt).text
+    return split_basket_reply(response, len(ocr_texts))
+
+# Function to split a basket reply into one text per item. Headers may be
+# decorated or carry the product's name ("**Item 2 – Cola**").
+def split_basket_reply(response, count):
+    sections = re.split(r"^\W*Item\s+(\d+)\b.*$", response, flags=re.MULTILINE | re.IGNORECASE)
+    texts = [None] * count
+    for number, text in zip(sections[1::2], sections[2::2]):
+        if 1 <= int(number) <= count and text.strip():
+            texts[int(number) - 1] = text.strip()
+    return texts
+
+# Function to extract structured product information from OCR text
+def extract_product_info(ocr_text, product_type=None, consumption_frequency=None):
+    from llama_index.core import VectorStoreIndex, Document
+    ensure_llama_index()
+
+    query = """
+    You are tasked with correcting and structuring the OCR text from a food label. Please:
+    1. Correct any spelling mistakes or grammatical errors in the OCR text.
+    2. Extract and structure the following information:
+       - Product Name
+       - Brand Name (look for company names following by "manufactured by" or "owned by" or "produced by")
+       - Weight in Grams/ML
+       - Nutritional information: Include the serving size (e.g., "per 100g", "per 200ml") as specified on the label. If multiple serving sizes are given, use the one that provides the most comprehensive nutritional breakdown.
+       - Ingredients
+       - Product Category
+       - Proprietary Claims: Include any claims such as "sugar-free", "low-fat", etc. If no such claims are present, leave this field empty.
+    3. Present the information as a Python dictionary. The 'Nutritional information' should be a nested dictionary with the serving size as the key and the nutritional details as the value. Do not include any additional text, markdown formatting, or code blocks. Just return the dictionary.
+
+    Example format:
+    {
+        "Product Name": "Example Cereal",
+        "Brand Name": "HealthyBrands",
+        "Weight": "500g",
+        "Nutritional information": {
+            "per 100g": {
+                "Energy": "370kcal",
+                "Protein": "8g",
+                "Carbohydrates": "80g",
+                "Fat": "2g"
+            }
+        },
+        "Ingredients": "Whole grain wheat, sugar, salt",
+        "Product Category": "Breakfast Cereal",
+        "Proprietary Claims": "High in fiber, Low in fat"
+    }
+
+    If certain information is not available in the OCR text, use "Not specified" as the value for that key.
+    """
+
+    ocr_text = fit_prompt(ocr_text, query, "extraction")
+    documents = [Document(text=f"OCR text from food label: {ocr_text}")]
+    with timed("embedding_index"):
+        index = VectorStoreIndex.from_documents(documents)
+    query_engine = index.as_query_engine()
+    with timed("llm_extraction"), usage_scope(call="extraction"):
+        response = query_engine.query(query)
+
+    # Extract the dictionary from the response
+    dict_match = re.search(r'\{.*\}', response.response, re.DOTALL)
+    if not dict_match:
+        raise ProductExtractionError("Could not extract product information from the AI response. Please try again.")
+    try:
+        product_info = ast.literal_eval(dict_match.group())
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        raise ProductExtractionError("Failed to parse the AI response. Please try again.")
+    if not isinstance(product_info, dict):
+        raise ProductExtractionError("Failed to parse the AI response. Please try again.")
+
+    if product_type and consumption_frequency:
+        product_info['product_type'] = product_type
+        product_info['consumption_frequency'] = consumption_frequency
+
+    return product_info
+
+# Function to create the translator for a language; benchmarks swap in a stub
+def make_translator(target_lang):
+    from translate import Translator
+    return Translator(to_lang=target_lang)
+
+# Function to translate text chunk by chunk, yielding each translated chunk
+def translate_chunks(text, target_lang, max_length=500):
+    translator = make_translator(target_lang)
+    # Split the text into chunks of max_length characters
+    for i in range(0, len(text), max_length):
+        with timed("translate_chunk"):
+            translated = translator.translate(text[i:i+max_length])
+        yield translated
+
+# Function to translate text using the translate library
+def translate_text(text, target_lang):
+    try:
+        with timed("translate"):
+            return "".join(translate_chunks(text, target_lang))
+    except Exception as e:
+        return f"Translation error: {str(e)}"
@@ -1,5 +1,4 @@
 import streamlit as st
-from pymongo import MongoClient
 import hashlib
 import os
 import easyocr
@@ -9,13 +8,17 @@ from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 from llama_index.llms.mistralai import MistralAI
 from translate import Translator
 from dotenv import load_dotenv
+from database import get_database
+from thumbnails import thumbnail_path
+from products import product_exists, upsert_product
+from profiles import fetch_user_profile, fetch_user_credentials, clear_session_profiles
+from profiles import update_user_profile as write_user_profile
 import re
 import ast
 import json
 
 # Connect to MongoDB
-client = MongoClient(os.getenv("MONGODB_URI"))
-db = client.Health
+db = get_database()
 customer_collection = db.customer
 product_collection = db.product
 
@@ -55,9 +58,9 @@ def correct_ocr_mistakes(text):
         corrected_text.append(closest_match[0] if closest_match else word)
     return ' '.join(corrected_text)
 
-# Function to fetch user details
+# Function to fetch user details (cached per session and per process, no password hash)
 def fetch_user_details(email):
-    return customer_collection.find_one({"email": email})
+    return fetch_user_profile(email, st.session_state)
 
 # Function to analyze food label and user profile
 def prepare_data_for_rag(ocr_text, user_profile):
@@ -122,7 +125,7 @@ def analyze_food_label(image_path, email):
 
 
 def update_user_profile(email, updated_data):
-    customer_collection.update_one({"email": email}, {"$set": updated_data})
+    write_user_profile(email, updated_data, st.session_state)
 
 # Function to translate text using Google Translate API
 # Function to translate text using the translate library
@@ -145,12 +148,6 @@ def translate_text(text, target_lang):
         return f"Translation error: {str(e)}"
 
 
-def product_exists(product_name, brand_name):
-    existing_product = product_collection.find_one({
-        "Product Name": product_name,
-        "Brand Name": brand_name
-    })
-    return existing_product is not None
 
 
 
@@ -243,7 +240,7 @@ if not st.session_state.logged_in:
         password = st.text_input("Password", type="password", key="login_password")
 
         if st.button("Login"):
-            user = fetch_user_details(email)
+            user = fetch_user_credentials(email)
             if user and check_password(user['password'], password):
                 st.session_state.logged_in = True
                 st.session_state.user_email = email
@@ -318,11 +315,7 @@ if not st.session_state.logged_in:
                 product_info = update_product_database(ocr_text, product_type, consumption_frequency)
                 
                 if product_info:
-                    product_name = product_info.get("Product Name", "Not specified")
-                    brand_name = product_info.get("Brand Name", "Not specified")
-                    
-                    if not product_exists(product_name, brand_name):
-                        product_collection.insert_one(product_info)
+                    if upsert_product(product_info):
                         st.success("Thank you for contributing to our database!")
                     else:
                         st.info("This product is already in our database. Thank you for your contribution!")
@@ -333,6 +326,7 @@ else:
     st.success(f"Welcome back, {st.session_state.user_email}!")
 
     if st.button("Logout"):
+        clear_session_profiles(st.session_state)
         st.session_state.logged_in = False
         st.session_state.user_email = None
         st.session_state.analysis_result = None
@@ -386,7 +380,7 @@ else:
         with open(image_path, "wb") as f:
             f.write(uploaded_file.getbuffer())
 
-        st.image(image_path, caption="Uploaded Food Label", use_column_width=True)
+        st.image(thumbnail_path(image_path), caption="Uploaded Food Label", use_column_width=True)
 
         if st.button("Analyze Food Label"):
             with st.spinner("Analyzing food label..."):
@@ -434,8 +428,10 @@ else:
         if submit_button:
             st.session_state.new_product_info['product_type'] = product_type
             st.session_state.new_product_info['consumption_frequency'] = consumption_frequency
-            product_collection.insert_one(st.session_state.new_product_info)
-            st.success("Thank you for contributing! Product information successfully added to the database.")
+            if upsert_product(st.session_state.new_product_info):
+                st.success("Thank you for contributing! Product information successfully added to the database.")
+            else:
+                st.info("This product is already in our database. Thank you for your contribution!")
             st.session_state.new_product_info = None
             st.rerun()
 
@@ -0,0 +1,133 @@
+import argparse
+import re
+import unicodedata
+from pymongo import UpdateOne, ASCENDING, DESCENDING
+from database import get_database
+from schema import apply_indexes
+from nutrition import normalise_nutrition
+
+db = get_database()
+product_collection = db.product
+
+PRODUCT_KEY_FIELD = "product_key"
+NUTRIENTS_FIELD = "nutrients"
+UNSPECIFIED = "not specified"
+
+
+# Function to normalise one part of the product key
+def normalise_text(text):
+    text = unicodedata.normalize("NFKC", str(text or ""))
+    text = text.casefold()
+    return re.sub(r"\s+", " ", text).strip()
+
+
+# Function to build the canonical, brand-qualified product key
+def product_key(product_name, brand_name):
+    brand = normalise_text(brand_name)
+    if brand == UNSPECIFIED:
+        brand = ""
+    return f"{brand}|{normalise_text(product_name)}"
+
+
+def product_exists(product_name, brand_name):
+    existing_product = product_collection.find_one(
+        {PRODUCT_KEY_FIELD: product_key(product_name, brand_name)},
+        {"_id": 1}
+    )
+    return existing_product is not None
+
+
+# Function to fetch a stored product by its key, or None
+def find_product(key):
+    return product_collection.find_one({PRODUCT_KEY_FIELD: key}, {"_id": 0})
+
+
+# Function to build the filter and insert-if-missing update for a product,
+# shared by upsert_product and bulk ingestion
+def product_upsert_spec(product_info):
+    key = product_key(product_info.get("Product Name"), product_info.get("Brand Name"))
+    document = {k: v for k, v in product_info.items() if k != "_id"}
+    document[PRODUCT_KEY_FIELD] = key
+    nutrients = normalise_nutrition(product_info.get("Nutritional information"))
+    if nutrients:
+        document[NUTRIENTS_FIELD] = nutrients
+    return {PRODUCT_KEY_FIELD: key}, {"$setOnInsert": document}
+
+
+# Function to insert a product unless one with the same key already exists.
+# One round trip, and the unique index makes concurrent submissions safe.
+# Returns True if the product was inserted.
+def upsert_product(product_info):
+    key_filter, update = product_upsert_spec(product_info)
+    result = product_collection.update_one(key_filter, update, upsert=True)
+    return result.upserted_id is not None
+
+
+# Function to add derived fields (product key, numeric nutrients) to documents
+# stored before those fields existed.
+# Returns (updated count, keys shared by more than one document).
+def backfill_products(batch_size=500):
+    updated = 0
+    batch = []
+    projection = {"Product Name": 1, "Brand Name": 1, "Nutritional information": 1,
+                  PRODUCT_KEY_FIELD: 1, NUTRIENTS_FIELD: 1}
+    for doc in product_collection.find({}, projection):
+        derived = {PRODUCT_KEY_FIELD: product_key(doc.get("Product Name"), doc.get("Brand Name"))}
+        nutrients = normalise_nutrition(doc.get("Nutritional information"))
+        if nutrients:
+            derived[NUTRIENTS_FIELD] = nutrients
+        changes = {field: value for field, value in derived.items() if doc.get(field) != value}
+        if not changes:
+            continue
+        batch.append(UpdateOne({"_id": doc["_id"]}, {"$set": changes}))
+        if len(batch) >= batch_size:
+            updated += product_collection.bulk_write(batch, ordered=False).modified_count
+            batch = []
+    if batch:
+        updated += product_collection.bulk_write(batch, ordered=False).modified_count
+
+    duplicates = list(product_collection.aggregate([
+        {"$group": {"_id": f"${PRODUCT_KEY_FIELD}", "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ]))
+    return updated, [(d["_id"], d["count"]) for d in duplicates]
+
+
+# Function to query the catalog by nutrient ranges, e.g.
+# find_products_by_nutrients({"sugar_g": (None, 5)}, sort_by="protein_g", descending=True)
+# Ranges are inclusive (min, max) pairs in per-100g/100ml canonical units;
+# filtering and sorting run on the server using the nutrient indexes.
+def find_products_by_nutrients(ranges, sort_by=None, descending=False, category=None, basis=None, limit=20):
+    query = {}
+    for field, (minimum, maximum) in ranges.items():
+        bounds = {}
+        if minimum is not None:
+            bounds["$gte"] = minimum
+        if maximum is not None:
+            bounds["$lte"] = maximum
+        query[f"{NUTRIENTS_FIELD}.{field}"] = bounds or {"$exists": True}
+    if category:
+        query["Product Category"] = category
+    if basis:
+        query[f"{NUTRIENTS_FIELD}.basis"] = basis
+
+    cursor = product_collection.find(query)
+    if sort_by:
+        cursor = cursor.sort(f"{NUTRIENTS_FIELD}.{sort_by}", DESCENDING if descending else ASCENDING)
+    return list(cursor.limit(limit))
+
+
+# Backfill existing documents, then create the unique key and nutrient indexes:
+# python products.py --backfill
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Product key maintenance")
+    parser.add_argument("--backfill", action="store_true", help="add product keys and numeric nutrients to existing documents")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    if args.backfill:
+        updated, duplicates = backfill_products(args.batch_size)
+        print(f"Backfilled {updated} product(s).")
+        for key, count in duplicates:
+            print(f"Duplicate key {key!r} is shared by {count} products; merge them before the unique index can be built.")
+        apply_indexes(db)
@@ -0,0 +1,126 @@
+import os
+import threading
+import time
+from database import get_database
+
+db = get_database()
+customer_collection = db.customer
+
+# Fields the analysis prompt uses, and the full set shown on the Edit Profile
+# form. The password hash is never part of a cached profile.
+ANALYSIS_FIELDS = ("bmi", "allergies", "health_conditions", "dietary_preferences", "activity_level", "health_goals")
+PROFILE_FIELDS = ("name", "email", "age", "height", "weight") + ANALYSIS_FIELDS
+PROFILE_PROJECTION = {"_id": 0, **{field: 1 for field in PROFILE_FIELDS}}
+
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL_SECONDS", "300"))
+SESSION_CACHE_KEY = "profile_cache"
+
+
+# Small thread-safe cache whose entries expire after a fixed time
+class TTLCache:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+# Shared by every session in this process
+process_cache = TTLCache(PROFILE_CACHE_TTL)
+# Bumped on every profile update; a cached copy from an older version is stale
+_versions = {}
+_versions_lock = threading.Lock()
+
+
+def profile_version(email):
+    with _versions_lock:
+        return _versions.get(email, 0)
+
+
+def _bump_version(email):
+    with _versions_lock:
+        _versions[email] = _versions.get(email, 0) + 1
+        return _versions[email]
+
+
+def _session_cache(session_state):
+    if session_state is None:
+        return None
+    if SESSION_CACHE_KEY not in session_state:
+        session_state[SESSION_CACHE_KEY] = {}
+    return session_state[SESSION_CACHE_KEY]
+
+
+# Function to fetch a user's profile (without the password hash), checking the
+# session cache, then the process cache, then MongoDB. Copies cached before
+# the profile's last update in this process are skipped.
+def fetch_user_profile(email, session_state=None):
+    session_cache = _session_cache(session_state)
+    now = time.monotonic()
+    version = profile_version(email)
+    if session_cache is not None and email in session_cache:
+        expires, cached_version, profile = session_cache[email]
+        if expires >= now and cached_version == version:
+            return profile
+        del session_cache[email]
+
+    profile = process_cache.get(email)
+    if profile is None:
+        profile = customer_collection.find_one({"email": email}, PROFILE_PROJECTION)
+        if profile is None:
+            return None
+        # An update that landed during the read may have been missed
+        if profile_version(email) != version:
+            return profile
+        process_cache.set(email, profile)
+
+    if session_cache is not None:
+        session_cache[email] = (now + PROFILE_CACHE_TTL, version, profile)
+    return profile
+
+
+# Function to fetch the fields needed to check a login; never cached
+def fetch_user_credentials(email):
+    return customer_collection.find_one({"email": email}, {"_id": 0, "name": 1, "password": 1})
+
+
+# Function to update a profile and keep both cache layers consistent. The
+# process cache is dropped before and after the write, so a read racing the
+# write can't leave the old profile behind, and the version bump makes every
+# other session's copy stale.
+def update_user_profile(email, updated_data, session_state=None):
+    cached = process_cache.get(email)
+    process_cache.invalidate(email)
+    customer_collection.update_one({"email": email}, {"$set": updated_data})
+    version = _bump_version(email)
+    process_cache.invalidate(email)
+
+    session_cache = _session_cache(session_state)
+    if session_cache is not None:
+        previous = session_cache.pop(email, (None, None, cached))[2]
+        if previous is not None:
+            # Write through for the session that made the change
+            profile = {**previous, **{k: v for k, v in updated_data.items() if k in PROFILE_FIELDS}}
+            session_cache[email] = (time.monotonic() + PROFILE_CACHE_TTL, version, profile)
+
+
+def clear_session_profiles(session_state):
+    session_state.pop(SESSION_CACHE_KEY, None)
@@ -0,0 +1,170 @@
+import argparse
+import glob
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from metrics import current_trace_id, new_trace_id
+
+logger = logging.getLogger(__name__)
+
+# Share of analyses profiled without being asked, from 0 to 1
+PROFILE_SAMPLE_RATE = float(os.getenv("LABELWISE_PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("LABELWISE_PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("LABELWISE_PROFILE_DIR", os.path.join("temp", "profiles"))
+# Profiles kept on disk; older ones are deleted
+PROFILE_KEEP = int(os.getenv("LABELWISE_PROFILE_KEEP", "50"))
+# Users who may ask for a profile and see the profiles page
+ADMIN_EMAILS = {email.strip().lower() for email in os.getenv("LABELWISE_ADMIN_EMAILS", "").split(",")
+                if email.strip()}
+
+
+def is_admin(email):
+    return bool(email) and email.lower() in ADMIN_EMAILS
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+# Samples one thread's stack at a fixed interval from a background thread.
+# Stacks are counted in the collapsed format flamegraph.pl and speedscope
+# read: "outer;inner;innermost count".
+class StackSampler:
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL_MS / 1000):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(labels))] += 1
+            self.samples += 1
+
+
+def should_profile(force=False):
+    return force or (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE)
+
+
+# Function to profile the block when forced (an admin asked) or picked by
+# LABELWISE_PROFILE_SAMPLE_RATE. Writes {trace id}.collapsed and a .json
+# summary to LABELWISE_PROFILE_DIR. Only the calling thread is sampled.
+@contextmanager
+def profile_request(name, force=False):
+    if not should_profile(force):
+        yield None
+        return
+    trace_id = current_trace_id()
+    if trace_id == "-":
+        trace_id = new_trace_id()
+    sampler = StackSampler(threading.get_ident())
+    started_at, started = time.time(), time.perf_counter()
+    sampler.start()
+    try:
+        yield sampler
+    finally:
+        sampler.stop()
+        try:
+            save_profile(trace_id, name, sampler, started_at, time.perf_counter() - started)
+        except OSError as e:
+            logger.warning("Could not save the profile of %s: %s", trace_id, e)
+
+
+def save_profile(trace_id, name, sampler, started_at, seconds):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(os.path.join(PROFILE_DIR, f"{trace_id}.collapsed"), "w") as f:
+        for stack, count in sampler.stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    summary = {"trace_id": trace_id, "name": name, "started_at": started_at, "seconds": seconds,
+               "samples": sampler.samples, "interval_ms": sampler.interval * 1000}
+    with open(os.path.join(PROFILE_DIR, f"{trace_id}.json"), "w") as f:
+        json.dump(summary, f)
+    logger.info("Profiled %s in %.2f s (%d samples)", name, seconds, sampler.samples)
+    prune_profiles()
+
+
+def prune_profiles(keep=PROFILE_KEEP):
+    summaries = sorted(glob.glob(os.path.join(PROFILE_DIR, "*.json")), key=os.path.getmtime, reverse=True)
+    for path in summaries[keep:]:
+        for stale in (path, path[:-len(".json")] + ".collapsed"):
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+
+
+# Function to list saved profiles, newest first
+def recent_profiles(limit=PROFILE_KEEP):
+    profiles = []
+    for path in glob.glob(os.path.join(PROFILE_DIR, "*.json")):
+        try:
+            with open(path) as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    profiles.sort(key=lambda profile: profile["started_at"], reverse=True)
+    return profiles[:limit]
+
+
+def profile_path(trace_id):
+    return os.path.join(PROFILE_DIR, f"{os.path.basename(trace_id)}.collapsed")
+
+
+def profile_summary(trace_id):
+    with open(os.path.join(PROFILE_DIR, f"{os.path.basename(trace_id)}.json")) as f:
+        return json.load(f)
+
+
+# Function to rank a profile's frames by samples spent in the frame itself
+# (self) and anywhere below it (total). Returns [(frame, self, total)].
+def hottest_frames(trace_id, top=15):
+    own, inclusive = Counter(), Counter()
+    with open(profile_path(trace_id)) as f:
+        for line in f:
+            stack, _, count = line.rstrip("\n").rpartition(" ")
+            frames = stack.split(";")
+            own[frames[-1]] += int(count)
+            for frame in set(frames):
+                inclusive[frame] += int(count)
+    return [(frame, own[frame], inclusive[frame]) for frame, _ in own.most_common(top)]
+
+
+# python profiling.py               lists recent profiles
+# python profiling.py <trace id>    shows a profile's hottest frames
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect per-request profiles")
+    parser.add_argument("trace_id", nargs="?")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+    if args.trace_id is None:
+        for profile in recent_profiles():
+            print(f"{profile['trace_id']}  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(profile['started_at']))}"
+                  f"  {profile['seconds']:7.2f} s  {profile['samples']:6d} samples  {profile['name']}")
+    else:
+        samples = profile_summary(args.trace_id)["samples"] or 1
+        print(f"{'self':>7}{'total':>8}  frame")
+        for frame, own, inclusive in hottest_frames(args.trace_id, args.top):
+            print(f"{own / samples:>7.1%}{inclusive / samples:>8.1%}  {frame}")
+        print(f"flamegraph: flamegraph.pl {profile_path(args.trace_id)} > {args.trace_id}.svg")
@@ -0,0 +1,392 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+from nutrition import normalise_nutrition
+from scoring import SCORE_COLUMNS, score_products
+
+logger = logging.getLogger(__name__)
+
+INDEX_PATH = os.getenv("RECOMMENDATION_INDEX_PATH", os.path.join("indexes", "products.npz"))
+LATENCY_BUDGET_MS = float(os.getenv("RECOMMENDATION_LATENCY_BUDGET_MS", "5"))
+# Typical per-100g magnitudes used to put nutrients on a comparable scale
+NUTRIENT_SCALE = np.array([900, 60, 20, 2000, 15, 40], dtype=np.float32)
+# Share of the similarity that comes from nutrients vs. the text embedding
+NUTRIENT_WEIGHT = 0.5
+TEXT_WEIGHT = 0.5
+# Candidates re-scored for the user per requested recommendation
+CANDIDATE_FACTOR = 8
+# Inserts are appended to a log next to the snapshot; the log is folded into
+# the snapshot once it holds this many entries
+COMPACT_AFTER = int(os.getenv("RECOMMENDATION_COMPACT_AFTER", "500"))
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory locks on Windows; run one writer process there
+    fcntl = None
+
+
+# Function to lock the index files against other processes: exclusive while
+# writing, shared while reading
+@contextmanager
+def file_lock(path, shared=False):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".lock", "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# Function to identify a version of a file, or None when it doesn't exist
+def file_state(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def _unit(vector):
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+# Function to describe a product for the text embedding
+def product_text(product_info):
+    parts = [product_info.get("Product Name"), product_info.get("Brand Name"),
+             product_info.get("Product Category"), product_info.get("Ingredients")]
+    return " | ".join(str(part) for part in parts if part and part != "Not specified")
+
+
+# Function to build the unit-length search vector for one product
+def product_vector(nutrients, text_embedding=None):
+    values = np.array([(nutrients or {}).get(column, np.nan) for column in SCORE_COLUMNS], dtype=np.float32)
+    nutrient_part = _unit(np.nan_to_num(values / NUTRIENT_SCALE)) * NUTRIENT_WEIGHT
+    if text_embedding is None:
+        return _unit(nutrient_part), values
+    text_part = _unit(np.asarray(text_embedding, dtype=np.float32)) * TEXT_WEIGHT
+    return _unit(np.concatenate([nutrient_part, text_part])), values
+
+
+# Flat inner-product index over product vectors, partitioned by category.
+# Rows are appended in place (with capacity doubling) so inserts are cheap.
+class ProductIndex:
+    def __init__(self, dimension=None):
+        self.dimension = dimension
+        self.size = 0
+        self.vectors = np.zeros((0, dimension or 0), dtype=np.float32)
+        self.nutrients = np.zeros((0, len(SCORE_COLUMNS)), dtype=np.float32)
+        self.keys = []
+        self.names = []
+        self.categories = []
+        self.rows_by_key = {}
+        self._partitions = {}
+        self._lock = threading.RLock()
+        self.last_query_ms = None
+        # Log entries not yet folded into the snapshot, how far into the log
+        # has been read, and which snapshot file this index was loaded from
+        self.logged = 0
+        self.log_offset = 0
+        self.snapshot_state = None
+
+    def _clear(self):
+        self.dimension = None
+        self.size = 0
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.nutrients = np.zeros((0, len(SCORE_COLUMNS)), dtype=np.float32)
+        self.keys, self.names, self.categories = [], [], []
+        self.rows_by_key = {}
+        self._partitions = {}
+        self.logged = 0
+        self.log_offset = 0
+
+    def _grow(self, needed):
+        capacity = len(self.vectors)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2, 64)
+        vectors = np.zeros((capacity, self.dimension), dtype=np.float32)
+        vectors[:self.size] = self.vectors[:self.size]
+        nutrients = np.full((capacity, len(SCORE_COLUMNS)), np.nan, dtype=np.float32)
+        nutrients[:self.size] = self.nutrients[:self.size]
+        self.vectors, self.nutrients = vectors, nutrients
+
+    # Function to add or replace one product
+    def add(self, key, name, category, vector, nutrient_values):
+        with self._lock:
+            if self.dimension is None:
+                self.dimension = len(vector)
+                self.vectors = np.zeros((0, self.dimension), dtype=np.float32)
+            if len(vector) != self.dimension:
+                raise ValueError(f"vector has {len(vector)} dimensions, index has {self.dimension}")
+            row = self.rows_by_key.get(key)
+            if row is None:
+                row = self.size
+                self._grow(row + 1)
+                self.size += 1
+                self.keys.append(key)
+                self.names.append(name)
+                self.categories.append(category)
+                self.rows_by_key[key] = row
+            else:
+                self._partitions.pop(self.categories[row], None)
+                self.names[row] = name
+                self.categories[row] = category
+            self.vectors[row] = vector
+            self.nutrients[row] = nutrient_values
+            self._partitions.pop(category, None)
+
+    # Function to get (rows, vectors, nutrients) for one category as contiguous
+    # arrays, so a query is a single matrix-vector product with no gather.
+    # Only the categories touched by an insert are rebuilt.
+    def partition(self, category):
+        with self._lock:
+            if category not in self._partitions:
+                rows = np.flatnonzero(np.array(self.categories, dtype=object) == category)
+                self._partitions[category] = (rows, np.ascontiguousarray(self.vectors[rows]),
+                                              self.nutrients[rows].astype(np.float64))
+            return self._partitions[category]
+
+    # Function to return up to k products in the same category that are most
+    # similar to the query vector and score better for this user
+    def search(self, vector, category, user_profile=None, k=5, exclude_key=None, query_score=None):
+        started = time.perf_counter()
+        rows, vectors, nutrients = self.partition(category)
+        results = []
+        if len(rows):
+            similarity = vectors @ vector
+            pool = min(len(rows), k * CANDIDATE_FACTOR)
+            top = np.argpartition(-similarity, pool - 1)[:pool]
+            top = top[np.argsort(-similarity[top])]
+            candidates = rows[top]
+            columns = {column: nutrients[top, i] for i, column in enumerate(SCORE_COLUMNS)}
+            scored = score_products(columns, user_profile)
+            for position, row in enumerate(candidates):
+                if self.keys[row] == exclude_key or not scored["coverage"][position]:
+                    continue
+                if query_score is not None and scored["score"][position] >= query_score:
+                    continue
+                results.append({
+                    "product_key": self.keys[row],
+                    "name": self.names[row],
+                    "similarity": float(similarity[top[position]]),
+                    "rating": int(scored["rating"][position]),
+                    "grade": str(scored["grade"][position]),
+                })
+                if len(results) == k:
+                    break
+
+        self.last_query_ms = (time.perf_counter() - started) * 1000
+        if self.last_query_ms > LATENCY_BUDGET_MS:
+            logger.warning("Recommendation query took %.1f ms (budget %.1f ms) over %d products",
+                           self.last_query_ms, LATENCY_BUDGET_MS, len(rows))
+        return results
+
+    # Function to write the snapshot and empty the log. Entries other
+    # processes appended are read first, so compaction never drops them.
+    def save(self, path=INDEX_PATH):
+        with self._lock, file_lock(path):
+            if file_state(path) != self.snapshot_state:
+                # Another process compacted; the log restarted after it
+                self.log_offset = 0
+            self._read_log(path)
+            self._write_snapshot(path)
+
+    # Function to replace the snapshot with this index; called with the file
+    # lock held and the log already read
+    def _write_snapshot(self, path):
+        temporary = path + ".tmp.npz"
+        labels = {"keys": self.keys, "names": self.names, "categories": self.categories}
+        np.savez(temporary, vectors=self.vectors[:self.size], nutrients=self.nutrients[:self.size],
+                 labels=np.array(json.dumps(labels)))
+        # Replace atomically so readers never see a half-written index
+        os.replace(temporary, path)
+        if os.path.exists(path + ".log"):
+            os.remove(path + ".log")
+        self.snapshot_state = file_state(path)
+        self.logged = 0
+        self.log_offset = 0
+
+    # Function to persist one added row without rewriting the whole snapshot,
+    # as a JSON line
+    def append_log(self, key, path=INDEX_PATH):
+        with self._lock, file_lock(path):
+            row = self.rows_by_key[key]
+            entry = {"key": key, "name": self.names[row], "category": self.categories[row],
+                     "vector": self.vectors[row].tolist(), "nutrients": self.nutrients[row].tolist()}
+            # Append after everything other processes wrote, so a compaction
+            # below includes their entries
+            self._sync(path)
+            self.add(key, entry["name"], entry["category"], np.array(entry["vector"], dtype=np.float32),
+                     np.array(entry["nutrients"], dtype=np.float32))
+            line = (json.dumps(entry) + "\n").encode()
+            with open(path + ".log", "ab") as f:
+                f.write(line)
+            self.log_offset += len(line)
+            self.logged += 1
+            if self.logged >= COMPACT_AFTER:
+                self._write_snapshot(path)
+
+    # Function to apply the complete log lines past log_offset
+    def _read_log(self, path):
+        try:
+            with open(path + ".log", "rb") as f:
+                f.seek(self.log_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        # A partial last line is still being written, or was cut off by a crash
+        data = data[:data.rfind(b"\n") + 1]
+        self.log_offset += len(data)
+        for line in data.splitlines():
+            try:
+                entry = json.loads(line)
+                self.add(entry["key"], entry["name"], entry["category"],
+                         np.array(entry["vector"], dtype=np.float32), np.array(entry["nutrients"], dtype=np.float32))
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning("Skipped a recommendation index log entry: %s", e)
+                continue
+            self.logged += 1
+
+    def _read_snapshot(self, path):
+        self._clear()
+        self.snapshot_state = file_state(path)
+        if self.snapshot_state is None:
+            return
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                vectors = data["vectors"]
+                labels = json.loads(str(data["labels"]))
+                nutrients = data["nutrients"]
+        except (KeyError, ValueError) as e:
+            # A snapshot from an older version; python recommend.py --rebuild
+            logger.warning("Could not read the recommendation index %s: %s", path, e)
+            return
+        if len(vectors):
+            self.dimension = vectors.shape[1]
+            self.vectors = vectors.astype(np.float32)
+            self.nutrients = nutrients.astype(np.float32)
+            self.keys, self.names, self.categories = labels["keys"], labels["names"], labels["categories"]
+            self.size = len(self.keys)
+            self.rows_by_key = {key: row for row, key in enumerate(self.keys)}
+
+    # Function to pick up what other processes wrote since the last call:
+    # a new snapshot is reloaded, new log lines are applied
+    def refresh(self, path=INDEX_PATH):
+        snapshot_state = file_state(path)
+        log_state = file_state(path + ".log")
+        log_size = log_state[2] if log_state else 0
+        if snapshot_state == self.snapshot_state and log_size == self.log_offset:
+            return
+        with self._lock, file_lock(path, shared=True):
+            self._sync(path)
+
+    # Function to catch up with the files; called with the file lock held
+    def _sync(self, path):
+        if file_state(path) != self.snapshot_state:
+            self._read_snapshot(path)
+        self._read_log(path)
+
+    @classmethod
+    def load(cls, path=INDEX_PATH):
+        index = cls()
+        index.refresh(path)
+        return index
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+# Process-wide index, loaded from disk on first use
+def get_index(path=INDEX_PATH):
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = ProductIndex.load(path)
+                return _index
+    _index.refresh(path)
+    return _index
+
+
+# Function to add a newly inserted product to the index and persist it.
+# embed is an optional callable mapping text to an embedding vector.
+def index_product(product_info, embed=None, path=INDEX_PATH):
+    nutrients = product_info.get("nutrients") or normalise_nutrition(product_info.get("Nutritional information"))
+    if not nutrients or not product_info.get("product_key"):
+        return False
+    embedding = embed(product_text(product_info)) if embed else None
+    vector, values = product_vector(nutrients, embedding)
+    index = get_index(path)
+    try:
+        index.add(product_info["product_key"], product_info.get("Product Name"),
+                  product_info.get("Product Category"), vector, values)
+    except ValueError as e:
+        # An index built with a different embedding setting; rebuild it
+        logger.warning("Product not indexed: %s", e)
+        return False
+    index.append_log(product_info["product_key"], path)
+    return True
+
+
+# Function to recommend healthier products similar to the analysed one
+def recommend_alternatives(product_info, user_profile=None, k=5, embed=None, path=INDEX_PATH):
+    nutrients = product_info.get("nutrients") or normalise_nutrition(product_info.get("Nutritional information"))
+    if not nutrients:
+        return []
+    index = get_index(path)
+    if index.dimension is None:
+        return []
+    embedding = embed(product_text(product_info)) if embed and index.dimension > len(SCORE_COLUMNS) else None
+    vector, values = product_vector(nutrients, embedding)
+    if len(vector) != index.dimension:
+        return []
+    query_columns = {column: np.array([values[i]], dtype=np.float64) for i, column in enumerate(SCORE_COLUMNS)}
+    query = score_products(query_columns, user_profile)
+    if not query["coverage"][0]:
+        # Nothing to be healthier than
+        return []
+    query_score = float(query["score"][0])
+    return index.search(vector, product_info.get("Product Category"), user_profile, k,
+                        exclude_key=product_info.get("product_key"), query_score=query_score)
+
+
+# Function to rebuild the whole index from the product collection
+def build_index(product_collection, embed=None, path=INDEX_PATH):
+    index = ProductIndex()
+    projection = {"product_key": 1, "Product Name": 1, "Brand Name": 1, "Product Category": 1,
+                  "Ingredients": 1, "nutrients": 1}
+    for doc in product_collection.find({"nutrients": {"$exists": True}}, projection):
+        embedding = embed(product_text(doc)) if embed else None
+        vector, values = product_vector(doc["nutrients"], embedding)
+        index.add(doc.get("product_key"), doc.get("Product Name"), doc.get("Product Category"), vector, values)
+    index.save(path)
+    return index
+
+
+# python recommend.py --rebuild [--no-embeddings]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the product similarity index")
+    parser.add_argument("--rebuild", action="store_true")
+    parser.add_argument("--no-embeddings", action="store_true", help="index nutrient vectors only")
+    parser.add_argument("--path", default=INDEX_PATH)
+    args = parser.parse_args()
+
+    if args.rebuild:
+        from products import product_collection
+        embed = None
+        if not args.no_embeddings:
+            from models import embed_text
+            embed = embed_text
+        index = build_index(product_collection, embed, args.path)
+        print(f"Indexed {index.size} product(s) into {args.path}")
@@ -1,15 +1,13 @@
 import streamlit as st
-from pymongo import MongoClient
 import hashlib
-import os
 from dotenv import load_dotenv
+from database import get_database
 
 # Load environment variables
 load_dotenv()
 
 # Connect to MongoDB
-client = MongoClient(os.getenv("MONGODB_URI"))
-db = client.Health
+db = get_database()
 customer_collection = db.customer
 
 # Function to hash passwords
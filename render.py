@@ -0,0 +1,122 @@
+import functools
+import hashlib
+import os
+import re
+
+# "full" plays the background video, "lite" shows a still poster and turns
+# off animations, "auto" picks lite for clients that ask for less data
+RENDER_MODE = os.getenv("LABELWISE_RENDER_MODE", "auto")
+RENDER_MODES = ("full", "lite")
+BACKGROUND_VIDEO_URL = os.getenv(
+    "LABELWISE_BACKGROUND_VIDEO_URL",
+    "https://www.spinat.fr/wp-content/uploads/2020/11/green-color-powder-explosion-on-black-isolated-bac-A5B68UY.webmhd.mp4")
+STYLESHEET = "style.css"
+STATIC_DIR = "static"
+POSTER = "poster.webp"
+# Effective connection types (the ECT client hint) that get the lite page
+SLOW_CONNECTIONS = ("slow-2g", "2g", "3g")
+# Downlink client hint, in Mbit/s, below which the lite page is served
+LITE_DOWNLINK_MBPS = 1.5
+
+# Rules the app adds to style.css for the background
+BACKGROUND_CSS = """
+body, .reportview-container, .block-container {
+  background-color: transparent !important;
+}
+#myVideo {
+  position: fixed;
+  right: 0;
+  bottom: 0;
+  min-width: 100%;
+  min-height: 100%;
+  object-fit: cover;
+  z-index: -1;
+}
+.content {
+  position: fixed;
+  bottom: 0;
+  background: rgba(0, 0, 0, 0.5);
+  color: #000000;
+  width: 100%;
+  padding: 20px;
+}
+"""
+LITE_CSS = """
+*, *::before, *::after {
+  animation: none !important;
+  transition: none !important;
+}
+.animated-text, .animated-text span {
+  opacity: 1 !important;
+}
+"""
+
+
+# Function to pick the render mode for one visitor. An explicit ?render=
+# query parameter wins, then LABELWISE_RENDER_MODE, then the client hints.
+# Browsers send Save-Data on their own; ECT, Downlink and
+# Sec-CH-Prefers-Reduced-Motion only arrive once a proxy in front of the app
+# asks for them with Accept-CH.
+def choose_render_mode(headers, requested=None):
+    if requested in RENDER_MODES:
+        return requested
+    if RENDER_MODE in RENDER_MODES:
+        return RENDER_MODE
+    headers = {name.lower(): value.strip().lower() for name, value in (headers or {}).items()}
+    if headers.get("save-data") == "on":
+        return "lite"
+    if headers.get("ect") in SLOW_CONNECTIONS:
+        return "lite"
+    if headers.get("sec-ch-prefers-reduced-motion") == "reduce":
+        return "lite"
+    try:
+        if float(headers.get("downlink", "inf")) < LITE_DOWNLINK_MBPS:
+            return "lite"
+    except ValueError:
+        pass
+    return "full"
+
+
+# Function to strip comments and whitespace from a stylesheet
+def minify_css(css):
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css)
+    # A space before ":" can be a descendant combinator, so keep it
+    css = re.sub(r":\s+", ":", css)
+    return css.replace(";}", "}").strip()
+
+
+@functools.lru_cache(maxsize=None)
+def asset_version(name):
+    with open(os.path.join(STATIC_DIR, name), "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:10]
+
+
+# Function to build the URL of a file in static/. The ?v= content hash lets
+# the browser cache it for good: Streamlit's static handler sends a
+# far-future Cache-Control for versioned URLs, and a new file gets a new URL.
+def static_url(name):
+    return f"app/static/{name}?v={asset_version(name)}"
+
+
+# Function to build the style and background markup for a render mode, once
+# per process rather than on every rerun. static_serving says whether
+# Streamlit serves static/ (server.enableStaticServing); without it the
+# poster falls back to a plain colour.
+@functools.lru_cache(maxsize=None)
+def page_markup(mode, static_serving=True):
+    with open(STYLESHEET, "r") as f:
+        css = f.read() + BACKGROUND_CSS
+    poster = f"url('{static_url(POSTER)}') center / cover no-repeat fixed, " if static_serving else ""
+    poster_css = f".stApp {{ background: {poster}#080c08 !important; }}"
+    if mode == "lite":
+        return f"<style>{minify_css(css + poster_css + LITE_CSS)}</style>"
+    if not BACKGROUND_VIDEO_URL:
+        return f"<style>{minify_css(css + poster_css)}</style>"
+    # Visitors who ask for reduced motion get the poster instead of the video
+    css += f"@media (prefers-reduced-motion: reduce) {{ #myVideo {{ display: none; }} {poster_css} }}"
+    poster_attribute = f' poster="{static_url(POSTER)}"' if static_serving else ""
+    return (f"<style>{minify_css(css)}</style>"
+            f'<video autoplay muted loop playsinline preload="metadata" id="myVideo"{poster_attribute}>'
+            f'<source src="{BACKGROUND_VIDEO_URL}" type="video/mp4"></video>')
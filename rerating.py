@@ -0,0 +1,211 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from allergens import find_allergens
+from history import analysis_collection, profile_fingerprint, compress_text
+from jobs import JobQueue, QUEUED, RUNNING, get_job_queue
+from labelhash import label_hash_collection
+from llm_usage import usage_scope
+from products import product_collection
+from profiles import fetch_user_profile
+from scoring import score_product, extract_llm_rating
+
+# LLM re-analyses are spread out to stay within the provider's rate limit,
+# and capped per job; the rest are re-rated from the nutrient score
+RERATE_LLM_PER_MINUTE = float(os.getenv("RERATE_LLM_PER_MINUTE", "6"))
+RERATE_MAX_LLM_CALLS = int(os.getenv("RERATE_MAX_LLM_CALLS", "20"))
+# A nutrient score that moves by more than this makes the stored text misleading
+RERATE_TOLERANCE = 3
+PRODUCT_PROJECTION = {"_id": 0, "product_key": 1, "Ingredients": 1, "Allergen Information": 1,
+                      "Allergens": 1, "nutrients": 1}
+
+logger = logging.getLogger(__name__)
+
+
+# Spaces out calls so that at most per_minute start in any minute
+class RateLimiter:
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = max(0.0, self._next - now)
+            self._next = max(now, self._next) + self.interval
+        if delay:
+            time.sleep(delay)
+
+
+# Shared by every re-rating job in this process
+llm_limiter = RateLimiter(RERATE_LLM_PER_MINUTE)
+
+
+# Function to decide the new rating of one stored analysis without the LLM.
+# Returns (update, needs_llm).
+def rerate_deterministic(doc, product, user):
+    allergens = find_allergens(user.get("allergies"), product) if product else []
+    if any(not match["trace"] for match in allergens):
+        return {"rating": 0, "grade": None, "preview_rating": None, "allergens": allergens, "method": "allergen"}, False
+
+    # No scored nutrient on the label: only the LLM can re-rate it
+    preview = score_product((product or {}).get("nutrients") or {}, user)
+    if preview is None:
+        return {"allergens": allergens}, True
+    update = {"rating": preview["rating"], "grade": preview["grade"], "preview_rating": preview["rating"],
+              "allergens": allergens, "method": "score"}
+    old_rating, old_preview = doc.get("rating"), doc.get("preview_rating")
+    if old_rating == 0:
+        # The stored text is an allergen verdict that may no longer apply
+        return update, True
+    if old_rating is not None and old_preview is not None:
+        if abs(preview["rating"] - old_preview) > RERATE_TOLERANCE:
+            return update, True
+        # Move the LLM's rating by as much as the nutrient score moved
+        update["rating"] = min(10, max(1, old_rating + preview["rating"] - old_preview))
+    return update, False
+
+
+# Function to re-rate a user's stored analyses against their current profile.
+# Runs as a background job; job.progress reports how far it has got.
+def rerate_history(job, email):
+    user = fetch_user_profile(email)
+    if user is None:
+        return {"rerated": 0}
+    fingerprint = profile_fingerprint(user)
+    docs = list(analysis_collection.find(
+        {"email": email, "profile_fingerprint": {"$ne": fingerprint},
+         "rerated.profile_fingerprint": {"$ne": fingerprint}},
+        {"body": 0}
+    ))
+    job.progress(0, len(docs), "Checking your past analyses")
+    if not docs:
+        return {"rerated": 0}
+
+    keys = list({doc["product_key"] for doc in docs if doc.get("product_key")})
+    products = {product["product_key"]: product
+                for product in product_collection.find({"product_key": {"$in": keys}}, PRODUCT_PROJECTION)}
+    ocr_texts = {label["product_key"]: label["ocr_text"]
+                 for label in label_hash_collection.find({"product_key": {"$in": keys}},
+                                                        {"_id": 0, "product_key": 1, "ocr_text": 1})}
+
+    counts = {"allergen": 0, "score": 0, "llm_queued": 0, "unchanged": 0}
+    llm_calls = 0
+    for position, doc in enumerate(docs):
+        key = doc.get("product_key")
+        update, needs_llm = rerate_deterministic(doc, products.get(key), user)
+        now = datetime.now(timezone.utc)
+        changes = {}
+        if "method" in update:
+            # The stored text stays as written for the old profile; the new
+            # rating is kept alongside it
+            changes["rerated"] = {"profile_fingerprint": fingerprint, "method": update["method"], "at": now,
+                                  "rating": update["rating"], "grade": update["grade"],
+                                  "previous_rating": doc.get("rating"), "allergens": update["allergens"]}
+        if needs_llm and llm_calls < RERATE_MAX_LLM_CALLS and ocr_texts.get(key):
+            # Left for the LLM queue; the score above shows until it is done
+            llm_calls += 1
+            changes["rerate_pending"] = {"profile_fingerprint": fingerprint,
+                                         "preview_rating": update.get("preview_rating"),
+                                         "grade": update.get("grade"), "allergens": update["allergens"]}
+            counts["llm_queued"] += 1
+        elif "method" in update:
+            counts[update["method"]] += 1
+        else:
+            counts["unchanged"] += 1
+        if changes:
+            analysis_collection.update_one({"_id": doc["_id"]}, {"$set": changes})
+        job.progress(position + 1, message=f"Re-rated {position + 1} of {len(docs)} past analyses")
+
+    if llm_calls:
+        get_rerate_llm_queue().submit("rerate-llm", rerate_with_llm, email, key=f"rerate-llm:{email}")
+    return {"rerated": len(docs) - counts["unchanged"], **counts}
+
+
+# Function to re-analyse with the LLM the analyses rerate_history left
+# pending for the user's current profile. Runs on its own queue, so the
+# rate limiter's waits don't hold up other background work.
+def rerate_with_llm(job, email):
+    user = fetch_user_profile(email)
+    if user is None:
+        return {"llm": 0, "failed": 0}
+    fingerprint = profile_fingerprint(user)
+    # Analyses pending for an older profile are picked up by its next run
+    docs = list(analysis_collection.find(
+        {"email": email, "rerate_pending.profile_fingerprint": fingerprint},
+        {"_id": 1, "product_key": 1, "rating": 1, "rerate_pending": 1}
+    ))
+    job.progress(0, len(docs), "Re-analysing your past labels")
+    keys = list({doc["product_key"] for doc in docs})
+    ocr_texts = {label["product_key"]: label["ocr_text"]
+                 for label in label_hash_collection.find({"product_key": {"$in": keys}},
+                                                        {"_id": 0, "product_key": 1, "ocr_text": 1})}
+
+    from pipeline import analyze_label_text
+
+    counts = {"llm": 0, "failed": 0}
+    for position, doc in enumerate(docs):
+        pending = doc["rerate_pending"]
+        ocr_text = ocr_texts.get(doc["product_key"])
+        try:
+            if not ocr_text:
+                raise LookupError(f"no stored label text for {doc['product_key']}")
+            llm_limiter.wait()
+            with usage_scope(user=email, endpoint="rerating"):
+                analysis_result = analyze_label_text(ocr_text, user)
+        except Exception as e:
+            # The score from rerate_history stays in place
+            logger.warning("Could not re-analyse %s for %s: %s", doc["_id"], email, e)
+            analysis_collection.update_one({"_id": doc["_id"]}, {"$unset": {"rerate_pending": ""}})
+            counts["failed"] += 1
+        else:
+            analysis_collection.update_one({"_id": doc["_id"]}, {
+                "$set": {
+                    "body": compress_text(analysis_result),
+                    "rating": extract_llm_rating(analysis_result),
+                    "profile_fingerprint": fingerprint,
+                    "preview_rating": pending["preview_rating"],
+                    "grade": pending["grade"],
+                    "rerated": {"profile_fingerprint": fingerprint, "method": "llm",
+                                "at": datetime.now(timezone.utc), "previous_rating": doc.get("rating"),
+                                "allergens": pending["allergens"]},
+                },
+                "$unset": {"rerate_pending": ""},
+            })
+            counts["llm"] += 1
+        job.progress(position + 1, message=f"Re-analysed {position + 1} of {len(docs)} past labels")
+    return counts
+
+
+_llm_queue = None
+_llm_queue_lock = threading.Lock()
+
+
+# Process-wide queue for re-rating's LLM calls. One worker: the calls are
+# spaced out by llm_limiter anyway.
+def get_rerate_llm_queue():
+    global _llm_queue
+    if _llm_queue is None:
+        with _llm_queue_lock:
+            if _llm_queue is None:
+                _llm_queue = JobQueue(workers=1, name="rerating-llm")
+    return _llm_queue
+
+
+# Function to queue re-rating after a profile change. A job that has not
+# started yet picks up the latest profile, so repeated edits share it.
+def schedule_rerating(email):
+    return get_job_queue().submit("rerate", rerate_history, email, key=f"rerate:{email}")
+
+
+# Function to report the user's re-rating for the page, or None: the
+# nutrient pass while it runs, then the LLM pass that follows it
+def rerating_status(email):
+    job = get_job_queue().latest(f"rerate:{email}")
+    llm_job = get_rerate_llm_queue().latest(f"rerate-llm:{email}")
+    if llm_job is not None and (job is None or job.status not in (QUEUED, RUNNING)):
+        job = llm_job
+    return job.to_dict() if job else None
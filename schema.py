@@ -0,0 +1,150 @@
+import logging
+import os
+import sys
+import threading
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure, PyMongoError
+from nutrition import INDEXED_NUTRIENTS
+
+logger = logging.getLogger(__name__)
+
+# Stored analyses are removed by MongoDB's TTL monitor after this many days
+ANALYSIS_TTL_DAYS = int(os.getenv("ANALYSIS_TTL_DAYS", "180"))
+# Finished and abandoned job records are removed after this many hours
+JOB_TTL_HOURS = int(os.getenv("JOB_TTL_HOURS", "24"))
+# LLM usage records are kept this long for cost reports
+LLM_USAGE_TTL_DAYS = int(os.getenv("LLM_USAGE_TTL_DAYS", "400"))
+
+# Indexes each collection needs. create_index is a no-op when an index with
+# the same keys and options already exists, so running this repeatedly is safe.
+INDEXES = {
+    "customer": [
+        {"keys": [("email", ASCENDING)], "name": "email_unique", "unique": True},
+    ],
+    "product": [
+        # Partial so documents not yet backfilled (no product_key) don't collide
+        {"keys": [("product_key", ASCENDING)], "name": "product_key_unique", "unique": True,
+         "partialFilterExpression": {"product_key": {"$exists": True}}},
+    ] + [
+        # Range queries and sorting on the normalised per-100g/100ml values
+        {"keys": [(f"nutrients.{field}", ASCENDING)], "name": f"nutrients_{field}"}
+        for field in INDEXED_NUTRIENTS
+    ],
+    "label_hash": [
+        {"keys": [("phash", ASCENDING)], "name": "phash_unique", "unique": True},
+        # OCR text of a product's label, for re-analysis after a profile change
+        {"keys": [("product_key", ASCENDING)], "name": "product_key"},
+    ],
+    "analysis": [
+        # Per-user history, newest first, paged on (created_at, _id)
+        {"keys": [("email", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+         "name": "email_created_at"},
+        # Latest analysis of a product for an unchanged profile
+        {"keys": [("email", ASCENDING), ("product_key", ASCENDING), ("profile_fingerprint", ASCENDING),
+                  ("created_at", DESCENDING)], "name": "email_product_key"},
+        {"keys": [("created_at", ASCENDING)], "name": "created_at_ttl",
+         "expireAfterSeconds": ANALYSIS_TTL_DAYS * 24 * 3600},
+    ],
+    "job": [
+        {"keys": [("updated_at", ASCENDING)], "name": "updated_at_ttl",
+         "expireAfterSeconds": JOB_TTL_HOURS * 3600},
+        # Unfinished jobs marked failed on start-up
+        {"keys": [("kind", ASCENDING), ("status", ASCENDING)], "name": "kind_status"},
+    ],
+    "llm_usage": [
+        # Usage reports over a range of days, per day or per user
+        {"keys": [("day", ASCENDING), ("user", ASCENDING)], "name": "day_user"},
+        {"keys": [("created_at", ASCENDING)], "name": "created_at_ttl",
+         "expireAfterSeconds": LLM_USAGE_TTL_DAYS * 24 * 3600},
+    ],
+}
+
+# Queries the app runs on hot paths, with the index they are expected to use
+EXPECTED_PLANS = [
+    ("customer", {"email": "plan-check@example.com"}, "email_unique"),
+    ("product", {"product_key": "plan check|plan check"}, "product_key_unique"),
+    ("product", {"nutrients.sugar_g": {"$lte": 5}}, "nutrients_sugar_g"),
+    ("label_hash", {"phash": "0000000000000000"}, "phash_unique"),
+    ("analysis", {"email": "plan-check@example.com"}, "email_created_at"),
+    ("analysis", {"email": "plan-check@example.com", "product_key": "plan check|plan check",
+                  "profile_fingerprint": "0000000000000000"}, "email_product_key"),
+    ("llm_usage", {"day": {"$gte": "2000-01-01"}}, "day_user"),
+]
+
+_ensured = False
+_ensure_lock = threading.Lock()
+
+
+# Function to create all indexes once per process
+def ensure_indexes(db):
+    global _ensured
+    if _ensured:
+        return
+    with _ensure_lock:
+        if _ensured:
+            return
+        try:
+            apply_indexes(db)
+            _ensured = True
+        except PyMongoError as e:
+            # Leave _ensured unset so the next caller retries
+            logger.warning("Could not ensure MongoDB indexes: %s", e)
+
+
+def apply_indexes(db):
+    for collection_name, indexes in INDEXES.items():
+        collection = db[collection_name]
+        for spec in indexes:
+            options = {key: value for key, value in spec.items() if key != "keys"}
+            try:
+                collection.create_index(spec["keys"], **options)
+            except OperationFailure as e:
+                # Duplicate data or a conflicting index definition must be fixed
+                # by hand; don't take the app down over it.
+                logger.warning("Index %s on %s not created: %s", spec["name"], collection_name, e)
+
+
+# Function to collect every stage name in an explain() plan tree
+def plan_stages(plan):
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append((plan["stage"], plan.get("indexName")))
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(plan_stages(item))
+    return stages
+
+
+# Function to check that the hot-path queries are served by their index
+def verify_query_plans(db):
+    results = []
+    for collection_name, query, index_name in EXPECTED_PLANS:
+        explain = db[collection_name].find(query).limit(1).explain()
+        stages = plan_stages(explain["queryPlanner"]["winningPlan"])
+        uses_index = any(stage == "IXSCAN" and name == index_name for stage, name in stages)
+        collection_scan = any(stage == "COLLSCAN" for stage, _ in stages)
+        results.append({
+            "collection": collection_name,
+            "index": index_name,
+            "ok": uses_index and not collection_scan,
+            "stages": [stage for stage, _ in stages],
+        })
+    return results
+
+
+# Run against a local MongoDB: python schema.py
+if __name__ == "__main__":
+    from database import get_client, DATABASE_NAME
+
+    logging.basicConfig(level=logging.INFO)
+    database = get_client()[DATABASE_NAME]
+    apply_indexes(database)
+    failed = False
+    for result in verify_query_plans(database):
+        status = "ok" if result["ok"] else "FAIL"
+        print(f"[{status}] {result['collection']} via {result['index']}: {' -> '.join(result['stages'])}")
+        failed = failed or not result["ok"]
+    sys.exit(1 if failed else 0)
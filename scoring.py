@@ -0,0 +1,176 @@
+import re
+import numpy as np
+
+# Nutrient columns the scorer reads from the normalised "nutrients" field
+SCORE_COLUMNS = ["energy_kcal", "sugar_g", "saturated_fat_g", "sodium_mg", "fiber_g", "protein_g"]
+NEGATIVE_COLUMNS = ["energy_kcal", "sugar_g", "saturated_fat_g", "sodium_mg"]
+POSITIVE_COLUMNS = ["fiber_g", "protein_g"]
+
+# Nutri-Score (general foods) point thresholds, per 100g. A nutrient scores one
+# point for every threshold its value is above. Energy is in kcal (335kJ steps).
+THRESHOLDS = {
+    "energy_kcal": np.array([80, 160, 240, 320, 400, 480, 560, 640, 720, 800], dtype=np.float64),
+    "sugar_g": np.array([4.5, 9, 13.5, 18, 22.5, 27, 31, 36, 40, 45], dtype=np.float64),
+    "saturated_fat_g": np.arange(1, 11, dtype=np.float64),
+    "sodium_mg": np.arange(90, 901, 90, dtype=np.float64),
+    "fiber_g": np.array([0.9, 1.9, 2.8, 3.7, 4.7], dtype=np.float64),
+    "protein_g": np.array([1.6, 3.2, 4.8, 6.4, 8.0], dtype=np.float64),
+}
+# Above this many negative points protein no longer offsets the score
+PROTEIN_CAP = 11
+GRADES = np.array(["A", "B", "C", "D", "E"])
+GRADE_LIMITS = np.array([-1, 2, 10, 18])
+# Weighted scores are clipped to this range before mapping onto a 1-10 rating
+SCORE_RANGE = (-10.0, 30.0)
+
+# Profile keywords and the nutrient weights they apply
+GOAL_WEIGHTS = {
+    "Lose weight": {"energy_kcal": 1.5, "sugar_g": 1.3, "saturated_fat_g": 1.2},
+    "Gain muscle": {"protein_g": 1.5, "energy_kcal": 0.8},
+    "Maintain weight": {},
+    "Improve stamina": {"sugar_g": 1.2, "fiber_g": 1.2},
+    "General well-being": {},
+}
+CONDITION_WEIGHTS = [
+    (r"diabet|blood sugar|insulin", {"sugar_g": 2.0, "fiber_g": 1.3}),
+    (r"hypertens|blood pressure|kidney", {"sodium_mg": 2.0}),
+    (r"cholesterol|heart|cardio", {"saturated_fat_g": 1.8, "fiber_g": 1.2}),
+    (r"obes|overweight", {"energy_kcal": 1.5, "sugar_g": 1.3}),
+]
+PREFERENCE_WEIGHTS = {
+    "Keto": {"sugar_g": 2.0},
+    "Paleo": {"sugar_g": 1.3, "sodium_mg": 1.2},
+}
+ACTIVITY_WEIGHTS = {
+    "Low": {"energy_kcal": 1.2},
+    "Moderate": {},
+    "High": {"energy_kcal": 0.8, "protein_g": 1.2},
+}
+
+
+def _as_list(value):
+    if isinstance(value, str):
+        return [value] if value else []
+    return list(value or [])
+
+
+# Function to build per-nutrient weights from a user profile. Weights from
+# several goals or conditions multiply together.
+def profile_weights(user_profile):
+    weights = {column: 1.0 for column in SCORE_COLUMNS}
+
+    def apply(extra):
+        for column, weight in extra.items():
+            weights[column] *= weight
+
+    user_profile = user_profile or {}
+    for goal in _as_list(user_profile.get("health_goals")):
+        apply(GOAL_WEIGHTS.get(goal, {}))
+    for condition in _as_list(user_profile.get("health_conditions")):
+        for pattern, extra in CONDITION_WEIGHTS:
+            if re.search(pattern, condition.lower()):
+                apply(extra)
+    for preference in _as_list(user_profile.get("dietary_preferences")):
+        apply(PREFERENCE_WEIGHTS.get(preference, {}))
+    apply(ACTIVITY_WEIGHTS.get(user_profile.get("activity_level"), {}))
+    return weights
+
+
+# Function to turn a list of "nutrients" sub-documents into one float array
+# per column. Missing values become NaN.
+def nutrient_columns(nutrient_docs):
+    count = len(nutrient_docs)
+    columns = {}
+    for column in SCORE_COLUMNS:
+        values = np.full(count, np.nan)
+        for i, nutrients in enumerate(nutrient_docs):
+            value = (nutrients or {}).get(column)
+            if value is not None:
+                values[i] = value
+        columns[column] = values
+    return columns
+
+
+# Function to load the normalised nutrients of the catalog into NumPy arrays.
+# Returns (product keys, categories, columns).
+def load_catalog(product_collection, query=None):
+    query = dict(query or {})
+    query.setdefault("nutrients", {"$exists": True})
+    projection = {"_id": 0, "product_key": 1, "Product Category": 1,
+                  **{f"nutrients.{column}": 1 for column in SCORE_COLUMNS}}
+    keys, categories, nutrient_docs = [], [], []
+    for doc in product_collection.find(query, projection):
+        keys.append(doc.get("product_key"))
+        categories.append(doc.get("Product Category"))
+        nutrient_docs.append(doc.get("nutrients"))
+    return np.array(keys, dtype=object), np.array(categories, dtype=object), nutrient_columns(nutrient_docs)
+
+
+# Function to score every product against one profile in a single pass.
+# Returns a dict of arrays: weighted score (lower is better), rating 1-10,
+# grade A-E and coverage (share of scored nutrients present on the label).
+# A missing nutrient adds no points, so a product with coverage 0 gets a
+# meaningless score; callers skip those.
+def score_products(columns, user_profile=None):
+    weights = profile_weights(user_profile)
+    count = len(next(iter(columns.values())))
+    present = np.zeros(count)
+    points = {}
+    for column in SCORE_COLUMNS:
+        values = columns[column]
+        missing = np.isnan(values)
+        present += ~missing
+        points[column] = np.where(missing, 0, np.searchsorted(THRESHOLDS[column], values, side="left"))
+
+    negative = sum(points[column] for column in NEGATIVE_COLUMNS)
+    weighted_negative = sum(points[column] * weights[column] for column in NEGATIVE_COLUMNS)
+    protein = np.where(negative >= PROTEIN_CAP, 0, points["protein_g"] * weights["protein_g"])
+    weighted_positive = points["fiber_g"] * weights["fiber_g"] + protein
+    score = weighted_negative - weighted_positive
+
+    low, high = SCORE_RANGE
+    rating = np.rint(10 - 9 * (np.clip(score, low, high) - low) / (high - low)).astype(np.int64)
+    return {
+        "score": score,
+        "rating": rating,
+        "grade": GRADES[np.searchsorted(GRADE_LIMITS, score, side="left")],
+        "coverage": present / len(SCORE_COLUMNS),
+    }
+
+
+# Function to score a single product's "nutrients" sub-document. Returns
+# None when none of the scored nutrients are on the label.
+def score_product(nutrients, user_profile=None):
+    result = score_products(nutrient_columns([nutrients]), user_profile)
+    if not result["coverage"][0]:
+        return None
+    return {
+        "score": float(result["score"][0]),
+        "rating": int(result["rating"][0]),
+        "grade": str(result["grade"][0]),
+        "coverage": float(result["coverage"][0]),
+    }
+
+
+# Function to read the "x/10" rating out of the LLM analysis text
+def extract_llm_rating(analysis_text):
+    match = re.search(r"\b(10|\d)(?:\.\d+)?\s*/\s*10\b", analysis_text or "")
+    return int(match.group(1)) if match else None
+
+
+# Function to sanity-check the LLM rating against the deterministic score.
+# Returns None when there is nothing to compare. A 0/10 from the LLM is an
+# allergen verdict, which the nutrient score cannot see, so it is not flagged.
+def compare_with_llm(analysis_text, nutrients, user_profile=None, tolerance=3):
+    llm_rating = extract_llm_rating(analysis_text)
+    if llm_rating is None or not nutrients:
+        return None
+    preview = score_product(nutrients, user_profile)
+    if preview is None:
+        return None
+    return {
+        "llm_rating": llm_rating,
+        "preview_rating": preview["rating"],
+        "grade": preview["grade"],
+        "disagrees": llm_rating != 0 and abs(llm_rating - preview["rating"]) > tolerance,
+    }
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The app's modules live at the repository root and read their settings at
+# import; tests run against an in-memory MongoDB
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGODB_URI", "mongomock://localhost")
@@ -0,0 +1,34 @@
+import pytest
+from allergens import find_allergens
+
+
+def allergens_in(allergies, ingredients):
+    return [(match["allergen"], match["trace"]) for match in find_allergens(allergies, {"Ingredients": ingredients})]
+
+
+@pytest.mark.parametrize("ingredients", [
+    "Cocoa mass, sugar, cocoa butter",
+    "Shea butter, cacao butter, emulsifier (soy lecithin)",
+    "Coconut milk (70%), water, guar gum",
+    "Oat drink, almond milk, rice milk",
+    "Flour, cream of tartar, sodium bicarbonate",
+])
+def test_plant_based_butters_and_milks_are_not_dairy(ingredients):
+    assert allergens_in(["Milk"], ingredients) == []
+
+
+@pytest.mark.parametrize("ingredients", [
+    "Sugar, cocoa butter, whole milk powder",
+    "Wheat flour, butter (12%), salt",
+    "Buttermilk, sugar",
+])
+def test_dairy_is_still_found(ingredients):
+    assert allergens_in(["Milk"], ingredients) == [("milk", False)]
+
+
+def test_peanut_butter_is_peanut_but_not_milk():
+    assert allergens_in(["Peanuts", "Milk"], "Peanut butter (90%), salt") == [("peanut", False)]
+
+
+def test_may_contain_milk_is_a_trace():
+    assert allergens_in(["Milk"], "Cocoa butter, sugar. May contain milk.") == [("milk", True)]
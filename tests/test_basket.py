@@ -0,0 +1,37 @@
+import pytest
+from allergens import find_allergens, label_ingredients
+from basket import BASKET_PROMPT_TOKENS, analyse_basket, pack_items
+from pipeline import split_basket_reply
+
+
+class FakeJob:
+    def progress(self, done, total=None, message=None):
+        pass
+
+
+def test_empty_basket_is_an_empty_result():
+    result = analyse_basket(FakeJob(), "nobody@example.com", [])
+    assert result["items"] == [] and result["llm_calls"] == 0
+    assert result["summary"]["average_rating"] is None
+
+
+def test_pack_items_splits_by_prompt_budget():
+    texts = ["x" * 4000] * 5
+    assert pack_items(texts, prompt_tokens=BASKET_PROMPT_TOKENS) == [[0, 1, 2, 3, 4]]
+    assert all(len(batch) <= 2 for batch in pack_items(texts, prompt_tokens=2500))
+    assert pack_items([]) == []
+
+
+@pytest.mark.parametrize("reply", [
+    "### Item 1: Oat Biscuits\nRating: 7/10\n\n**Item 2 – Cola**\nRating: 2/10",
+    "Item 1\nRating: 7/10\nItem 2\nRating: 2/10",
+    "## ITEM 1 (Oat Biscuits)\nRating: 7/10\n\n### Item 2:\nRating: 2/10",
+])
+def test_basket_reply_headers(reply):
+    assert split_basket_reply(reply, 2) == ["Rating: 7/10", "Rating: 2/10"]
+
+
+def test_basket_allergens_skip_the_front_of_the_pack():
+    text = "Milk chocolate flavour rice cakes. Ingredients: rice, cocoa butter, flavouring."
+    assert find_allergens(["Milk"], label_ingredients(text)) == []
+    assert find_allergens(["Milk"], label_ingredients("Rice, skimmed milk powder")) != []
@@ -0,0 +1,72 @@
+import time
+from bson.errors import InvalidDocument
+import jobs
+from jobs import DONE, JobQueue, JobStore, bson_safe
+
+
+def wait_for(job, timeout=5):
+    deadline = time.time() + timeout
+    while not job.finished and time.time() < deadline:
+        time.sleep(0.01)
+    return job
+
+
+# Rejects documents holding a set, as BSON does
+class PickyCollection:
+    def __init__(self):
+        self.docs = {}
+
+    def replace_one(self, query, doc, upsert=False):
+        if any(isinstance(value, set) for value in (doc.get("result") or {}).values()):
+            raise InvalidDocument("cannot encode object: set()")
+        self.docs[query["_id"]] = doc
+
+
+def test_bson_safe_converts_sets_and_keys():
+    assert bson_safe({"tags": {"a"}, 1: ("x", None)}) == {"tags": ["a"], "1": ["x", None]}
+
+
+def test_result_bson_cannot_hold_is_stored_safely():
+    collection = PickyCollection()
+    queue = JobQueue(workers=1, name="test-store", store=JobStore(collection))
+    job = wait_for(queue.submit("test", lambda job: {"claims": {"low fat"}}))
+    assert collection.docs[job.id]["status"] == DONE
+    assert collection.docs[job.id]["result"] == {"claims": ["low fat"]}
+    # The worker is still serving the queue
+    assert wait_for(queue.submit("test", lambda job: 42)).result == 42
+
+
+def test_worker_survives_a_store_that_fails():
+    class BrokenStore:
+        def save(self, job):
+            if job.finished:
+                raise RuntimeError("store is down")
+
+    queue = JobQueue(workers=1, name="test-broken", store=BrokenStore())
+    wait_for(queue.submit("test", lambda job: 1))
+    assert wait_for(queue.submit("test", lambda job: 2)).result == 2
+
+
+def test_job_the_store_did_not_take_stays_readable():
+    class FailingStore(JobStore):
+        def __init__(self):
+            super().__init__(PickyCollection())
+
+        def save(self, job):
+            return not job.finished and super().save(job)
+
+    queue = JobQueue(workers=1, name="test-unsaved", store=FailingStore())
+    job = wait_for(queue.submit("test", lambda job: 3))
+    time.sleep(0.05)
+    assert queue.status(job.id)["result"] == 3
+
+
+def test_finished_jobs_are_pruned(monkeypatch):
+    monkeypatch.setattr(jobs, "FINISHED_JOB_SECONDS", 0)
+    queue = JobQueue(workers=1, name="test-prune")
+    first = wait_for(queue.submit("test", lambda job: 1, key="a"))
+    time.sleep(0.01)
+    wait_for(queue.submit("test", lambda job: 2, key="b"))
+    time.sleep(0.05)
+    assert queue.get(first.id) is None
+    assert queue.latest("a") is None
@@ -0,0 +1,12 @@
+from datetime import datetime
+from labelhash import find_similar_label, label_hash_collection, link_label, remember_label
+
+
+def test_label_of_another_product_is_not_reused():
+    phash = remember_label(0x0F0F0F0F0F0F0F0F, "Oat biscuits with chocolate")
+    assert find_similar_label(0x0F0F0F0F0F0F0F0E, product_name="Oat Biscuits Orange")["distance"] == 1
+    link_label(phash, "brand|oat biscuits chocolate")
+    assert find_similar_label(0x0F0F0F0F0F0F0F0E, product_name="Oat Biscuits Orange") is None
+    match = find_similar_label(0x0F0F0F0F0F0F0F0E, product_name="Oat Biscuits  Chocolate")
+    assert match["product_key"] == "brand|oat biscuits chocolate"
+    assert isinstance(label_hash_collection.find_one({"phash": phash})["updated_at"], datetime)
@@ -0,0 +1,44 @@
+import pytest
+import llm_usage
+from llm_usage import PromptBudgetError, fit_prompt, install_usage_handler, usage_collection, usage_scope
+
+
+def test_fit_prompt_trims_long_label_text(monkeypatch):
+    monkeypatch.setattr(llm_usage, "PROMPT_BUDGET_ACTION", "trim")
+    text = "sugar " * 10000
+    trimmed = fit_prompt(text, "fixed prompt", "analysis", budget=1000)
+    assert text.startswith(trimmed)
+    assert llm_usage.estimate_tokens(trimmed) + llm_usage.estimate_tokens("fixed prompt") \
+        + llm_usage.PROMPT_OVERHEAD_TOKENS <= 1000
+
+
+def test_fit_prompt_rejects_when_asked(monkeypatch):
+    monkeypatch.setattr(llm_usage, "PROMPT_BUDGET_ACTION", "reject")
+    with pytest.raises(PromptBudgetError):
+        fit_prompt("sugar " * 10000, "fixed prompt", "analysis", budget=1000)
+    assert fit_prompt("short", "fixed prompt", "analysis", budget=1000) == "short"
+
+
+def test_record_usage_is_attributed_to_the_scope():
+    with usage_scope(user="scope@example.com", endpoint="basket"), usage_scope(call="basket"):
+        llm_usage.record_usage("mistral-small-latest", 1000, 100, 0.5)
+    record = usage_collection().find_one({"user": "scope@example.com"})
+    assert (record["endpoint"], record["call"], record["prompt_tokens"]) == ("basket", "basket", 1000)
+    assert record["cost_usd"] == pytest.approx((1000 * 0.1 + 100 * 0.3) / 1_000_000)
+
+
+# Building an index makes LlamaIndex hand the LLM the global callback
+# manager; calls made after that must still be recorded
+def test_calls_after_an_index_build_are_recorded():
+    pytest.importorskip("llama_index.core")
+    from llama_index.core import Document, MockEmbedding, Settings, VectorStoreIndex
+    from llama_index.core.llms import MockLLM
+
+    Settings.embed_model = MockEmbedding(embed_dim=8)
+    Settings.llm = MockLLM(max_tokens=16)
+    install_usage_handler("mock")
+    index = VectorStoreIndex.from_documents([Document(text="Sugar 12g per 100g")])
+    with usage_scope(user="index@example.com", endpoint="analysis", call="analysis"):
+        index.as_query_engine().query("How much sugar is in this?")
+        Settings.llm.complete("One more call")
+    assert usage_collection().count_documents({"user": "index@example.com"}) >= 2
@@ -0,0 +1,46 @@
+import pytest
+from nutrition import canonical_nutrient, normalise_nutrition
+
+
+def test_unsaturated_fats_are_not_saturated_or_total_fat():
+    nutrients = normalise_nutrition({"per 100g": {
+        "Polyunsaturated Fat": "3g", "Monounsaturated Fat": "2g", "Total Fat": "10g", "Saturated Fat": "4g",
+    }})
+    assert nutrients["saturated_fat_g"] == 4.0
+    assert nutrients["fat_g"] == 10.0
+
+
+def test_nested_fat_breakdown():
+    nutrients = normalise_nutrition({"per 100g": {
+        "Fat": {"total": "12g", "of which saturates": "5g", "polyunsaturates": "1g"},
+    }})
+    assert (nutrients["fat_g"], nutrients["saturated_fat_g"]) == (12.0, 5.0)
+
+
+def test_canonical_nutrient_names():
+    assert canonical_nutrient("Sat. fat") == "saturated_fat_g"
+    assert canonical_nutrient("Saturates") == "saturated_fat_g"
+    assert canonical_nutrient("Polyunsaturated Fat") is None
+    assert canonical_nutrient("Monounsaturates") is None
+
+
+def test_per_serving_values_are_scaled_to_100g():
+    nutrients = normalise_nutrition({"per serving (30g)": {"Sugar": "3g", "Sodium": "60mg"}})
+    assert nutrients["sugar_g"] == 10.0
+    assert nutrients["sodium_mg"] == 200.0
+    assert nutrients["basis"] == "100g"
+
+
+@pytest.mark.parametrize("sodium, expected", [
+    ("1,000 mg", 1000.0),
+    ("1,250mg", 1250.0),
+    ("0,5 g", 500.0),
+    ("1,5 g", 1500.0),
+])
+def test_thousands_and_decimal_commas(sodium, expected):
+    assert normalise_nutrition({"per 100g": {"Sodium": sodium}})["sodium_mg"] == expected
+
+
+def test_thousands_comma_in_energy():
+    assert normalise_nutrition({"per 100g": {"Energy": "2,100 kJ / 502 kcal"}})["energy_kcal"] == 502.0
+    assert normalise_nutrition({"per 100g": {"Energy": "2,100 kJ"}})["energy_kcal"] == round(2100 / 4.184, 1)
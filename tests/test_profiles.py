@@ -0,0 +1,12 @@
+from profiles import customer_collection, fetch_user_profile, update_user_profile
+
+
+def test_other_sessions_see_a_profile_update():
+    customer_collection.insert_one({"email": "cache@example.com", "name": "Sam", "allergies": "none"})
+    editing, other = {}, {}
+    assert fetch_user_profile("cache@example.com", other)["allergies"] == "none"
+    assert fetch_user_profile("cache@example.com", editing)["allergies"] == "none"
+    update_user_profile("cache@example.com", {"allergies": "peanuts"}, editing)
+    assert fetch_user_profile("cache@example.com", editing)["allergies"] == "peanuts"
+    assert fetch_user_profile("cache@example.com", other)["allergies"] == "peanuts"
+    assert fetch_user_profile("cache@example.com")["allergies"] == "peanuts"
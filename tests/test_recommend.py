@@ -0,0 +1,32 @@
+import numpy as np
+import recommend
+from recommend import ProductIndex
+
+
+def add_product(index, key, path):
+    vector = np.ones(3, dtype=np.float32) / np.sqrt(3)
+    index.add(key, key.title(), "Snacks", vector, np.full(len(recommend.SCORE_COLUMNS), 5.0, dtype=np.float32))
+    index.append_log(key, path)
+
+
+def test_compaction_keeps_entries_from_another_process(tmp_path, monkeypatch):
+    monkeypatch.setattr(recommend, "COMPACT_AFTER", 3)
+    path = str(tmp_path / "products.npz")
+    first, second = ProductIndex.load(path), ProductIndex.load(path)
+    add_product(first, "oat bar", path)
+    add_product(second, "rice cake", path)
+    # The third entry compacts the log into the snapshot
+    add_product(second, "corn chips", path)
+    assert set(ProductIndex.load(path).keys) == {"oat bar", "rice cake", "corn chips"}
+    first.refresh(path)
+    assert set(first.keys) == {"oat bar", "rice cake", "corn chips"}
+
+
+def test_snapshot_loads_without_pickle(tmp_path):
+    path = str(tmp_path / "products.npz")
+    index = ProductIndex()
+    add_product(index, "oat bar", path)
+    index.save(path)
+    with np.load(path, allow_pickle=False) as data:
+        assert len(data["vectors"]) == 1
+    assert ProductIndex.load(path).names == ["Oat Bar"]
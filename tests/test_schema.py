@@ -0,0 +1,33 @@
+import os
+import uuid
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+from schema import apply_indexes, verify_query_plans
+
+# mongomock has no explain(), so the plans are checked against a real mongod:
+# MONGODB_TEST_URI=mongodb://localhost:27017 python -m pytest tests
+MONGODB_TEST_URI = os.getenv("MONGODB_TEST_URI")
+
+
+@pytest.fixture
+def real_database():
+    if not MONGODB_TEST_URI:
+        pytest.skip("MONGODB_TEST_URI is not set")
+    client = MongoClient(MONGODB_TEST_URI, serverSelectionTimeoutMS=2000)
+    try:
+        client.admin.command("ping")
+    except PyMongoError as e:
+        pytest.skip(f"No MongoDB at MONGODB_TEST_URI: {e}")
+    name = f"labelwise_plan_check_{uuid.uuid4().hex[:8]}"
+    try:
+        yield client[name]
+    finally:
+        client.drop_database(name)
+        client.close()
+
+
+def test_hot_queries_use_their_index(real_database):
+    apply_indexes(real_database)
+    failed = [result for result in verify_query_plans(real_database) if not result["ok"]]
+    assert failed == []
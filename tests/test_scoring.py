@@ -0,0 +1,55 @@
+import sys
+import types
+import rerating
+from history import analysis_collection, profile_fingerprint
+from labelhash import label_hash_collection
+from rerating import RateLimiter, rerate_deterministic, rerate_with_llm
+from scoring import compare_with_llm, score_product
+
+USER = {"allergies": [], "health_conditions": [], "health_goals": ["General well-being"]}
+
+
+def test_no_score_without_scored_nutrients():
+    assert score_product({}) is None
+    assert score_product({"carbohydrates_g": 60.0}) is None
+    assert compare_with_llm("Rating: 7/10", {"carbohydrates_g": 60.0}) is None
+
+
+def test_partial_label_is_scored_with_its_coverage():
+    preview = score_product({"sugar_g": 30.0, "carbohydrates_g": 60.0}, USER)
+    assert preview["coverage"] > 0
+    assert 1 <= preview["rating"] <= 10
+
+
+def test_rerating_falls_through_to_the_llm_without_a_score():
+    product = {"Ingredients": "Oats", "nutrients": {"carbohydrates_g": 60.0}}
+    update, needs_llm = rerate_deterministic({"rating": 7, "preview_rating": 6}, product, USER)
+    assert needs_llm
+    assert "method" not in update
+
+
+def test_llm_rerating_counts_failures_and_carries_on(monkeypatch):
+    def analyze_label_text(text, user):
+        if text == "broken":
+            raise RuntimeError("LLM unavailable")
+        return "Rating: 8/10"
+
+    monkeypatch.setitem(sys.modules, "pipeline", types.SimpleNamespace(analyze_label_text=analyze_label_text))
+    monkeypatch.setattr(rerating, "fetch_user_profile", lambda email: USER)
+    monkeypatch.setattr(rerating, "llm_limiter", RateLimiter(0))
+    pending = {"profile_fingerprint": profile_fingerprint(USER), "preview_rating": None, "grade": None,
+               "allergens": []}
+    for key in ("broken", "fine"):
+        label_hash_collection.insert_one({"phash": f"rerate-{key}", "product_key": f"rerate-{key}",
+                                        "ocr_text": key})
+        analysis_collection.insert_one({"email": "rerate@example.com", "product_key": f"rerate-{key}",
+                                        "rating": 3, "rerate_pending": pending})
+
+    class Job:
+        def progress(self, done, total=None, message=None):
+            pass
+
+    assert rerate_with_llm(Job(), "rerate@example.com") == {"llm": 1, "failed": 1}
+    fine = analysis_collection.find_one({"product_key": "rerate-fine"})
+    assert fine["rating"] == 8 and "rerate_pending" not in fine
+    assert "rerate_pending" not in analysis_collection.find_one({"product_key": "rerate-broken"})
@@ -0,0 +1,45 @@
+import hashlib
+import io
+import os
+import uuid
+from PIL import Image, ImageOps, features
+
+THUMBNAIL_DIR = os.getenv("LABELWISE_THUMBNAIL_DIR", os.path.join("temp", "thumbnails"))
+# Longest side of a preview, in pixels
+THUMBNAIL_SIZE = int(os.getenv("LABELWISE_THUMBNAIL_SIZE", "640"))
+THUMBNAIL_QUALITY = 70
+# WebP is about a third smaller than JPEG at the same quality; Pillow builds
+# without libwebp fall back to JPEG
+THUMBNAIL_FORMAT, THUMBNAIL_SUFFIX = ("WEBP", ".webp") if features.check("webp") else ("JPEG", ".jpg")
+
+
+# Function to return the path of a small preview of a label photo, given its
+# path or its bytes. Previews are named by the photo's content hash, so each
+# upload is downscaled once and every rerun after that sends the same few
+# tens of KB instead of the full photo; the original stays on the server
+# for OCR.
+def thumbnail_path(image):
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        data = bytes(image)
+    else:
+        with open(image, "rb") as f:
+            data = f.read()
+    path = os.path.join(THUMBNAIL_DIR, hashlib.sha256(data).hexdigest()[:32] + THUMBNAIL_SUFFIX)
+    if os.path.exists(path):
+        return path
+
+    with Image.open(io.BytesIO(data)) as photo:
+        # Lets JPEG decode at a fraction of full size
+        photo.draft("RGB", (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        # Phone photos are often stored sideways with an EXIF rotation
+        preview = ImageOps.exif_transpose(photo)
+        preview.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.LANCZOS)
+        if preview.mode not in ("RGB", "L"):
+            preview = preview.convert("RGB")
+        os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+        # Write to a temporary name first so a concurrent rerun never shows a
+        # half-written preview
+        partial = f"{path}.{uuid.uuid4().hex}.part"
+        preview.save(partial, THUMBNAIL_FORMAT, quality=THUMBNAIL_QUALITY)
+    os.replace(partial, path)
+    return path